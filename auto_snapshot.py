@@ -1,70 +1,52 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox
-from PIL import Image, ImageTk
+from tkinter import filedialog, messagebox, simpledialog
+from PIL import Image
 import numpy as np
 import os
-import re
-import random
-from typing import List, Tuple, Optional, Dict, Any
+import hashlib
+import time
+from typing import List, NamedTuple, Tuple, Optional
+
+from layer_file import BIN_EXT
+from layer_store import LayerStore, load_layer
+from background_task import Cancelled, TaskPanel
+from frame_writer import PngFrameWriter, read_manifest, write_manifest
+from frame_cache import frame_keys, remove_stale_frames, reusable_frames, write_keys
+from export_metrics import ExportMetrics, metrics_path, run_profiled
+from frame_archive import ARCHIVE_EXT, FrameArchiveWriter, KEYFRAME_INTERVAL
+from tiled_view import TiledImageView
+from layer_sprite import LayerSprite, blit_sprite, build_sprite
+from frame_plan import (CURVES, PlanSpec, archive_frame_cost, describe_plan, plan_frames,
+                        png_frame_cost, sample_frames, stream_frame_cost)
+from frame_stream import DEFAULT_FPS, StreamFrameWriter
+from paint_schedule import (DEFAULT_SEED, LayerSequence, PIXELS_PER_SNAPSHOT, build_schedule,
+                            layer_seed, layer_sequence, paint_frames, rgba_view)
 
 # ---------------------------
-# Helpers: đọc file .txt
+# UI: Layer
 # ---------------------------
 
-PointDef = Tuple[int, int, str]  # (row, col, "#RRGGBB")
-COLOR_LINE_RE = re.compile(r'^\s*(#[0-9A-Fa-f]{6})\s+(\d+)\s+(.*)$')
-COORD_RE = re.compile(r'\(\s*(\d+)\s*,\s*(\d+)\s*\)')
-
-def parse_points_txt(path: str) -> List[PointDef]:
-    """Trả về list điểm theo đúng thứ tự xuất hiện trong file."""
-    points: List[PointDef] = []
-    with open(path, "r", encoding="utf-8") as f:
-        lines = [ln.strip() for ln in f if ln.strip()]
-    if not lines:
-        return points
-    for line in lines[1:]:
-        m = COLOR_LINE_RE.match(line)
-        if not m:
-            continue
-        color_hex = m.group(1).upper()
-        coords = COORD_RE.findall(m.group(3))
-        for (r, c) in coords:
-            points.append((int(r), int(c), color_hex))
-    return points
-
-def parse_color_groups_txt(path: str) -> List[Tuple[str, List[Tuple[int,int]]]]:
-    """Trả về [(color_hex, [(row, col), ...]), ...] theo thứ tự dòng màu trong file."""
-    groups: List[Tuple[str, List[Tuple[int,int]]]] = []
-    with open(path, "r", encoding="utf-8") as f:
-        lines = [ln.strip() for ln in f if ln.strip()]
-    if not lines:
-        return groups
-    for line in lines[1:]:
-        m = COLOR_LINE_RE.match(line)
-        if not m:
-            continue
-        color_hex = m.group(1).upper()
-        coords = [(int(r), int(c)) for (r, c) in COORD_RE.findall(m.group(3))]
-        groups.append((color_hex, coords))
-    return groups
-
-def hex_to_rgba(color_hex: str) -> Tuple[int,int,int,int]:
-    color_hex = color_hex.lstrip('#')
-    return (int(color_hex[0:2], 16),
-            int(color_hex[2:4], 16),
-            int(color_hex[4:6], 16),
-            255)
+class LayerInput(NamedTuple):
+    """Ảnh chụp tham số của một layer, đọc ở thread chính để worker dùng."""
+    row: "LayerRow"
+    file_path: Optional[str]
+    store: Optional[LayerStore]
+    start: Optional[Tuple[int, int]]
+    ordered: bool
+    sprite: Optional[LayerSprite] = None  # sprite Preview đã dựng cho (store, ordered), nếu có
 
-# ---------------------------
-# UI: Layer
-# ---------------------------
+    @property
+    def valid(self) -> bool:
+        return bool(self.file_path) and self.store is not None \
+            and self.store.num_pixels > 0 and self.start is not None
 
 class LayerRow:
     """
     - Entry x,y (top-left)
     - Checkbox 'Theo thứ tự file' (✓: tuần tự; ✗: ngẫu nhiên trong mỗi màu, vẫn theo thứ tự màu)
     - Nút Load File + nhãn tên file
-    - Dữ liệu: raw_points + color_groups
+    - Dữ liệu: store (layer_store.LayerStore — các cột row/col/chỉ số màu, .apl
+      qua memmap), Preview và Export đọc thẳng từ đó
     """
     def __init__(self, parent: tk.Widget, idx: int):
         self.idx = idx
@@ -92,20 +74,38 @@ class LayerRow:
         self.file_label.grid(row=0, column=7, padx=6, sticky="w")
 
         self.file_path: Optional[str] = None
-        self.raw_points: Optional[List[PointDef]] = None
-        self.color_groups: Optional[List[Tuple[str, List[Tuple[int,int]]]]] = None
+        self.store: Optional[LayerStore] = None
+        self._sprite_key: Optional[Tuple[LayerStore, bool]] = None
+        self._sprite: Optional[LayerSprite] = None
+        self.load_seconds = 0.0  # thời gian đọc file lần gần nhất (báo cáo export)
+
+    def cached_sprite(self, store: Optional[LayerStore], ordered: bool) -> Optional[LayerSprite]:
+        """Sprite Preview đã dựng cho đúng (store, ordered); None nếu phải dựng lại."""
+        key = self._sprite_key
+        if store is None or key is None or key[0] is not store or key[1] != ordered:
+            return None
+        return self._sprite
+
+    def cache_sprite(self, store: LayerStore, ordered: bool, sprite: LayerSprite) -> None:
+        """Lưu sprite worker vừa dựng — chỉ gọi ở thread chính, khi store vẫn là của layer."""
+        if store is self.store:
+            self._sprite_key = (store, ordered)
+            self._sprite = sprite
 
     def load_file(self):
         path = filedialog.askopenfilename(
-            title="Chọn file TXT của layer",
-            filetypes=[("Text", "*.txt"), ("Tất cả", "*.*")]
+            title="Chọn file layer (.txt / .apl)",
+            filetypes=[("Layer", f"*.txt;*{BIN_EXT}"), ("Text", "*.txt"),
+                       ("Nhị phân", f"*{BIN_EXT}"), ("Tất cả", "*.*")]
         )
         if not path:
             return
         try:
-            self.raw_points = parse_points_txt(path)
-            self.color_groups = parse_color_groups_txt(path)
-            if not self.raw_points:
+            t0 = time.perf_counter()
+            self.store = load_layer(path)  # một lượt đọc, có cache
+            self.load_seconds = time.perf_counter() - t0
+            self._sprite_key = self._sprite = None
+            if self.store.num_pixels == 0:
                 messagebox.showwarning("Cảnh báo", "File không có dữ liệu điểm hợp lệ.")
             self.file_path = path
             self.file_label.config(text=os.path.basename(path))
@@ -118,6 +118,11 @@ class LayerRow:
         except ValueError:
             return None
 
+    def snapshot(self) -> LayerInput:
+        ordered = bool(self.ordered_var.get())
+        return LayerInput(self, self.file_path, self.store, self.get_start_xy(), ordered,
+                          self.cached_sprite(self.store, ordered))
+
 # ---------------------------
 # App chính
 # ---------------------------
@@ -129,7 +134,6 @@ class App(tk.Tk):
         self.geometry("1100x700")
 
         self.bg_img: Optional[Image.Image] = None
-        self.tkimg: Optional[ImageTk.PhotoImage] = None
         self.layers: List[LayerRow] = []
 
         # Toolbar
@@ -139,10 +143,32 @@ class App(tk.Tk):
         tk.Button(toolbar, text="Add Layer", command=self.add_layer).pack(side=tk.LEFT, padx=4)
         tk.Button(toolbar, text="Preview", command=self.preview_layers).pack(side=tk.LEFT, padx=4)
         tk.Button(toolbar, text="Export Snapshot", command=self.export_snapshots).pack(side=tk.LEFT, padx=4)
+        tk.Button(toolbar, text="Export Archive", command=self.export_archive).pack(side=tk.LEFT, padx=4)
+        tk.Button(toolbar, text="Export Stream", command=self.export_stream).pack(side=tk.LEFT, padx=4)
 
         self.info_var = tk.StringVar(value="Chưa có background.")
         tk.Label(toolbar, textvariable=self.info_var, anchor="w").pack(side=tk.LEFT, padx=12)
 
+        # Tác vụ nền: tiến độ + ETA + Hủy
+        self.tasks = TaskPanel(toolbar)
+        self.tasks.pack(side=tk.RIGHT, padx=4)
+
+        # Kế hoạch frame cho Export (để trống = 5 pixel mỗi snapshot, không giới hạn)
+        plan_bar = tk.Frame(self)
+        plan_bar.pack(side=tk.TOP, fill=tk.X, padx=8)
+        self.plan_frames_var = tk.StringVar(value="")
+        self.plan_curve_var = tk.StringVar(value="linear")
+        self.plan_mb_var = tk.StringVar(value="")
+        self.plan_minutes_var = tk.StringVar(value="")
+        tk.Label(plan_bar, text="Số frame:").pack(side=tk.LEFT)
+        tk.Entry(plan_bar, width=8, textvariable=self.plan_frames_var).pack(side=tk.LEFT, padx=(2, 10))
+        tk.Label(plan_bar, text="Nhịp vẽ:").pack(side=tk.LEFT)
+        tk.OptionMenu(plan_bar, self.plan_curve_var, *CURVES).pack(side=tk.LEFT, padx=(2, 10))
+        tk.Label(plan_bar, text="Tối đa MB:").pack(side=tk.LEFT)
+        tk.Entry(plan_bar, width=8, textvariable=self.plan_mb_var).pack(side=tk.LEFT, padx=(2, 10))
+        tk.Label(plan_bar, text="Tối đa phút:").pack(side=tk.LEFT)
+        tk.Entry(plan_bar, width=8, textvariable=self.plan_minutes_var).pack(side=tk.LEFT, padx=(2, 10))
+
         # Layers panel
         layers_box = tk.LabelFrame(self, text="Layers")
         layers_box.pack(side=tk.TOP, fill=tk.X, padx=8, pady=4)
@@ -154,12 +180,12 @@ class App(tk.Tk):
         viewer.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
         self.canvas = tk.Canvas(viewer, bg="#eaeaea")
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        yscroll = tk.Scrollbar(viewer, orient=tk.VERTICAL, command=self.canvas.yview)
+        self.view = TiledImageView(self.canvas)  # tile + zoom (Ctrl + con lăn)
+        yscroll = tk.Scrollbar(viewer, orient=tk.VERTICAL, command=self.view.yview)
         yscroll.pack(side=tk.RIGHT, fill=tk.Y)
-        xscroll = tk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.canvas.xview)
+        xscroll = tk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.view.xview)
         xscroll.pack(side=tk.BOTTOM, fill=tk.X)
         self.canvas.configure(yscrollcommand=yscroll.set, xscrollcommand=xscroll.set)
-        self.canvas_img_id = None
 
     # ---------- Actions ----------
 
@@ -185,83 +211,38 @@ class App(tk.Tk):
         self.layers.append(LayerRow(self.layers_container, len(self.layers)))
 
     def _show_image(self, img_rgba: Image.Image):
-        w, h = img_rgba.size
-        self.canvas.delete("all")
-        self.tkimg = ImageTk.PhotoImage(img_rgba)
-        self.canvas_img_id = self.canvas.create_image(0, 0, image=self.tkimg, anchor="nw")
-        self.canvas.config(scrollregion=(0, 0, w, h))
+        # Cùng kích thước với ảnh đang hiển thị (Preview) -> chỉ upload lại tile thay đổi
+        self.view.set_image(img_rgba)
 
     # ---------- Build sequences ----------
 
-    def build_abs_points_for_preview(self, lr: LayerRow, W: int, H: int) -> List[Tuple[int,int,Tuple[int,int,int,int]]]:
-        """Trả về list điểm tuyệt đối cho Preview theo chế độ checkbox."""
-        if not lr.file_path or not lr.raw_points:
-            return []
-        start = lr.get_start_xy()
-        if start is None:
-            return []
-        start_x, start_y = start
-
-        if lr.ordered_var.get():
-            # Theo đúng thứ tự điểm trong file
-            pts = lr.raw_points
-        else:
-            # Ngẫu nhiên trong từng màu, nhưng theo thứ tự các màu
-            if not lr.color_groups:
-                return []
-            pts = []
-            for color_hex, coords in lr.color_groups:
-                group = [(r, c, color_hex) for (r, c) in coords]
-                random.shuffle(group)
-                pts.extend(group)
-
-        abs_pts: List[Tuple[int,int,Tuple[int,int,int,int]]] = []
-        for (row, col, color_hex) in pts:
-            x = start_x + (col - 1)
-            y = start_y + (row - 1)
-            if 0 <= x < W and 0 <= y < H:
-                abs_pts.append((x, y, hex_to_rgba(color_hex)))
-        return abs_pts
-
-    def build_layer_state_for_export(self, lr: LayerRow, W: int, H: int) -> Dict[str, Any]:
+    def build_sprite_for_preview(self, inp: LayerInput) -> Optional[LayerSprite]:
+        """Sprite của layer cho Preview theo chế độ checkbox. Chạy ở worker: chỉ đọc
+        ảnh chụp inp (sprite đã cache hoặc dựng từ inp.store), không đụng LayerRow."""
+        if not inp.file_path or inp.store is None:
+            return None
+        if inp.sprite is not None:
+            return inp.sprite
+        return build_sprite(inp.store, inp.ordered)
+
+    def build_layer_state_for_export(self, inp: LayerInput, W: int, H: int,
+                                     seed: Optional[int] = None) -> Optional[LayerSequence]:
         """
-        Trả về state cho một layer khi Export:
-          - mode="ordered": dùng 'pts_abs' (list) + 'idx'
-          - mode="bycolor": dùng 'groups_abs' (list các nhóm theo thứ tự màu, mỗi nhóm đã shuffle) + 'ptr_color' + 'idxs'
+        Trả về dãy điểm tuyệt đối của một layer khi Export (xem paint_schedule.layer_sequence):
+          - ordered: theo thứ tự điểm trong file
+          - bycolor: theo thứ tự màu, mỗi màu đã xáo trộn (theo seed, lặp lại được)
+        None nếu layer không có điểm nào nằm trong ảnh.
         """
-        state: Dict[str, Any] = {"mode": "empty"}
-        if not lr.file_path or not lr.raw_points or lr.get_start_xy() is None:
-            return state
-        start_x, start_y = lr.get_start_xy()
-
-        if lr.ordered_var.get():
-            # Mode ordered: giữ nguyên thứ tự điểm
-            pts_abs: List[Tuple[int,int,Tuple[int,int,int,int]]] = []
-            for (row, col, color_hex) in lr.raw_points:
-                x = start_x + (col - 1)
-                y = start_y + (row - 1)
-                if 0 <= x < W and 0 <= y < H:
-                    pts_abs.append((x, y, hex_to_rgba(color_hex)))
-            if pts_abs:
-                state = {"mode": "ordered", "pts_abs": pts_abs, "idx": 0}
-        else:
-            # Mode bycolor: theo thứ tự màu, random trong từng màu
-            if not lr.color_groups:
-                return state
-            groups_abs: List[Tuple[str, List[Tuple[int,int]]]] = []
-            for color_hex, coords in lr.color_groups:
-                abs_coords = []
-                for (row, col) in coords:
-                    x = start_x + (col - 1)
-                    y = start_y + (row - 1)
-                    if 0 <= x < W and 0 <= y < H:
-                        abs_coords.append((x, y))
-                if abs_coords:
-                    random.shuffle(abs_coords)  # random trong màu
-                    groups_abs.append((color_hex, abs_coords))
-            if groups_abs:
-                state = {"mode": "bycolor", "groups_abs": groups_abs, "ptr_color": 0, "idxs": [0]*len(groups_abs)}
-        return state
+        if not inp.valid:
+            return None
+        start_x, start_y = inp.start
+        return layer_sequence(inp.store, start_x, start_y, inp.ordered, W, H, seed)
+
+    def _run_task(self, title, work, on_done, on_cancel=None) -> None:
+        def on_error(e):
+            messagebox.showerror("Lỗi", f"{title}:\n{e}")
+        if not self.tasks.run(title, work, on_done, on_error, on_cancel):
+            messagebox.showwarning("Chú ý", "Đang có tác vụ chạy, hãy chờ hoặc bấm Hủy.")
 
     # ---------- Preview ----------
 
@@ -271,145 +252,276 @@ class App(tk.Tk):
             return
 
         base = self.bg_img.copy()
-        arr = np.array(base, dtype=np.uint8)
-        H, W, _ = arr.shape
-
-        total_drawn = 0
-        for lr in self.layers:
-            pts_abs = self.build_abs_points_for_preview(lr, W, H)
-            for (x, y, rgba) in pts_abs:
-                r,g,b,a = rgba
-                arr[y, x, 0] = r
-                arr[y, x, 1] = g
-                arr[y, x, 2] = b
-                arr[y, x, 3] = a
-                total_drawn += 1
-
-        out_img = Image.fromarray(arr, mode="RGBA")
-        self._show_image(out_img)
-        self.info_var.set(f"Preview: đã vẽ {total_drawn} pixel từ {len(self.layers)} layer.")
+        inputs = [lr.snapshot() for lr in self.layers]
+
+        def work(ctx):
+            arr = np.array(base, dtype=np.uint8)
+            # Mỗi layer: blit sprite dựng sẵn (chỉ dựng lại khi đổi file/chế độ)
+            arr32 = rgba_view(arr)
+            total_drawn = 0
+            sprites = []
+            for i, inp in enumerate(inputs):
+                ctx.progress(i, len(inputs))
+                sprite = self.build_sprite_for_preview(inp)
+                sprites.append(sprite)
+                if sprite is None or inp.start is None:
+                    continue
+                total_drawn += blit_sprite(arr32, sprite, *inp.start)
+            return Image.fromarray(arr, mode="RGBA"), total_drawn, sprites
+
+        def done(res):
+            out_img, total_drawn, sprites = res
+            # Cache sprite ở thread chính; layer đã đổi file trong lúc chạy thì bỏ qua
+            for inp, sprite in zip(inputs, sprites):
+                if sprite is not None and inp.sprite is None:
+                    inp.row.cache_sprite(inp.store, inp.ordered, sprite)
+            self._show_image(out_img)
+            self.info_var.set(f"Preview: đã vẽ {total_drawn} pixel từ {len(inputs)} layer.")
+
+        self._run_task("Preview", work, done)
 
     # ---------- Export Snapshot ----------
 
+    def _plan_spec(self) -> Optional[PlanSpec]:
+        """Đọc ô kế hoạch frame; None (đã báo lỗi) nếu nhập sai."""
+        def number(var, cast, name):
+            text = var.get().strip()
+            if not text:
+                return None
+            value = cast(text)
+            if value <= 0:
+                raise ValueError(f"{name} phải lớn hơn 0")
+            return value
+        try:
+            frames = number(self.plan_frames_var, int, "Số frame")
+            mb = number(self.plan_mb_var, float, "Tối đa MB")
+            minutes = number(self.plan_minutes_var, float, "Tối đa phút")
+        except ValueError as e:
+            messagebox.showerror("Lỗi", f"Kế hoạch frame không hợp lệ:\n{e}")
+            return None
+        return PlanSpec(PIXELS_PER_SNAPSHOT, frames, self.plan_curve_var.get(),
+                        int(mb * 1024 * 1024) if mb is not None else None,
+                        minutes * 60 if minutes is not None else None)
+
+    def _export_signature(self, bg_arr: np.ndarray, inputs: List[LayerInput], spec: PlanSpec) -> dict:
+        """Tham số đầu vào của export, để nhận biết thư mục có thể tiếp tục hay không."""
+        layers = []
+        for inp in inputs:
+            if not inp.valid:
+                continue
+            st = os.stat(inp.file_path)
+            layers.append({"file": os.path.abspath(inp.file_path), "size": st.st_size,
+                           "mtime_ns": st.st_mtime_ns, "x": inp.start[0], "y": inp.start[1],
+                           "ordered": inp.ordered})
+        return {
+            "background": {"width": bg_arr.shape[1], "height": bg_arr.shape[0],
+                           "sha1": hashlib.sha1(memoryview(bg_arr)).hexdigest()},
+            "layers": layers,
+            "plan": spec._asdict(),
+        }
+
     def export_snapshots(self):
         if self.bg_img is None:
             messagebox.showwarning("Chú ý", "Hãy Load Background trước.")
             return
 
+        spec = self._plan_spec()
+        if spec is None:
+            return
         out_dir = filedialog.askdirectory(title="Chọn thư mục lưu snapshot")
         if not out_dir:
             return
 
-        acc_arr = np.array(self.bg_img.copy(), dtype=np.uint8)
-        H, W, _ = acc_arr.shape
+        bg_arr = np.array(self.bg_img, dtype=np.uint8)
+        inputs = [lr.snapshot() for lr in self.layers]
+        signature = self._export_signature(bg_arr, inputs, spec)
+
+        # Export lại vào thư mục cũ: giữ seed để thứ tự "bycolor" không đổi; các frame
+        # trùng khóa với lần trước được dùng lại (frame_cache), chỉ nén phần sau
+        manifest = read_manifest(out_dir) or {}
+        seed = int(manifest.get("seed", DEFAULT_SEED))
+        if not manifest.get("complete", True) and manifest.get("inputs") == signature:
+            # Export bị dừng với cùng tham số: giữ đúng số frame đã lập lần trước
+            # (ngân sách thời gian phụ thuộc máy đo) để các frame đã ghi vẫn trùng khóa
+            spec = spec._replace(frames=manifest["plan_frames"], max_bytes=None, max_seconds=None)
+
+        def finish(plan, frames_done: int, complete: bool) -> None:
+            write_manifest(out_dir, {"inputs": signature, "seed": seed, "complete": complete,
+                                     "plan_frames": plan.num_frames, "frames_done": frames_done})
+
+        # Nén PNG song song ở pool tiến trình; hàng đợi có giới hạn nên bộ nhớ bị chặn
+        workers = os.cpu_count() or 1
+        self._export("Export snapshot", bg_arr, inputs, spec,
+                     lambda arr, metrics: PngFrameWriter(out_dir, workers=workers, metrics=metrics),
+                     lambda samples: png_frame_cost(samples, workers),
+                     lambda n: f"Đã xuất {n} ảnh snapshot vào:\n{out_dir}",
+                     output=out_dir, frame_cache=out_dir, seed=seed, finish=finish,
+                     cancel_message=f"Đã dừng. Các snapshot đã ghi trong:\n{out_dir}\n"
+                                    f"vẫn hợp lệ; export lại vào thư mục này để tiếp tục.")
+
+    def export_archive(self):
+        if self.bg_img is None:
+            messagebox.showwarning("Chú ý", "Hãy Load Background trước.")
+            return
+        spec = self._plan_spec()
+        if spec is None:
+            return
 
-        # Chuẩn bị state theo layer
-        layer_states = [self.build_layer_state_for_export(lr, W, H) for lr in self.layers]
-        if not any((st.get("mode") in ("ordered", "bycolor")) for st in layer_states):
-            messagebox.showwarning("Chú ý", "Không có layer hợp lệ để xuất snapshot.")
+        path = filedialog.asksaveasfilename(
+            title="Lưu archive snapshot",
+            defaultextension=ARCHIVE_EXT,
+            filetypes=[("Snapshot archive", f"*{ARCHIVE_EXT}"), ("Tất cả", "*.*")],
+        )
+        if not path:
             return
 
-        def any_remaining() -> bool:
-            for st in layer_states:
-                mode = st.get("mode")
-                if mode == "ordered":
-                    if st["idx"] < len(st["pts_abs"]):
-                        return True
-                elif mode == "bycolor":
-                    groups_abs = st["groups_abs"]
-                    idxs = st["idxs"]
-                    for gi, (_, pts) in enumerate(groups_abs):
-                        if idxs[gi] < len(pts):
-                            return True
-            return False
-
-        def next_point_from_layer(st):
-            mode = st.get("mode")
-            if mode == "ordered":
-                idx = st["idx"]
-                pts_abs = st["pts_abs"]
-                if idx < len(pts_abs):
-                    st["idx"] += 1
-                    return pts_abs[idx]  # (x, y, rgba)
-                return None
-            elif mode == "bycolor":
-                groups_abs = st["groups_abs"]  # [(color_hex, [(x,y),...]), ...]
-                idxs = st["idxs"]
-                ptr = st["ptr_color"]
-                total_groups = len(groups_abs)
-                for _ in range(total_groups):
-                    color_hex, coords = groups_abs[ptr]
-                    i = idxs[ptr]
-                    if i < len(coords):
-                        x, y = coords[i]
-                        idxs[ptr] += 1
-                        # không đổi ptr nếu còn điểm trong nhóm
-                        from_hex = hex_to_rgba(color_hex)
-                        return (x, y, from_hex)
-                    else:
-                        ptr = (ptr + 1) % total_groups
-                        st["ptr_color"] = ptr
-                return None
-            return None
+        # Một file: background + keyframe định kỳ + delta từng frame
+        self._export("Export archive", np.array(self.bg_img, dtype=np.uint8),
+                     [lr.snapshot() for lr in self.layers], spec,
+                     lambda arr, metrics: FrameArchiveWriter(path, arr, metrics=metrics),
+                     lambda samples: archive_frame_cost(samples, KEYFRAME_INTERVAL),
+                     lambda n: f"Đã ghi {n} frame vào archive:\n{path}", output=path,
+                     cancel_message=f"Đã dừng. Archive chứa các frame đã vẽ:\n{path}")
+
+    def export_stream(self):
+        if self.bg_img is None:
+            messagebox.showwarning("Chú ý", "Hãy Load Background trước.")
+            return
+        spec = self._plan_spec()
+        if spec is None:
+            return
 
-        snap_id = 1
-        total_applied = 0
-
-        while any_remaining():
-            applied_this_image = 0
-
-            # Lấy điểm theo round-robin giữa các layer cho đến khi áp dụng được 5 pixel
-            # (bỏ qua các điểm không làm thay đổi ảnh)
-            while applied_this_image < 5 and any_remaining():
-                progressed = False   # có tiêu thụ ít nhất 1 điểm nào đó không?
-                for st in layer_states:
-                    if applied_this_image >= 5:
-                        break
-                    pt = next_point_from_layer(st)
-                    if pt is None:
-                        continue
-                    progressed = True  # đã tiêu thụ 1 điểm (dù có vẽ hay bỏ qua)
-                    x, y, rgba = pt
-                    # Nếu màu trùng với pixel hiện tại, bỏ qua (không tăng applied_this_image)
-                    if tuple(acc_arr[y, x]) == rgba:
-                        continue
-                    # Áp dụng điểm (ghi thật)
-                    r, g, b, a = rgba
-                    acc_arr[y, x, 0] = r
-                    acc_arr[y, x, 1] = g
-                    acc_arr[y, x, 2] = b
-                    acc_arr[y, x, 3] = a
-                    applied_this_image += 1
-                    total_applied += 1
-
-                if not progressed:
-                    # Không còn điểm nào để tiêu thụ
-                    break
-
-            if applied_this_image == 0:
-                # Không thể áp dụng thêm thay đổi nào nữa
-                break
-
-            # Lưu ảnh snapshot
-            img_to_save = Image.fromarray(acc_arr, mode="RGBA")
-            fname = f"snapshot_{snap_id:06d}.png"
-            out_path = os.path.join(out_dir, fname)
+        target = simpledialog.askstring(
+            "Export Stream",
+            "Stream y4m tới lệnh encoder (bắt đầu bằng |) hoặc file / named pipe:",
+            initialvalue="| ffmpeg -y -i - snapshots.mp4", parent=self)
+        if not target or not target.strip():
+            return
+        target = target.strip()
+
+        # Frame thô đi thẳng vào encoder khi vừa vẽ xong, không có file trung gian
+        w, h = self.bg_img.size
+        self._export("Export stream", np.array(self.bg_img, dtype=np.uint8),
+                     [lr.snapshot() for lr in self.layers], spec,
+                     lambda arr, metrics: StreamFrameWriter(target, w, h, "y4m", DEFAULT_FPS,
+                                                            metrics=metrics),
+                     lambda samples: stream_frame_cost(samples, "y4m"),
+                     lambda n: f"Đã stream {n} frame tới:\n{target}", output=target,
+                     cancel_message=f"Đã dừng. Stream tới {target} đã được đóng.")
+
+    def _export(self, title, bg_arr, inputs, spec, make_writer, estimate_cost, done_message,
+                output="", frame_cache=None, seed=DEFAULT_SEED, finish=None, cancel_message=""):
+        """Hai bước ở thread nền: lập lịch vẽ + kế hoạch frame và báo trước số
+        frame / dung lượng dự kiến; nếu đồng ý thì vẽ và gửi từng frame cho writer
+        (PngFrameWriter / FrameArchiveWriter / StreamFrameWriter).
+
+        frame_cache: thư mục snapshot PNG — các frame đầu trùng khóa nội dung với
+        lần export trước trong thư mục đó không nén lại (xem frame_cache).
+        finish(plan, số frame đã có, complete) được gọi khi xong hoặc bị hủy.
+
+        Thời gian từng giai đoạn được ghi vào ExportMetrics: hiện trên thanh thông
+        tin khi đang chạy và lưu thành báo cáo JSON cạnh đầu ra (export_metrics).
+        """
+        if not any(inp.valid for inp in inputs):
+            messagebox.showwarning("Chú ý", "Không có layer hợp lệ để xuất snapshot.")
+            return
+        metrics = ExportMetrics(output)
+        # Export dùng store đã đọc sẵn, không đọc file: ghi riêng thời gian Load File
+        # gần nhất của các layer (không phải một giai đoạn của export)
+        metrics.layer_load_s = sum(inp.row.load_seconds for inp in inputs if inp.valid)
+        report = metrics_path(output)
+
+        def plan_work(ctx):
+            H, W, _ = bg_arr.shape
+            # Chuẩn bị dãy điểm theo layer (mỗi layer một seed riêng suy từ seed)
+            layer_seqs = []
+            with metrics.stage("layer_sequence"):
+                for i, inp in enumerate(inputs):
+                    seq = self.build_layer_state_for_export(inp, W, H, layer_seed(seed, i))
+                    if seq is not None:
+                        layer_seqs.append(seq)
+            if not layer_seqs:
+                raise ValueError("Không có layer hợp lệ để xuất snapshot.")
+            # Tính trước toàn bộ lịch vẽ (round-robin giữa các layer, đã bỏ các điểm
+            # không làm thay đổi ảnh); mỗi snapshot là một lát cắt theo kế hoạch
+            with metrics.stage("schedule"):
+                sched = build_schedule(layer_seqs, bg_arr)
+            ctx.check()
+            with metrics.stage("plan"):
+                cost = estimate_cost(sample_frames(bg_arr, sched))
+                plan = plan_frames(sched.num_writes, spec, cost)
+            keys, start_frame = None, 0
+            if frame_cache is not None:
+                ctx.check()
+                with metrics.stage("frame_keys"):
+                    keys = frame_keys(bg_arr, sched, plan.bounds)
+                    start_frame = reusable_frames(frame_cache, keys)
+            return sched, plan, cost, keys, start_frame
+
+        def stored(plan, keys, frames_done: int, complete: bool) -> None:
+            if keys is not None:
+                write_keys(frame_cache, keys[:frames_done])
+                if complete:
+                    remove_stale_frames(frame_cache, plan.num_frames)
+            if finish is not None:
+                finish(plan, frames_done, complete)
+
+        def paint_work(ctx, sched, plan, keys, start_frame):
             try:
-                img_to_save.save(out_path)
-            except Exception as e:
-                messagebox.showerror("Lỗi", f"Không thể lưu {fname}:\n{e}")
+                writer = make_writer(bg_arr, metrics)
+                metrics.attach_writer(writer)
+                if keys is not None:
+                    # Các frame sau start_frame sắp bị ghi đè: bỏ khóa cũ của chúng trước
+                    write_keys(frame_cache, keys[:start_frame])
+                try:
+                    result = paint_frames(bg_arr, sched, writer, plan.bounds, start_frame,
+                                          ctx.progress, metrics)
+                except Cancelled:
+                    # Ghi nốt các frame đã gửi: trên đĩa là dãy frame liên tục, tiếp tục được
+                    with metrics.stage("close"):
+                        writer.close()
+                    stored(plan, keys, start_frame + writer.frames_written, False)
+                    raise
+                except BaseException:
+                    writer.close(cancel=True)
+                    raise
+                with metrics.stage("close"):
+                    writer.close()
+                stored(plan, keys, result.frames, True)
+                return result
+            finally:
+                metrics.finish()
+                if report is not None:
+                    metrics.save(report)
+
+        def watch():
+            # Cập nhật thanh thông tin từ metrics cho tới khi export kết thúc
+            self.info_var.set(metrics.summary())
+            if not metrics.finished:
+                self.after(500, watch)
+
+        def planned(res):
+            sched, plan, cost, keys, start_frame = res
+            text = describe_plan(plan, cost)
+            if start_frame >= plan.num_frames:
+                text += f"\n(cả {plan.num_frames} frame đã có sẵn, không cần nén lại)"
+            elif start_frame:
+                text += f"\n(dùng lại {start_frame} frame đã có, nén từ frame {start_frame + 1})"
+            if not messagebox.askyesno("Kế hoạch export", f"{text}\n\nBắt đầu export?"):
                 return
-            snap_id += 1
-
-        messagebox.showinfo(
-            "Hoàn tất",
-            f"Đã xuất {snap_id-1} ảnh snapshot vào:\n{out_dir}\n"
-            f"Tổng số pixel đã cập nhật: {total_applied}"
-        )
-
-# ---------------------------
-# Run
-# ---------------------------
-
-if __name__ == "__main__":
-    App().mainloop()
+            # AUTOPLACE_PROFILE=<file.prof> -> chạy vòng vẽ/nén dưới cProfile
+            self._run_task(title,
+                           lambda ctx: run_profiled(paint_work, ctx, sched, plan, keys, start_frame),
+                           done, on_cancel=lambda: messagebox.showinfo("Đã hủy", cancel_message))
+            watch()
+
+        def done(result):
+            messagebox.showinfo(
+                "Hoàn tất",
+                f"{done_message(result.frames)}\n"
+                f"Tổng số pixel đã cập nhật: {result.writes}\n"
+                f"{metrics.fps:.1f} frame/s, bỏ {metrics.noop} điểm no-op"
+                + (f"\nBáo cáo thời gian: {report}" if report else "")
+            )
+
+        self._run_task(f"{title}: lập kế hoạch", plan_work, planned)
@@ -0,0 +1,145 @@
+"""Chạy thao tác dài ở thread nền, báo tiến độ về Tk qua queue + after().
+
+Hàm worker nhận một TaskContext: gọi ctx.progress(done, total) để báo tiến
+độ; nếu người dùng bấm Hủy thì lần gọi kế tiếp ném Cancelled. Worker không
+được chạm vào widget Tk — kết quả trả về được giao cho callback ở thread
+chính.
+"""
+import queue
+import threading
+import time
+import tkinter as tk
+from tkinter import ttk
+from typing import Any, Callable, Optional
+
+POLL_MS = 50          # chu kỳ đọc queue ở thread chính
+PROGRESS_EVERY = 0.1  # giây giữa hai lần gửi tiến độ
+
+
+class Cancelled(Exception):
+    """Người dùng đã hủy thao tác."""
+
+
+class TaskContext:
+    def __init__(self):
+        self._cancel = threading.Event()
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._last_sent = 0.0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def check(self) -> None:
+        if self._cancel.is_set():
+            raise Cancelled()
+
+    def progress(self, done: int, total: int) -> None:
+        """Báo tiến độ (được giãn cách theo PROGRESS_EVERY); ném Cancelled nếu đã hủy."""
+        self.check()
+        now = time.monotonic()
+        if now - self._last_sent >= PROGRESS_EVERY or done >= total:
+            self._last_sent = now
+            self._queue.put(("progress", done, total))
+
+
+def format_eta(seconds: float) -> str:
+    seconds = int(round(seconds))
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h:d}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
+
+
+class TaskPanel(tk.Frame):
+    """Thanh tiến độ + nhãn ETA + nút Hủy; chạy một tác vụ nền mỗi lúc."""
+
+    def __init__(self, parent: tk.Widget):
+        super().__init__(parent)
+        self.bar = ttk.Progressbar(self, length=180, mode="determinate")
+        self.bar.pack(side=tk.LEFT, padx=4)
+        self.label_var = tk.StringVar(value="")
+        tk.Label(self, textvariable=self.label_var, anchor="w", width=32).pack(side=tk.LEFT, padx=4)
+        self.btn_cancel = tk.Button(self, text="Hủy", command=self.cancel, state=tk.DISABLED)
+        self.btn_cancel.pack(side=tk.LEFT, padx=4)
+        self._ctx: Optional[TaskContext] = None
+        self._title = ""
+        self._started = 0.0
+
+    @property
+    def busy(self) -> bool:
+        return self._ctx is not None
+
+    def cancel(self) -> None:
+        if self._ctx is not None:
+            self._ctx.cancel()
+            self.label_var.set(f"{self._title}: đang hủy…")
+
+    def run(self, title: str, work: Callable[[TaskContext], Any],
+            on_done: Optional[Callable[[Any], None]] = None,
+            on_error: Optional[Callable[[BaseException], None]] = None,
+            on_cancel: Optional[Callable[[], None]] = None) -> bool:
+        """Chạy work(ctx) ở thread nền. Trả về False nếu đang có tác vụ khác."""
+        if self._ctx is not None:
+            return False
+        ctx = TaskContext()
+        self._ctx = ctx
+        self._title = title
+        self._started = time.monotonic()
+        self.bar.configure(value=0, maximum=1)
+        self.label_var.set(f"{title}…")
+        self.btn_cancel.configure(state=tk.NORMAL)
+
+        def target():
+            try:
+                ctx._queue.put(("done", work(ctx)))
+            except Cancelled:
+                ctx._queue.put(("cancelled", None))
+            except BaseException as e:
+                ctx._queue.put(("error", e))
+
+        threading.Thread(target=target, name=f"task:{title}", daemon=True).start()
+        self.after(POLL_MS, self._poll, on_done, on_error, on_cancel)
+        return True
+
+    def _poll(self, on_done, on_error, on_cancel) -> None:
+        ctx = self._ctx
+        while True:
+            try:
+                msg = ctx._queue.get_nowait()
+            except queue.Empty:
+                self.after(POLL_MS, self._poll, on_done, on_error, on_cancel)
+                return
+            kind = msg[0]
+            if kind == "progress":
+                self._show_progress(msg[1], msg[2])
+                continue
+            # Kết thúc: trả panel về trạng thái rảnh rồi gọi callback
+            self._ctx = None
+            self.btn_cancel.configure(state=tk.DISABLED)
+            elapsed = format_eta(time.monotonic() - self._started)
+            if kind == "done":
+                self.bar.configure(value=self.bar.cget("maximum"))
+                self.label_var.set(f"{self._title}: xong ({elapsed})")
+                if on_done is not None:
+                    on_done(msg[1])
+            elif kind == "cancelled":
+                self.label_var.set(f"{self._title}: đã hủy")
+                if on_cancel is not None:
+                    on_cancel()
+            else:
+                self.label_var.set(f"{self._title}: lỗi")
+                if on_error is not None:
+                    on_error(msg[1])
+            return
+
+    def _show_progress(self, done: int, total: int) -> None:
+        total = max(total, 1)
+        self.bar.configure(value=done, maximum=total)
+        text = f"{self._title}: {done}/{total} ({100 * done // total}%)"
+        elapsed = time.monotonic() - self._started
+        if 0 < done < total:
+            text += f" – còn ~{format_eta(elapsed * (total - done) / done)}"
+        self.label_var.set(text)
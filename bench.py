@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""Benchmark các đường nóng của img2json / extract_image / auto_snapshot (không cần màn hình).
+
+Ảnh và layer tổng hợp được sinh lại từ seed cố định theo từng kịch bản
+(kích thước, số màu, tỉ lệ pixel trong suốt, số layer), nên kết quả lặp lại được.
+Mỗi bài đo lấy thời gian tốt nhất sau --repeat lần, thông lượng, và bộ nhớ
+đỉnh (tracemalloc, một lần chạy riêng).
+
+    python bench.py                               # các kịch bản mặc định
+    python bench.py --scenario small --repeat 5
+    python bench.py --save-baseline bench_baseline.json
+    python bench.py --compare bench_baseline.json [--tolerance 0.2]   # mã thoát 1 nếu chậm đi
+    python bench.py -o bench_output.txt
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, NamedTuple, Optional
+import numpy as np
+from PIL import Image
+
+import img2json
+from color_groups import group_colors
+from frame_plan import PlanSpec, plan_frames
+from frame_writer import PngFrameWriter
+from layer_file import load_groups_txt, save_groups_txt
+from layer_store import LayerStore
+from layer_sprite import blit_sprite, build_sprite
+from paint_schedule import (build_schedule, layer_seed, layer_sequence, paint_frames, rgba_view,
+                            uniform_bounds)
+
+SEED = 20240501
+ENCODE_FRAMES = 40   # số frame PNG cho bài đo nén (đủ ổn định, không quá lâu)
+
+
+class Scenario(NamedTuple):
+    name: str
+    width: int
+    height: int
+    colors: int
+    transparent: float  # tỉ lệ pixel alpha = 0
+    layers: int
+
+
+SCENARIOS = {
+    sc.name: sc for sc in (
+        Scenario("small", 256, 256, 16, 0.5, 2),
+        Scenario("medium", 1024, 1024, 256, 0.3, 4),
+        Scenario("many-colors", 1024, 1024, 65536, 0.1, 2),
+        Scenario("large", 2048, 2048, 1024, 0.5, 4),
+    )
+}
+DEFAULT_SCENARIOS = ("small", "medium", "many-colors")
+
+
+class Case(NamedTuple):
+    name: str
+    unit: str                  # đơn vị thông lượng
+    items: int                 # số đơn vị xử lý mỗi lần chạy
+    run: Callable[[], None]
+
+
+# ---------- Dữ liệu tổng hợp ----------
+
+def make_image(width: int, height: int, colors: int, transparent: float,
+               rng: np.random.Generator, block: int = 4) -> np.ndarray:
+    """Ảnh RGBA kiểu pixel-art: các khối block×block cùng màu lấy từ bảng `colors` màu."""
+    palette = rng.choice(1 << 24, size=colors, replace=False).astype(np.uint32)
+    gh, gw = -(-height // block), -(-width // block)
+    idx = rng.integers(0, colors, size=(gh, gw)).repeat(block, 0).repeat(block, 1)[:height, :width]
+    rgb = palette[idx]
+    arr = np.empty((height, width, 4), dtype=np.uint8)
+    arr[..., 0] = rgb >> 16
+    arr[..., 1] = rgb >> 8
+    arr[..., 2] = rgb
+    arr[..., 3] = np.where(rng.random((height, width)) < transparent, 0, 255)
+    return arr
+
+
+class Workload:
+    """Ảnh + file layer của một kịch bản, ghi trong thư mục tạm."""
+
+    def __init__(self, sc: Scenario, tmp: str):
+        rng = np.random.default_rng([SEED, sc.width, sc.height, sc.colors, sc.layers])
+        self.sc = sc
+        self.tmp = tmp
+        self.image = make_image(sc.width, sc.height, sc.colors, sc.transparent, rng)
+        self.image_path = os.path.join(tmp, "image.png")
+        Image.fromarray(self.image, mode="RGBA").save(self.image_path)
+        self.groups = group_colors(self.image)
+        self.background = make_image(sc.width, sc.height, 8, 0.0, rng, block=32)
+
+        # Mỗi layer là một ảnh 1/2 kích thước, đặt lệch nhau trên background
+        self.layer_paths: List[str] = []
+        self.layer_stores = []
+        self.layer_pos = []
+        for i in range(sc.layers):
+            arr = make_image(sc.width // 2, sc.height // 2, sc.colors, sc.transparent, rng)
+            g = group_colors(arr)
+            path = os.path.join(tmp, f"layer{i}.txt")
+            save_groups_txt(path, g)
+            self.layer_paths.append(path)
+            self.layer_stores.append(LayerStore(g))
+            self.layer_pos.append((i * sc.width // (2 * sc.layers), i * sc.height // (2 * sc.layers)))
+
+
+class NullWriter:
+    """Writer bỏ frame: chỉ đo vòng vẽ."""
+
+    def write(self, index, arr, delta=None) -> None:
+        pass
+
+    def close(self, cancel: bool = False) -> None:
+        pass
+
+
+def build_cases(w: Workload, encode_workers: int) -> List[Case]:
+    sc = w.sc
+    pixels = sc.width * sc.height
+    layer_points = sum(g.num_pixels for g in w.layer_stores)
+    txt_out = os.path.join(w.tmp, "export.txt")
+    png_dir = os.path.join(w.tmp, "frames")
+    os.makedirs(png_dir, exist_ok=True)
+
+    def sequences():
+        seqs = [layer_sequence(g, x, y, i % 2 == 0, sc.width, sc.height, layer_seed(SEED, i))
+                for i, (g, (x, y)) in enumerate(zip(w.layer_stores, w.layer_pos))]
+        return [s for s in seqs if s is not None]
+
+    seqs = sequences()
+    sched = build_schedule(seqs, w.background)
+
+    def preview():
+        arr = w.background.copy()
+        arr32 = rgba_view(arr)
+        for i, (g, (x, y)) in enumerate(zip(w.layer_stores, w.layer_pos)):
+            sprite = build_sprite(g, i % 2 == 0, layer_seed(SEED, i))
+            if sprite is not None:
+                blit_sprite(arr32, sprite, x, y)
+
+    def paint():
+        s = build_schedule(sequences(), w.background)
+        paint_frames(w.background, s, NullWriter(), uniform_bounds(s.num_writes))
+
+    def encode():
+        plan = plan_frames(sched.num_writes, PlanSpec(frames=ENCODE_FRAMES))
+        writer = PngFrameWriter(png_dir, workers=encode_workers)
+        try:
+            paint_frames(w.background, sched, writer, plan.bounds)
+        finally:
+            writer.close()
+
+    return [
+        Case("image_to_hex_grid", "px/s", pixels,
+             lambda: img2json.image_to_hex_grid(w.image_path)),
+        Case("compute_colors", "px/s", pixels, lambda: group_colors(w.image)),
+        Case("export_text", "điểm/s", w.groups.num_pixels, lambda: save_groups_txt(txt_out, w.groups)),
+        Case("load_groups_txt", "điểm/s", layer_points,
+             lambda: [load_groups_txt(p) for p in w.layer_paths]),
+        Case("preview_layers", "điểm/s", layer_points, preview),
+        Case("export_snapshots:paint", "ghi/s", sched.num_writes, paint),
+        Case("export_snapshots:encode", "frame/s", min(ENCODE_FRAMES, sched.num_writes), encode),
+    ]
+
+
+# ---------- Đo ----------
+
+def measure(case: Case, repeat: int) -> Dict[str, float]:
+    times = []
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        case.run()
+        times.append(time.perf_counter() - t0)
+    # Bộ nhớ đỉnh đo riêng: tracemalloc làm chậm nên không tính vào thời gian
+    tracemalloc.start()
+    try:
+        case.run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    best = min(times)
+    return {
+        "seconds": best,
+        "median_seconds": float(np.median(times)),
+        "throughput": case.items / best if best > 0 else float("inf"),
+        "unit": case.unit,
+        "items": case.items,
+        "peak_mb": peak / (1024 * 1024),
+    }
+
+
+def run_benchmarks(names: List[str], repeat: int, encode_workers: int,
+                   log: Callable[[str], None]) -> Dict[str, dict]:
+    results: Dict[str, dict] = {}
+    for name in names:
+        sc = SCENARIOS[name]
+        tmp = tempfile.mkdtemp(prefix=f"bench_{name}_")
+        try:
+            log(f"# {name}: {sc.width}×{sc.height}, {sc.colors} màu, "
+                f"{sc.transparent:.0%} trong suốt, {sc.layers} layer")
+            w = Workload(sc, tmp)
+            for case in build_cases(w, encode_workers):
+                r = measure(case, repeat)
+                results[f"{name}/{case.name}"] = r
+                log(format_row(f"{name}/{case.name}", r))
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+
+def format_row(key: str, r: dict, base: Optional[dict] = None, tolerance: float = 0.0) -> str:
+    row = (f"{key:<40} {r['seconds'] * 1000:>10.1f} ms  {r['throughput']:>14,.0f} {r['unit']:<7}"
+           f" {r['peak_mb']:>8.1f} MB")
+    if base is not None:
+        ratio = r["seconds"] / base["seconds"] if base["seconds"] > 0 else float("inf")
+        flag = "  CHẬM HƠN" if ratio > 1 + tolerance else ""
+        row += f"  {ratio:>5.2f}× baseline{flag}"
+    return row
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results: Dict[str, dict], baseline: dict, tolerance: float) -> List[str]:
+    """Các bài đo chậm hơn baseline quá tolerance (tỉ lệ thời gian tốt nhất)."""
+    slow = []
+    for key, r in results.items():
+        base = baseline["results"].get(key)
+        if base is not None and base["seconds"] > 0 and r["seconds"] / base["seconds"] > 1 + tolerance:
+            slow.append(key)
+    return slow
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark các đường nóng (không cần màn hình).")
+    ap.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                    help=f"Kịch bản cần chạy (lặp lại được; mặc định: {', '.join(DEFAULT_SCENARIOS)}).")
+    ap.add_argument("--all", action="store_true", help="Chạy mọi kịch bản, kể cả 'large'.")
+    ap.add_argument("--repeat", type=int, default=3, help="Số lần đo mỗi bài (lấy thời gian tốt nhất).")
+    ap.add_argument("--encode-workers", type=int, default=1,
+                    help="Số tiến trình nén PNG ở bài export_snapshots:encode.")
+    ap.add_argument("--save-baseline", metavar="FILE", help="Lưu kết quả làm baseline (JSON).")
+    ap.add_argument("--compare", metavar="FILE", help="So với baseline đã lưu.")
+    ap.add_argument("--tolerance", type=float, default=0.2,
+                    help="Chậm hơn baseline quá tỉ lệ này thì báo hồi quy (mặc định 0.2 = 20%%).")
+    ap.add_argument("-o", "--output", help="Ghi thêm báo cáo ra file (vd. bench_output.txt).")
+    args = ap.parse_args(argv)
+
+    names = sorted(SCENARIOS) if args.all else (args.scenario or list(DEFAULT_SCENARIOS))
+    lines: List[str] = []
+
+    def log(line: str) -> None:
+        print(line, flush=True)
+        lines.append(line)
+
+    env = environment()
+    log(f"# Python {env['python']}, NumPy {env['numpy']}, {env['platform']}, {env['cpus']} CPU")
+    results = run_benchmarks(names, args.repeat, args.encode_workers, log)
+
+    status = 0
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        log(f"# So với baseline {args.compare} (ngưỡng +{args.tolerance:.0%})")
+        for key, r in results.items():
+            base = baseline["results"].get(key)
+            if base is not None:
+                log(format_row(key, r, base, args.tolerance))
+        slow = compare(results, baseline, args.tolerance)
+        if slow:
+            log(f"# HỒI QUY: {len(slow)} bài đo chậm hơn baseline: {', '.join(slow)}")
+            status = 1
+        else:
+            log("# Không có hồi quy.")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"environment": env, "repeat": args.repeat,
+                       "scenarios": {n: SCENARIOS[n]._asdict() for n in names},
+                       "results": results}, f, ensure_ascii=False, indent=2)
+        log(f"# Đã lưu baseline: {args.save_baseline}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
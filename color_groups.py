@@ -0,0 +1,111 @@
+"""Gom nhóm pixel theo màu RGB bằng NumPy (không phụ thuộc GUI).
+
+Mỗi pixel RGB được gói thành một số nguyên 0xRRGGBB, sau đó sắp xếp ổn định
+theo màu để mỗi màu chiếm một đoạn liên tiếp trong mảng tọa độ.
+"""
+from typing import Callable, NamedTuple, Optional, Tuple
+import numpy as np
+
+
+class ColorGroups(NamedTuple):
+    """Kết quả gom nhóm. Nhóm i nằm ở rows/cols[offsets[i]:offsets[i+1]].
+
+    - colors : (K,) uint32, giá trị 0xRRGGBB. Từ group_colors thì tăng dần
+               (cùng thứ tự với mã hex); đọc từ file layer thì theo thứ tự dòng.
+    - counts : (K,) int64, số pixel của từng màu
+    - offsets: (K+1,) int64
+    - rows, cols: (N,) số nguyên, tọa độ 1-based. Nối các nhóm lại chính là
+               thứ tự điểm trong file.
+    - index  : (N,) chỉ số nhóm của từng điểm, hoặc None (tính khi cần)
+    """
+    colors: np.ndarray
+    counts: np.ndarray
+    offsets: np.ndarray
+    rows: np.ndarray
+    cols: np.ndarray
+    index: Optional[np.ndarray] = None
+
+    @property
+    def num_colors(self) -> int:
+        return int(self.colors.shape[0])
+
+    @property
+    def num_pixels(self) -> int:
+        return int(self.rows.shape[0])
+
+    def hex(self, i: int) -> str:
+        return f"#{int(self.colors[i]):06X}"
+
+    def group(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, cols) của màu thứ i — là view, không copy."""
+        a, b = self.offsets[i], self.offsets[i + 1]
+        return self.rows[a:b], self.cols[a:b]
+
+    def point_index(self) -> np.ndarray:
+        """Chỉ số nhóm của từng điểm theo thứ tự rows/cols."""
+        if self.index is not None:
+            return self.index
+        return np.repeat(np.arange(self.num_colors, dtype=np.uint32), self.counts)
+
+
+def pack_rgb(arr: np.ndarray) -> np.ndarray:
+    """(…, 3|4) uint8 -> (…) uint32 dạng 0xRRGGBB."""
+    return ((arr[..., 0].astype(np.uint32) << 16)
+            | (arr[..., 1].astype(np.uint32) << 8)
+            | arr[..., 2].astype(np.uint32))
+
+
+def rgb_to_rgba32(rgb: np.ndarray) -> np.ndarray:
+    """0xRRGGBB -> uint32 có bố cục byte R, G, B, 255 (giống mảng RGBA uint8)."""
+    rgb = np.asarray(rgb, dtype=np.uint32)
+    out = np.empty(rgb.shape + (4,), dtype=np.uint8)
+    out[..., 0] = rgb >> 16
+    out[..., 1] = rgb >> 8
+    out[..., 2] = rgb
+    out[..., 3] = 255
+    return out.view(np.uint32)[..., 0]
+
+
+def empty_groups() -> ColorGroups:
+    return ColorGroups(np.empty(0, np.uint32), np.empty(0, np.int64),
+                       np.zeros(1, np.int64), np.empty(0, np.int32), np.empty(0, np.int32))
+
+
+def groups_from_packed(packed: np.ndarray, rows: np.ndarray, cols: np.ndarray) -> ColorGroups:
+    """Gom nhóm từ màu đã gói + tọa độ 1-based.
+
+    Giả định (rows, cols) đã theo thứ tự (row, col); sắp xếp ổn định theo màu
+    giữ nguyên thứ tự đó bên trong mỗi nhóm.
+    """
+    if packed.size == 0:
+        return empty_groups()
+    order = np.argsort(packed, kind="stable")
+    packed_sorted = packed[order]
+    colors, starts, counts = np.unique(packed_sorted, return_index=True, return_counts=True)
+    offsets = np.empty(colors.shape[0] + 1, dtype=np.int64)
+    offsets[:-1] = starts
+    offsets[-1] = packed_sorted.shape[0]
+    return ColorGroups(colors.astype(np.uint32), counts.astype(np.int64), offsets,
+                       rows[order].astype(np.int32, copy=False),
+                       cols[order].astype(np.int32, copy=False))
+
+
+def group_colors(arr: np.ndarray,
+                 progress: Optional[Callable[[int, int], None]] = None) -> ColorGroups:
+    """Đọc mảng RGBA (H, W, 4), bỏ pixel alpha=0, gom nhóm theo màu RGB.
+
+    progress(done, 2): trước khi bắt đầu, sau khi chọn pixel, khi gom xong
+    (ném Cancelled từ progress là hủy được giữa các bước).
+    """
+    H, W, C = arr.shape
+    assert C == 4
+    if progress is not None:
+        progress(0, 2)
+    ys, xs = np.nonzero(arr[:, :, 3])  # thứ tự (row, col)
+    packed = pack_rgb(arr[ys, xs])
+    if progress is not None:
+        progress(1, 2)
+    groups = groups_from_packed(packed, ys.astype(np.int32) + 1, xs.astype(np.int32) + 1)
+    if progress is not None:
+        progress(2, 2)
+    return groups
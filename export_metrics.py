@@ -0,0 +1,177 @@
+"""Đo thời gian từng giai đoạn của Export Snapshot (không phụ thuộc Tk).
+
+ExportMetrics ghi cho mỗi giai đoạn: thời gian thực (wall), CPU của thread
+đang chạy và số lần gọi; kèm số frame, số byte đã ghi, số lần ghi pixel và
+số điểm no-op bị bỏ. Đọc được trong lúc export đang chạy (summary()) và lưu
+thành báo cáo JSON (save()).
+
+Giai đoạn do worker nén PNG báo về (encode:fromarray, encode:save) là tổng
+thời gian trên mọi tiến trình nén, nên có thể lớn hơn thời gian thực.
+layer_load_s là thời gian đọc file layer trước khi export (Load File ở GUI),
+không thuộc giai đoạn nào; export không nền (snapshot_batch) đọc file trong
+giai đoạn parse_layers.
+
+cProfile: đặt biến môi trường AUTOPLACE_PROFILE=<file.prof> (hoặc truyền
+path cho run_profiled) để chạy export dưới cProfile rồi xem bằng
+    python -m pstats <file.prof>
+"""
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+METRICS_NAME = "export_metrics.json"   # tên báo cáo trong thư mục snapshot
+METRICS_SUFFIX = ".metrics.json"       # báo cáo cạnh file archive / stream
+PROFILE_ENV = "AUTOPLACE_PROFILE"
+
+
+class StageStats:
+    __slots__ = ("wall", "cpu", "calls")
+
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.calls = 0
+
+
+class ExportMetrics:
+    def __init__(self, output: str = ""):
+        self.output = output
+        self.stages: Dict[str, StageStats] = {}
+        self.current = ""          # giai đoạn đang chạy (để hiển thị)
+        self.frames = 0
+        self.total_frames = 0
+        self.writes = 0            # số lần ghi pixel thật
+        self.noop = 0              # số điểm bỏ vì không đổi màu
+        self.points = 0            # tổng số điểm của các layer
+        self.layer_load_s = 0.0    # thời gian đọc file layer trước export (không tính vào stages)
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self._t_end: Optional[float] = None
+        self._paint_t0: Optional[float] = None
+        self._writer = None
+        self._lock = threading.Lock()
+
+    # ---------- Ghi nhận ----------
+
+    def add(self, name: str, wall: float, cpu: float = 0.0, calls: int = 1) -> None:
+        with self._lock:
+            st = self.stages.get(name)
+            if st is None:
+                st = self.stages[name] = StageStats()
+            st.wall += wall
+            st.cpu += cpu
+            st.calls += calls
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """with metrics.stage("schedule"): ... — cộng wall/CPU vào giai đoạn name."""
+        prev, self.current = self.current, name
+        t0, c0 = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0, time.thread_time() - c0)
+            self.current = prev
+
+    def attach_writer(self, writer) -> None:
+        """Đọc bytes_written của writer khi báo cáo."""
+        self._writer = writer
+
+    def start_frames(self, total: int) -> None:
+        self.total_frames = total
+        self._paint_t0 = time.perf_counter()
+
+    def finish(self) -> None:
+        self._t_end = time.perf_counter()
+        self.current = ""
+
+    @property
+    def finished(self) -> bool:
+        return self._t_end is not None
+
+    # ---------- Báo cáo ----------
+
+    @property
+    def bytes_written(self) -> int:
+        return int(getattr(self._writer, "bytes_written", 0)) if self._writer is not None else 0
+
+    def _now(self) -> float:
+        return self._t_end if self._t_end is not None else time.perf_counter()
+
+    @property
+    def wall(self) -> float:
+        return self._now() - self._t0
+
+    @property
+    def fps(self) -> float:
+        """Số frame mỗi giây kể từ khi bắt đầu vòng vẽ."""
+        if self._paint_t0 is None or self.frames == 0:
+            return 0.0
+        return self.frames / max(self._now() - self._paint_t0, 1e-9)
+
+    def summary(self) -> str:
+        """Một dòng cho thanh thông tin."""
+        parts = []
+        if self.current:
+            parts.append(self.current)
+        if self.total_frames:
+            parts.append(f"{self.frames}/{self.total_frames} frame")
+        parts.append(f"{self.fps:.1f} fps")
+        parts.append(f"{self.bytes_written / (1024 * 1024):.1f} MB")
+        if self.noop:
+            parts.append(f"bỏ {self.noop} no-op")
+        top = sorted(self.stages.items(), key=lambda kv: kv[1].wall, reverse=True)[:3]
+        if top:
+            parts.append(", ".join(f"{k} {v.wall:.1f}s" for k, v in top))
+        return " | ".join(parts)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {k: {"wall_s": round(v.wall, 6), "cpu_s": round(v.cpu, 6), "calls": v.calls}
+                      for k, v in self.stages.items()}
+        return {
+            "output": self.output,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "wall_s": round(self.wall, 6),
+            "frames": self.frames,
+            "frames_per_second": round(self.fps, 3),
+            "bytes_written": self.bytes_written,
+            "pixel_writes": self.writes,
+            "noop_skipped": self.noop,
+            "points": self.points,
+            "layer_load_s": round(self.layer_load_s, 6),
+            "stages": stages,
+        }
+
+    def save(self, path: str) -> None:
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+
+def metrics_path(output: str) -> Optional[str]:
+    """Nơi lưu báo cáo: trong thư mục snapshot, hoặc cạnh file archive / stream.
+    None nếu output là stdout hay lệnh encoder."""
+    if not output or output == "-" or output.startswith("|"):
+        return None
+    if os.path.isdir(output):
+        return os.path.join(output, METRICS_NAME)
+    return output + METRICS_SUFFIX
+
+
+def run_profiled(fn: Callable[..., Any], *args, path: Optional[str] = None, **kwargs) -> Any:
+    """Chạy fn; nếu có path (hoặc biến môi trường AUTOPLACE_PROFILE) thì chạy dưới
+    cProfile và ghi kết quả ra path kể cả khi fn ném ngoại lệ."""
+    path = path or os.environ.get(PROFILE_ENV)
+    if not path:
+        return fn(*args, **kwargs)
+    prof = cProfile.Profile()
+    try:
+        return prof.runcall(fn, *args, **kwargs)
+    finally:
+        prof.dump_stats(path)
@@ -1,8 +1,30 @@
+"""Phân tích màu ảnh: giao diện Tk, hoặc chế độ batch khi có đối số dòng lệnh.
+
+    python extract_image.py                                   (giao diện)
+    python extract_image.py sprites/ "more/**/*.png" -o layers/ [-j 8] [--format apl]
+        [--force] [--summary layers/batch_summary.csv] [--colors 64 --method kmeans]
+Batch: mỗi ảnh -> một file layer trong thư mục đầu ra (giữ thư mục con), chạy
+trên nhiều tiến trình; ảnh có file layer mới hơn thì bỏ qua (trừ khi --force).
+"""
+import argparse
+import sys
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from PIL import Image, ImageTk
+from PIL import Image
 import numpy as np
 import os
+from typing import Optional, Tuple
+
+from background_task import TaskPanel
+from color_groups import ColorGroups, group_colors
+from image_batch import (SUMMARY_NAME, expand_inputs, output_path, print_row, run_batch,
+                         summarize, write_summary)
+from layer_file import BIN_EXT, save_groups_bin, save_groups_txt
+from palette_quantize import DEFAULT_MAX_COLORS, QUANTIZE_METHODS, quantize_rgba
+from tiled_extract import StripSource, extract_tiled
+from tiled_view import TiledImageView
+
+TILED_MIN_PIXELS = 100_000_000  # ảnh lớn hơn: đề nghị tách màu theo dải, không nạp vào RAM
 
 class App(tk.Tk):
     def __init__(self):
@@ -13,8 +35,7 @@ class App(tk.Tk):
         # Trạng thái
         self.image_path = None
         self.image_rgba = None       # PIL Image (RGBA)
-        self.tkimg = None            # ImageTk.PhotoImage để hiển thị
-        self.color_map = {}          # dict[str -> list[(row, col)]], 1-based
+        self.color_groups: Optional[ColorGroups] = None  # nhóm màu, tọa độ (row, col) 1-based
 
         # Thanh công cụ
         toolbar = tk.Frame(self)
@@ -26,10 +47,32 @@ class App(tk.Tk):
         btn_export = tk.Button(toolbar, text="Xuất file…", command=self.export_text)
         btn_export.pack(side=tk.LEFT, padx=4)
 
+        # Giảm màu trước khi gom nhóm (ảnh chụp có rất nhiều màu gần giống nhau)
+        self.quantize_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(toolbar, text="Giảm màu", variable=self.quantize_var,
+                       command=self._quantize_changed).pack(side=tk.LEFT, padx=(8, 2))
+        tk.Label(toolbar, text="Tối đa:").pack(side=tk.LEFT)
+        self.max_colors_var = tk.StringVar(value=str(DEFAULT_MAX_COLORS))
+        ent_colors = tk.Entry(toolbar, textvariable=self.max_colors_var, width=6)
+        ent_colors.pack(side=tk.LEFT)
+        tk.Label(toolbar, text="Ngưỡng:").pack(side=tk.LEFT, padx=(4, 0))
+        self.threshold_var = tk.StringVar(value="0")
+        ent_threshold = tk.Entry(toolbar, textvariable=self.threshold_var, width=4)
+        ent_threshold.pack(side=tk.LEFT)
+        for ent in (ent_colors, ent_threshold):
+            ent.bind("<Return>", lambda e: self._quantize_changed())
+        self.method_var = tk.StringVar(value=QUANTIZE_METHODS[0])
+        tk.OptionMenu(toolbar, self.method_var, *QUANTIZE_METHODS,
+                      command=lambda _: self._quantize_changed()).pack(side=tk.LEFT, padx=2)
+
         self.info_var = tk.StringVar(value="Chưa tải ảnh.")
         lbl_info = tk.Label(toolbar, textvariable=self.info_var, anchor="w")
         lbl_info.pack(side=tk.LEFT, padx=12)
 
+        # Tiến độ + Hủy cho thao tác chạy nền (phân tích màu, xuất file)
+        self.tasks = TaskPanel(toolbar)
+        self.tasks.pack(side=tk.RIGHT, padx=4)
+
         # Khu vực hiển thị ảnh có thanh cuộn
         viewer = tk.Frame(self)
         viewer.pack(fill=tk.BOTH, expand=True)
@@ -37,17 +80,25 @@ class App(tk.Tk):
         self.canvas = tk.Canvas(viewer, bg="#f0f0f0")
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-        yscroll = tk.Scrollbar(viewer, orient=tk.VERTICAL, command=self.canvas.yview)
+        # Hiển thị theo tile + zoom (Ctrl + con lăn)
+        self.view = TiledImageView(self.canvas)
+
+        yscroll = tk.Scrollbar(viewer, orient=tk.VERTICAL, command=self.view.yview)
         yscroll.pack(side=tk.RIGHT, fill=tk.Y)
-        xscroll = tk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.canvas.xview)
+        xscroll = tk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.view.xview)
         xscroll.pack(side=tk.BOTTOM, fill=tk.X)
 
         self.canvas.configure(yscrollcommand=yscroll.set, xscrollcommand=xscroll.set)
 
-        # ID item ảnh trên canvas
-        self.canvas_image_id = None
+    def _busy(self) -> bool:
+        if self.tasks.busy:
+            messagebox.showwarning("Chú ý", "Đang có tác vụ chạy, hãy chờ hoặc bấm Hủy.")
+            return True
+        return False
 
     def open_image(self):
+        if self._busy():
+            return
         path = filedialog.askopenfilename(
             title="Chọn ảnh",
             filetypes=[
@@ -58,6 +109,19 @@ class App(tk.Tk):
         if not path:
             return
 
+        try:
+            with StripSource(path) as src:
+                W, H = src.width, src.height
+        except Exception as e:
+            messagebox.showerror("Lỗi", f"Không mở được ảnh:\n{e}")
+            return
+        if W * H >= TILED_MIN_PIXELS and messagebox.askyesno(
+                "Ảnh rất lớn",
+                f"Ảnh {W}×{H} ({W * H / 1e6:.0f} MP) có thể không vừa bộ nhớ.\n"
+                "Tách màu theo dải và xuất thẳng ra file (không hiển thị ảnh)?"):
+            self.export_tiled(path)
+            return
+
         try:
             img = Image.open(path).convert("RGBA")  # đảm bảo có alpha
         except Exception as e:
@@ -70,55 +134,87 @@ class App(tk.Tk):
         self.compute_colors()
 
     def display_image_on_canvas(self, img_rgba: Image.Image):
-        # Hiển thị ảnh thật kích thước gốc, có thanh cuộn
-        w, h = img_rgba.size
-        self.canvas.delete("all")
-        self.tkimg = ImageTk.PhotoImage(img_rgba)
-        self.canvas_image_id = self.canvas.create_image(0, 0, image=self.tkimg, anchor="nw")
-        self.canvas.config(scrollregion=(0, 0, w, h))
+        # Hiển thị ảnh có thanh cuộn; chỉ dựng các tile đang nhìn thấy
+        self.view.set_image(img_rgba)
+
+    def _quantize_options(self):
+        """(max_colors, threshold, method) nếu bật Giảm màu, None nếu tắt. Ném ValueError nếu nhập sai."""
+        if not self.quantize_var.get():
+            return None
+        try:
+            max_colors = int(self.max_colors_var.get())
+            threshold = float(self.threshold_var.get() or 0)
+        except ValueError:
+            raise ValueError("Số màu tối đa phải là số nguyên, ngưỡng phải là số.")
+        if max_colors < 1 or threshold < 0:
+            raise ValueError("Số màu tối đa phải >= 1, ngưỡng phải >= 0.")
+        return max_colors, threshold, self.method_var.get()
+
+    def _quantize_changed(self):
+        # Đổi tùy chọn giảm màu -> phân tích lại ảnh hiện tại
+        if self.image_rgba is None or self._busy():
+            return
+        self.compute_colors()
 
     def compute_colors(self):
-        """Đọc ảnh RGBA, bỏ pixel alpha=0, gom nhóm theo màu RGB.
-        Lưu vào self.color_map: { '#RRGGBB': [(row, col), ...] } với row/col 1-based."""
+        """Đọc ảnh RGBA, bỏ pixel alpha=0, (tùy chọn) giảm màu, gom nhóm theo màu RGB.
+        Lưu vào self.color_groups (xem color_groups.ColorGroups) với row/col 1-based.
+        Chạy ở thread nền; self.color_groups là None cho tới khi xong."""
+        self.color_groups = None
         if self.image_rgba is None:
-            self.color_map = {}
             self.info_var.set("Chưa tải ảnh.")
             return
+        try:
+            quantize = self._quantize_options()
+        except ValueError as e:
+            messagebox.showerror("Lỗi", str(e))
+            return
 
         arr = np.array(self.image_rgba, dtype=np.uint8)  # (H, W, 4)
         H, W, C = arr.shape
         assert C == 4
+        image_path = self.image_path
+        colors_before = []
 
-        alpha = arr[:, :, 3]
-        ys, xs = np.where(alpha != 0)  # chỉ lấy pixel alpha != 0
-
-        # Lấy RGB tương ứng
-        rgbs = arr[ys, xs, :3]  # (N, 3)
-
-        color_map = {}
-        # Duyệt từng điểm (tối ưu vừa đủ, dễ đọc; có thể mất vài giây với ảnh rất lớn)
-        for i in range(len(ys)):
-            r, g, b = rgbs[i]
-            color_hex = f"#{r:02X}{g:02X}{b:02X}"
-            # Lưu tọa độ 1-based theo (row, col) = (y+1, x+1)
-            rc = (int(ys[i]) + 1, int(xs[i]) + 1)
-            if color_hex not in color_map:
-                color_map[color_hex] = []
-            color_map[color_hex].append(rc)
-
-        self.color_map = color_map
-
-        # Cập nhật thông tin
-        unique_colors = len(color_map)
-        kept_pixels = len(ys)
-        total_pixels = H * W
-        base = os.path.basename(self.image_path) if self.image_path else "—"
-        self.info_var.set(
-            f"Ảnh: {base} | Kích thước: {W}×{H} | Pixel giữ lại: {kept_pixels}/{total_pixels} | Số màu: {unique_colors}"
-        )
+        def work(ctx):
+            # Tiến độ theo bước: [giảm màu] -> gom màu (2 bước); mỗi lần báo là một điểm hủy
+            steps = 3 if quantize is not None else 2
+            src = arr
+            if quantize is not None:
+                ctx.progress(0, steps)
+                res = quantize_rgba(arr, *quantize)
+                colors_before.append(res.colors_before)
+                src = res.rgba
+            base = steps - 2
+            return group_colors(src, progress=lambda done, total: ctx.progress(base + done, steps))
+
+        def done(groups: ColorGroups):
+            if image_path != self.image_path:
+                return  # đã mở ảnh khác trong lúc chờ
+            self.color_groups = groups
+
+            # Cập nhật thông tin
+            unique_colors = groups.num_colors
+            kept_pixels = groups.num_pixels
+            total_pixels = H * W
+            base = os.path.basename(image_path) if image_path else "—"
+            colors = f"{unique_colors} (từ {colors_before[0]})" if colors_before else f"{unique_colors}"
+            self.info_var.set(
+                f"Ảnh: {base} | Kích thước: {W}×{H} | Pixel giữ lại: {kept_pixels}/{total_pixels} | Số màu: {colors}"
+            )
+
+        def cancelled():
+            self.info_var.set("Đã hủy phân tích màu.")
+
+        self.info_var.set("Đang phân tích màu…")
+        self.tasks.run("Phân tích màu", work, done,
+                       lambda e: messagebox.showerror("Lỗi", f"Không phân tích được ảnh:\n{e}"),
+                       cancelled)
 
     def export_text(self):
-        if not self.color_map:
+        if self._busy():
+            return
+        if self.color_groups is None or self.color_groups.num_colors == 0:
             messagebox.showwarning("Chú ý", "Chưa có dữ liệu màu để xuất. Hãy mở ảnh trước.")
             return
 
@@ -130,22 +226,108 @@ class App(tk.Tk):
         if not path:
             return
 
-        try:
-            # Sắp xếp màu theo mã hex tăng dần cho ổn định (có thể đổi sang sắp xếp theo số lượng nếu bạn thích)
-            colors_sorted = sorted(self.color_map.items(), key=lambda kv: kv[0])
-
-            with open(path, "w", encoding="utf-8") as f:
-                f.write(str(len(colors_sorted)) + "\n")
-                for color_hex, coords in colors_sorted:
-                    # Có thể sắp xếp lại tọa độ theo (row, col) để dễ đọc:
-                    coords_sorted = sorted(coords)
-                    coords_str = " ".join(f"({r},{c})" for r, c in coords_sorted)
-                    line = f"{color_hex} {len(coords_sorted)} {coords_str}\n"
-                    f.write(line)
+        groups = self.color_groups
+        # Màu đã theo mã hex tăng dần, tọa độ trong mỗi màu đã theo (row, col);
+        # ghi từng đoạn trực tiếp từ mảng tọa độ. Hủy giữa chừng không để lại file dở.
+        self.tasks.run(
+            "Xuất file",
+            lambda ctx: save_groups_txt(path, groups, progress=ctx.progress),
+            lambda _: messagebox.showinfo("Thành công", f"Đã xuất file:\n{path}"),
+            lambda e: messagebox.showerror("Lỗi", f"Không thể ghi file:\n{e}"),
+        )
+
+    def export_tiled(self, src: str):
+        """Tách màu ảnh rất lớn theo dải (tiled_extract), ghi thẳng ra file layer."""
+        path = filedialog.asksaveasfilename(
+            title="Lưu file kết quả",
+            defaultextension=".txt",
+            filetypes=[("Text", "*.txt"), ("Tất cả", "*.*")],
+        )
+        if not path:
+            return
 
+        def done(result):
+            k, n = result
+            self.info_var.set(f"Ảnh: {os.path.basename(src)} | Tách theo dải | Pixel giữ lại: {n} | Số màu: {k}")
             messagebox.showinfo("Thành công", f"Đã xuất file:\n{path}")
-        except Exception as e:
-            messagebox.showerror("Lỗi", f"Không thể ghi file:\n{e}")
+
+        self.info_var.set("Đang tách màu theo dải…")
+        self.tasks.run(
+            "Tách màu theo dải",
+            lambda ctx: extract_tiled(src, path, progress=ctx.progress),
+            done,
+            lambda e: messagebox.showerror("Lỗi", f"Không tách được ảnh:\n{e}"),
+            lambda: self.info_var.set("Đã hủy tách màu."),
+        )
+
+def extract_file(src: str, dst: str, quantize: Optional[Tuple[int, float, str]] = None) -> Tuple[int, int]:
+    """Worker batch: ảnh src -> file layer dst (.txt hoặc BIN_EXT) -> (số pixel giữ lại, số màu).
+
+    quantize = (max_colors, threshold, method) như ô "Giảm màu" của giao diện.
+    Ảnh từ TILED_MIN_PIXELS trở lên (và không giảm màu) được tách theo dải.
+    """
+    if quantize is None:
+        with StripSource(src) as source:
+            big = source.width * source.height >= TILED_MIN_PIXELS
+        if big:
+            colors, kept = extract_tiled(src, dst)
+            return kept, colors
+    arr = np.array(Image.open(src).convert("RGBA"), dtype=np.uint8)
+    if quantize is not None:
+        arr = quantize_rgba(arr, *quantize).rgba
+    groups = group_colors(arr)
+    del arr
+    if dst.lower().endswith(BIN_EXT):
+        tmp = dst + ".tmp"
+        save_groups_bin(tmp, groups)
+        os.replace(tmp, dst)
+    else:
+        save_groups_txt(dst, groups)
+    return groups.num_pixels, groups.num_colors
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="Tách màu hàng loạt ảnh thành file layer (không cần giao diện).")
+    ap.add_argument("inputs", nargs="+", help="Ảnh, thư mục hoặc glob (\"sprites/**/*.png\")")
+    ap.add_argument("-o", "--output", default=None,
+                    help="Thư mục đầu ra (mặc định: cạnh từng ảnh nguồn)")
+    ap.add_argument("--format", choices=("txt", BIN_EXT.lstrip(".")), default="txt",
+                    help="Định dạng file layer")
+    ap.add_argument("-r", "--recursive", action="store_true", help="Duyệt cả thư mục con của thư mục đầu vào")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Số tiến trình song song")
+    ap.add_argument("--force", action="store_true",
+                    help="Xử lý lại cả ảnh có file layer mới hơn nguồn (cần khi đổi tùy chọn)")
+    ap.add_argument("--summary", default=None,
+                    help=f"File tóm tắt .csv / .json (mặc định: <thư mục đầu ra>/{SUMMARY_NAME})")
+    ap.add_argument("--colors", type=int, default=None, help="Giảm màu: số màu tối đa (bật giảm màu)")
+    ap.add_argument("--threshold", type=float, default=0.0, help="Giảm màu: ngưỡng gộp màu (mỗi kênh)")
+    ap.add_argument("--method", choices=QUANTIZE_METHODS, default=QUANTIZE_METHODS[0],
+                    help="Giảm màu: phương pháp")
+    return ap
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+
+    try:
+        pairs = expand_inputs(args.inputs, args.recursive)
+    except FileNotFoundError as e:
+        print(f"[LỖI] {e}", file=sys.stderr)
+        return 1
+    ext = "." + args.format
+    jobs = [(src, output_path(rel, args.output, ext, src)) for src, rel in pairs]
+    quantize = None if args.colors is None else (args.colors, args.threshold, args.method)
+    rows = run_batch(jobs, extract_file, {"quantize": quantize}, args.jobs, args.force, print_row)
+
+    summary = args.summary or (os.path.join(args.output, SUMMARY_NAME) if args.output else None)
+    if summary and rows:
+        os.makedirs(os.path.dirname(summary) or ".", exist_ok=True)
+        write_summary(summary, rows)
+    print(summarize(rows) + (f" — tóm tắt: {summary}" if summary and rows else ""))
+    return 1 if any(r.status == "error" for r in rows) else 0
+
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(main())
     App().mainloop()
@@ -0,0 +1,214 @@
+"""Archive snapshot dạng delta: một file chứa background, keyframe định kỳ
+và các pixel thay đổi của từng frame (không phụ thuộc Tk).
+
+Bố cục file (.apfa, little-endian):
+    header    : magic "APFA", version, W, H, keyframe_interval, số frame,
+                offset/độ dài của background và bảng index
+    background: zlib(RGBA thô)
+    segment s (frame [s*K, (s+1)*K)):
+        keyframe : zlib(RGBA thô của frame s*K sau khi vẽ)
+        deltas   : zlib(với mỗi frame: u32 n, n × u32 pixel id (y*W+x), n × 4 byte RGBA)
+    index     : (số segment, 4) int64 = keyframe offset, keyframe len, deltas offset, deltas len
+
+Frame i (0-based, tương ứng snapshot_{i+1:06d}.png) = keyframe của segment
+i // K rồi áp delta các frame sau đó trong segment.
+"""
+import argparse
+import os
+import struct
+import time
+import zlib
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
+
+from frame_writer import PngFrameWriter
+from paint_schedule import rgba_view
+
+ARCHIVE_MAGIC = b"APFA"
+ARCHIVE_VERSION = 1
+ARCHIVE_EXT = ".apfa"
+KEYFRAME_INTERVAL = 256
+_HEADER = struct.Struct("<4sHxxIIIIQQQQ")  # 56 byte
+
+Delta = Tuple[np.ndarray, np.ndarray, np.ndarray]  # (xs, ys, colors uint32 RGBA)
+
+
+class FrameArchiveWriter:
+    """Ghi frame vào archive; cùng giao diện write()/close() với PngFrameWriter.
+
+    metrics (export_metrics.ExportMetrics) nhận thời gian nén zlib ("archive:compress").
+    """
+
+    def __init__(self, path: str, background: np.ndarray,
+                 keyframe_interval: int = KEYFRAME_INTERVAL, level: int = 6, metrics=None):
+        self.path = path
+        self.metrics = metrics
+        self.H, self.W = background.shape[:2]
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.level = level
+        self.frames_written = 0
+        self.bytes_written = 0
+        self._index: List[Tuple[int, int, int, int]] = []
+        self._keyframe: Optional[Tuple[int, int]] = None
+        self._deltas: List[bytes] = []
+        self._f = open(path, "wb")
+        self._f.write(b"\0" * _HEADER.size)
+        self._bg = self._blob(np.ascontiguousarray(background, dtype=np.uint8).tobytes())
+
+    def _blob(self, raw: bytes) -> Tuple[int, int]:
+        t0, c0 = time.perf_counter(), time.thread_time()
+        data = zlib.compress(raw, self.level)
+        if self.metrics is not None:
+            self.metrics.add("archive:compress", time.perf_counter() - t0, time.thread_time() - c0)
+        off = self._f.tell()
+        self._f.write(data)
+        return off, len(data)
+
+    def _flush_segment(self) -> None:
+        if self._keyframe is None:
+            return
+        d_off, d_len = self._blob(b"".join(self._deltas))
+        self._index.append(self._keyframe + (d_off, d_len))
+        self._keyframe = None
+        self._deltas = []
+
+    def write(self, index: int, arr: np.ndarray, delta: Optional[Delta] = None) -> None:
+        """Thêm frame (index chỉ để tương thích với PngFrameWriter, frame phải theo thứ tự)."""
+        if delta is None:
+            raise ValueError("FrameArchiveWriter cần delta (xs, ys, colors) của frame.")
+        xs, ys, colors = delta
+        if self.frames_written % self.keyframe_interval == 0:
+            self._flush_segment()
+            self._keyframe = self._blob(np.ascontiguousarray(arr).tobytes())
+        pid = (np.asarray(ys, dtype=np.uint32) * np.uint32(self.W) + np.asarray(xs, dtype=np.uint32))
+        self._deltas.append(struct.pack("<I", pid.shape[0]) + pid.astype("<u4").tobytes()
+                            + np.ascontiguousarray(colors, dtype=np.uint32).view(np.uint8).tobytes())
+        self.frames_written += 1
+
+    def close(self, cancel: bool = False) -> None:
+        """Ghi index + header. Khi cancel vẫn đóng file hợp lệ với các frame đã ghi."""
+        if self._f.closed:
+            return
+        try:
+            self._flush_segment()
+            idx_off = self._f.tell()
+            self._f.write(np.array(self._index, dtype="<i8").reshape(-1, 4).tobytes())
+            self._f.seek(0)
+            self._f.write(_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, self.W, self.H,
+                                       self.keyframe_interval, self.frames_written,
+                                       self._bg[0], self._bg[1], idx_off, len(self._index)))
+        finally:
+            self._f.close()
+        self.bytes_written = os.path.getsize(self.path)
+
+    def __enter__(self) -> "FrameArchiveWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close(cancel=exc_type is not None)
+
+
+class FrameArchive:
+    """Đọc archive: frame(i) dựng frame bất kỳ từ keyframe gần nhất + delta."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            head = f.read(_HEADER.size)
+            if len(head) < _HEADER.size:
+                raise ValueError("File archive bị cụt.")
+            (magic, version, self.W, self.H, self.keyframe_interval, self.num_frames,
+             bg_off, bg_len, idx_off, n_seg) = _HEADER.unpack(head)
+            if magic != ARCHIVE_MAGIC:
+                raise ValueError("Không phải file archive snapshot.")
+            if version != ARCHIVE_VERSION:
+                raise ValueError(f"Không hỗ trợ phiên bản archive {version}.")
+            self._bg_loc = (bg_off, bg_len)
+            f.seek(idx_off)
+            self._index = np.frombuffer(f.read(32 * n_seg), dtype="<i8").reshape(-1, 4)
+        self._seg_cache: Optional[Tuple[int, List[Tuple[np.ndarray, np.ndarray]]]] = None
+
+    def __len__(self) -> int:
+        return self.num_frames
+
+    def _read(self, off: int, length: int) -> bytes:
+        with open(self.path, "rb") as f:
+            f.seek(off)
+            return zlib.decompress(f.read(length))
+
+    def _image(self, off: int, length: int) -> np.ndarray:
+        return np.frombuffer(self._read(off, length), dtype=np.uint8).reshape(self.H, self.W, 4).copy()
+
+    def background(self) -> np.ndarray:
+        return self._image(*self._bg_loc)
+
+    def _segment_deltas(self, seg: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """[(pixel id, colors uint32), ...] cho từng frame của segment."""
+        if self._seg_cache is not None and self._seg_cache[0] == seg:
+            return self._seg_cache[1]
+        raw = self._read(int(self._index[seg, 2]), int(self._index[seg, 3]))
+        out = []
+        pos = 0
+        while pos < len(raw):
+            (n,) = struct.unpack_from("<I", raw, pos)
+            pos += 4
+            pid = np.frombuffer(raw, dtype="<u4", count=n, offset=pos)
+            pos += 4 * n
+            colors = np.frombuffer(raw, dtype=np.uint8, count=4 * n, offset=pos).view(np.uint32)
+            pos += 4 * n
+            out.append((pid, colors))
+        self._seg_cache = (seg, out)
+        return out
+
+    def _apply(self, frame: np.ndarray, pid: np.ndarray, colors: np.ndarray) -> None:
+        rgba_view(frame).reshape(-1)[pid] = colors
+
+    def frame(self, i: int) -> np.ndarray:
+        """Frame thứ i (0-based) dạng (H, W, 4) uint8."""
+        if not 0 <= i < self.num_frames:
+            raise IndexError(f"Frame {i} ngoài phạm vi 0..{self.num_frames - 1}")
+        seg, k = divmod(i, self.keyframe_interval)
+        frame = self._image(int(self._index[seg, 0]), int(self._index[seg, 1]))
+        deltas = self._segment_deltas(seg)
+        for j in range(1, k + 1):
+            self._apply(frame, *deltas[j])
+        return frame
+
+    def iter_frames(self) -> Iterator[np.ndarray]:
+        """Duyệt tuần tự mọi frame từ background (không cần giải nén keyframe).
+
+        Mảng trả về được dùng lại cho frame kế tiếp; copy nếu cần giữ.
+        """
+        frame = self.background()
+        for seg in range(self._index.shape[0]):
+            for pid, colors in self._segment_deltas(seg):
+                self._apply(frame, pid, colors)
+                yield frame
+
+    def expand_to_pngs(self, out_dir: str, workers: Optional[int] = None) -> int:
+        """Bung archive ra bố cục cũ snapshot_%06d.png; trả về số frame đã ghi."""
+        with PngFrameWriter(out_dir, workers=workers) as writer:
+            for i, frame in enumerate(self.iter_frames(), start=1):
+                writer.write(i, frame)
+        return self.num_frames
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Đọc archive snapshot (.apfa).")
+    ap.add_argument("archive", help="File archive")
+    ap.add_argument("--frame", type=int, help="Chỉ xuất frame này (1-based, như snapshot_%%06d.png)")
+    ap.add_argument("-o", "--output", required=True,
+                    help="Thư mục để bung ra PNG, hoặc file PNG khi dùng --frame")
+    args = ap.parse_args()
+
+    arc = FrameArchive(args.archive)
+    if args.frame is not None:
+        from PIL import Image
+        Image.fromarray(arc.frame(args.frame - 1), mode="RGBA").save(args.output)
+    else:
+        os.makedirs(args.output, exist_ok=True)
+        arc.expand_to_pngs(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Cache frame theo nội dung cho Export Snapshot PNG (không phụ thuộc Tk).
+
+Frame k (1-based) là background + các lần ghi [0, bounds[k]) của lịch vẽ, nên
+khóa của nó là hash(background, các lần ghi đó). Thông số layer (file, vị trí,
+thứ tự, seed) chỉ tác động qua lịch vẽ mà chúng tạo ra: sửa một layer chỉ làm
+lịch khác đi từ lần ghi đầu tiên bị đổi, mọi frame kết thúc trước đó giữ nguyên
+khóa.
+
+Khóa của các frame đã ghi nằm trong out_dir/snapshot_keys.bin (KEY_BYTES byte
+mỗi frame, theo thứ tự). Export lại vào cùng thư mục chỉ nén các frame sau
+đoạn khóa trùng ở đầu (reusable_frames); phần đầu được paint_frames vẽ bằng
+một lượt như khi tiếp tục export. File khóa chỉ liệt kê frame chắc chắn đã
+nằm trên đĩa: trước khi vẽ thì cắt còn đoạn dùng lại, xong / hủy thì ghi tới
+frame cuối cùng đã ghi.
+"""
+import hashlib
+import os
+import numpy as np
+
+from frame_writer import SNAPSHOT_PATTERN
+from paint_schedule import PaintSchedule
+
+KEYS_NAME = "snapshot_keys.bin"
+KEY_BYTES = 16
+
+
+def frame_keys(bg_arr: np.ndarray, sched: PaintSchedule, bounds: np.ndarray) -> np.ndarray:
+    """Khóa của từng frame theo kế hoạch bounds -> (F, KEY_BYTES) uint8."""
+    h = hashlib.blake2b(digest_size=KEY_BYTES)
+    bg = np.ascontiguousarray(bg_arr, dtype=np.uint8)
+    h.update(np.asarray(bg.shape, dtype=np.int64).tobytes())
+    h.update(bg.reshape(-1))
+    rec = np.empty((sched.num_writes, 3), dtype=np.uint32)
+    rec[:, 0], rec[:, 1], rec[:, 2] = sched.xs, sched.ys, sched.colors
+    # view uint8 thay vì memoryview.cast: cast lỗi khi lịch rỗng (mọi điểm là no-op)
+    buf = rec.reshape(-1).view(np.uint8)
+    ends = (np.asarray(bounds, dtype=np.int64) * rec.itemsize * 3).tolist()
+    digests = []
+    # digest() không kết thúc trạng thái hash: cập nhật tiếp cho frame sau
+    for a, b in zip(ends[:-1], ends[1:]):
+        h.update(buf[a:b])
+        digests.append(h.digest())
+    return np.frombuffer(b"".join(digests), dtype=np.uint8).reshape(-1, KEY_BYTES)
+
+
+def read_keys(out_dir: str) -> np.ndarray:
+    """Khóa các frame đã ghi trong out_dir; rỗng nếu chưa có."""
+    try:
+        data = np.fromfile(os.path.join(out_dir, KEYS_NAME), dtype=np.uint8)
+    except OSError:
+        data = np.empty(0, dtype=np.uint8)
+    return data[:data.shape[0] - data.shape[0] % KEY_BYTES].reshape(-1, KEY_BYTES)
+
+
+def write_keys(out_dir: str, keys: np.ndarray) -> None:
+    path = os.path.join(out_dir, KEYS_NAME)
+    with open(path + ".tmp", "wb") as f:
+        f.write(np.ascontiguousarray(keys, dtype=np.uint8).tobytes())
+    os.replace(path + ".tmp", path)
+
+
+def reusable_frames(out_dir: str, keys: np.ndarray, pattern: str = SNAPSHOT_PATTERN) -> int:
+    """Số frame đầu (1..k) trong out_dir trùng khóa với keys và còn file trên đĩa."""
+    old = read_keys(out_dir)
+    n = min(old.shape[0], keys.shape[0])
+    diff = np.flatnonzero((old[:n] != keys[:n]).any(axis=1))
+    common = int(diff[0]) if diff.size else n
+    k = 0
+    while k < common and os.path.exists(os.path.join(out_dir, pattern.format(k + 1))):
+        k += 1
+    return k
+
+
+def remove_stale_frames(out_dir: str, num_frames: int, pattern: str = SNAPSHOT_PATTERN) -> int:
+    """Xóa frame num_frames+1, num_frames+2, ... còn sót từ lần export dài hơn."""
+    k = num_frames + 1
+    while True:
+        path = os.path.join(out_dir, pattern.format(k))
+        if not os.path.exists(path):
+            return k - num_frames - 1
+        os.remove(path)
+        k += 1
@@ -0,0 +1,210 @@
+"""Lập kế hoạch frame cho Export Snapshot trước khi nén (không phụ thuộc Tk).
+
+Kế hoạch là dãy biên bounds[0..F] trên lịch vẽ (paint_schedule.PaintSchedule):
+frame i (1-based) = các lần ghi [bounds[i-1], bounds[i]). Có thể chọn:
+  - số pixel mỗi frame cố định (mặc định PIXELS_PER_SNAPSHOT)
+  - số frame mục tiêu, phân bổ theo đường cong tốc độ vẽ (CURVES)
+  - ngân sách dung lượng đĩa / thời gian nén: số frame bị giới hạn theo
+    chi phí ước lượng một frame (FrameCost)
+Mỗi frame có ít nhất một lần ghi.
+"""
+import io
+import time
+import zlib
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+from frame_stream import frame_bytes, rgba_to_yuv444
+from paint_schedule import PIXELS_PER_SNAPSHOT, PaintSchedule, apply_writes, rgba_view, uniform_bounds
+
+# Tiến độ tích lũy f(t): t = phần frame đã qua, f = phần lần ghi đã vẽ (f(0)=0, f(1)=1).
+# Số pixel mỗi frame tỉ lệ với f'(t).
+CURVES: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    "linear": lambda t: t,
+    "ease-in": lambda t: t * t,                        # chậm lúc đầu, nhanh dần
+    "ease-out": lambda t: 1 - (1 - t) ** 2,            # nhanh lúc đầu, chậm dần
+    "ease-in-out": lambda t: t * t * (3 - 2 * t),      # chậm ở hai đầu
+}
+
+
+class PlanSpec(NamedTuple):
+    """Yêu cầu của người dùng; None = không giới hạn."""
+    per_frame: int = PIXELS_PER_SNAPSHOT
+    frames: Optional[int] = None        # số frame mục tiêu (thay cho per_frame)
+    curve: str = "linear"
+    max_bytes: Optional[int] = None     # ngân sách dung lượng đầu ra
+    max_seconds: Optional[float] = None  # ngân sách thời gian nén
+
+
+# Các điểm (phần lần ghi đã vẽ) lấy mẫu frame để ước lượng dung lượng
+SAMPLE_POINTS = np.linspace(0.0, 1.0, 5)
+
+
+class FrameCost(NamedTuple):
+    """Chi phí ước lượng: bytes = fixed + Σ frame_bytes(tiến độ của frame) + writes × per_write."""
+    fixed_bytes: float
+    frame_bytes: np.ndarray   # byte một frame tại từng SAMPLE_POINTS (nội suy ở giữa)
+    bytes_per_write: float
+    seconds_per_frame: float
+
+    @property
+    def bytes_per_frame(self) -> float:
+        return float(np.mean(self.frame_bytes))
+
+
+class FramePlan(NamedTuple):
+    bounds: np.ndarray  # (F + 1,) int64, bounds[0] = 0, bounds[-1] = số lần ghi
+
+    @property
+    def num_frames(self) -> int:
+        return int(self.bounds.shape[0]) - 1
+
+    @property
+    def num_writes(self) -> int:
+        return int(self.bounds[-1])
+
+    def sizes(self) -> np.ndarray:
+        """Số lần ghi của từng frame."""
+        return np.diff(self.bounds)
+
+    def estimate(self, cost: FrameCost) -> Tuple[float, float]:
+        """(byte, giây) dự kiến của toàn bộ đầu ra."""
+        progress = self.bounds[1:] / max(self.num_writes, 1)
+        size = cost.fixed_bytes + float(np.interp(progress, SAMPLE_POINTS, cost.frame_bytes).sum()) \
+            + self.num_writes * cost.bytes_per_write
+        return size, self.num_frames * cost.seconds_per_frame
+
+
+def curve_bounds(num_writes: int, frames: int, curve: str = "linear") -> np.ndarray:
+    """Chia num_writes lần ghi thành frames frame theo đường cong (mỗi frame >= 1 lần ghi)."""
+    if curve not in CURVES:
+        raise ValueError(f"Đường cong không hỗ trợ: {curve!r} (chọn: {', '.join(CURVES)})")
+    frames = min(max(frames, 1), num_writes)
+    if frames == 0:
+        return np.zeros(1, dtype=np.int64)
+    t = np.linspace(0.0, 1.0, frames + 1)
+    extra = np.rint(CURVES[curve](t) * (num_writes - frames)).astype(np.int64)
+    extra[0], extra[-1] = 0, num_writes - frames
+    return np.arange(frames + 1, dtype=np.int64) + np.maximum.accumulate(extra)
+
+
+def frames_for_budget(num_writes: int, cost: FrameCost, max_bytes: Optional[int] = None,
+                      max_seconds: Optional[float] = None) -> Optional[int]:
+    """Số frame tối đa vừa ngân sách; None nếu không có ngân sách nào."""
+    limits = []
+    if max_bytes is not None:
+        room = max_bytes - cost.fixed_bytes - num_writes * cost.bytes_per_write
+        limits.append(int(room // cost.bytes_per_frame) if cost.bytes_per_frame > 0 else num_writes)
+    if max_seconds is not None:
+        limits.append(int(max_seconds // cost.seconds_per_frame)
+                      if cost.seconds_per_frame > 0 else num_writes)
+    if not limits:
+        return None
+    n = min(limits)
+    if n < 1 and num_writes > 0:
+        raise ValueError("Ngân sách quá nhỏ: không đủ cho dù chỉ một frame.")
+    return n
+
+
+def plan_frames(num_writes: int, spec: PlanSpec = PlanSpec(),
+                cost: Optional[FrameCost] = None) -> FramePlan:
+    """Tính biên frame theo spec. Không giới hạn gì thì giống hệt cắt đều per_frame."""
+    per_frame = max(1, int(spec.per_frame))
+    frames = -(-num_writes // per_frame) if spec.frames is None else int(spec.frames)
+    if spec.max_bytes is not None or spec.max_seconds is not None:
+        if cost is None:
+            raise ValueError("Cần ước lượng chi phí frame để lập kế hoạch theo ngân sách.")
+        frames = min(frames, frames_for_budget(num_writes, cost, spec.max_bytes, spec.max_seconds))
+    plan = _make_plan(num_writes, per_frame, frames, spec.curve)
+    if spec.max_bytes is not None:
+        # Số frame theo byte trung bình chỉ là gần đúng: giảm dần tới khi vừa ngân sách
+        for _ in range(8):
+            size = plan.estimate(cost)[0]
+            if size <= spec.max_bytes or plan.num_frames <= 1:
+                break
+            frames = max(1, min(plan.num_frames - 1,
+                                int(plan.num_frames * (spec.max_bytes - cost.fixed_bytes)
+                                    / (size - cost.fixed_bytes))))
+            plan = _make_plan(num_writes, per_frame, frames, spec.curve)
+    return plan
+
+
+def _make_plan(num_writes: int, per_frame: int, frames: int, curve: str) -> FramePlan:
+    if frames == -(-num_writes // per_frame) and curve == "linear":
+        return FramePlan(uniform_bounds(num_writes, per_frame))
+    return FramePlan(curve_bounds(num_writes, frames, curve))
+
+
+# ---------- Ước lượng chi phí một frame ----------
+
+def sample_frames(bg_arr: np.ndarray, sched: PaintSchedule) -> List[np.ndarray]:
+    """Các frame tại SAMPLE_POINTS của lịch vẽ (frame đầu = background, cuối = ảnh hoàn chỉnh)."""
+    acc = np.array(bg_arr, dtype=np.uint8, copy=True)
+    acc32 = rgba_view(acc)
+    out, done = [], 0
+    for q in SAMPLE_POINTS:
+        upto = int(round(q * sched.num_writes))
+        apply_writes(acc32, sched, done, upto)
+        done = upto
+        out.append(acc.copy())
+    return out
+
+
+def _timed(fn) -> Tuple[int, float]:
+    t0 = time.perf_counter()
+    n = fn()
+    return n, time.perf_counter() - t0
+
+
+def _png_size(arr: np.ndarray) -> int:
+    buf = io.BytesIO()
+    Image.fromarray(arr, mode="RGBA").save(buf, format="PNG")
+    return buf.tell()
+
+
+def png_frame_cost(samples: List[np.ndarray], workers: int = 1) -> FrameCost:
+    """Mỗi frame một PNG; nén thử các frame mẫu."""
+    sizes, times = zip(*(_timed(lambda: _png_size(a)) for a in samples))
+    return FrameCost(0.0, np.array(sizes, dtype=np.float64), 0.0,
+                     float(np.mean(times)) / max(workers, 1))
+
+
+def archive_frame_cost(samples: List[np.ndarray], keyframe_interval: int, level: int = 6) -> FrameCost:
+    """Archive: background + keyframe mỗi keyframe_interval frame + delta
+    (4 byte/frame, 8 byte/lần ghi trước khi nén — ước lượng trên)."""
+    sizes, times = zip(*(_timed(lambda: len(zlib.compress(np.ascontiguousarray(a).tobytes(), level)))
+                         for a in samples))
+    k = max(1, keyframe_interval)
+    return FrameCost(float(sizes[0]), np.array(sizes, dtype=np.float64) / k + 4, 8.0,
+                     float(np.mean(times)) / k)
+
+
+def stream_frame_cost(samples: List[np.ndarray], fmt: str) -> FrameCost:
+    """Stream thô: kích thước frame cố định; thời gian = chuyển đổi một frame."""
+    H, W = samples[0].shape[:2]
+    convert = (lambda a: rgba_to_yuv444(a).nbytes) if fmt == "y4m" else (lambda a: len(a.tobytes()))
+    _, secs = _timed(lambda: convert(samples[-1]))
+    return FrameCost(0.0, np.full(len(samples), float(frame_bytes(W, H, fmt))), 0.0, secs)
+
+
+def format_bytes(n: float) -> str:
+    if n < 1024:
+        return f"{n:.0f} B"
+    for unit in ("KB", "MB"):
+        n /= 1024
+        if n < 1024:
+            return f"{n:.1f} {unit}"
+    return f"{n / 1024:.1f} GB"
+
+
+def describe_plan(plan: FramePlan, cost: Optional[FrameCost] = None) -> str:
+    """Tóm tắt kế hoạch để báo trước khi export."""
+    sizes = plan.sizes()
+    text = f"{plan.num_frames} frame, {plan.num_writes} pixel"
+    if sizes.size:
+        text += f" ({int(sizes.min())}–{int(sizes.max())} pixel/frame)"
+    if cost is not None:
+        size, secs = plan.estimate(cost)
+        text += f", dự kiến ~{format_bytes(size)}, nén ~{secs:.0f}s"
+    return text
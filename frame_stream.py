@@ -0,0 +1,147 @@
+"""Stream frame thô ra stdout / named pipe / tiến trình encoder, không qua file trung gian
+(không phụ thuộc Tk).
+
+Định dạng:
+  - "rgba": nối tiếp các frame RGBA 8-bit, không header. Ví dụ:
+        ffmpeg -f rawvideo -pix_fmt rgba -s WxH -r 30 -i - out.mp4
+  - "y4m" : YUV4MPEG2, 4:4:4 (C444, BT.601 limited range), bỏ alpha. Ví dụ:
+        ffmpeg -i - out.mp4
+Đích (target):
+  - "-"          : stdout
+  - "|<lệnh>"    : chạy lệnh (qua shell) và ghi vào stdin của nó
+  - đường dẫn khác: file hoặc named pipe (mkfifo); mở pipe sẽ chờ tới khi có bên đọc
+
+Backpressure: một thread ghi lấy frame từ hàng đợi có giới hạn; khi encoder
+đọc chậm, lệnh ghi vào pipe bị chặn, hàng đợi đầy và write() của painter
+chờ theo — bộ nhớ luôn bị chặn ở max_pending frame.
+"""
+import queue
+import subprocess
+import sys
+import threading
+import time
+from typing import Optional
+import numpy as np
+
+STREAM_FORMATS = ("y4m", "rgba")
+DEFAULT_FPS = 30
+
+
+def frame_bytes(W: int, H: int, fmt: str) -> int:
+    """Số byte một frame trong stream (kể cả header frame của y4m)."""
+    if fmt == "rgba":
+        return W * H * 4
+    return W * H * 3 + len(b"FRAME\n")
+
+
+def rgba_to_yuv444(arr: np.ndarray) -> np.ndarray:
+    """(H, W, 4) uint8 RGBA -> (3, H, W) uint8 các mặt phẳng Y, U, V (BT.601 limited range)."""
+    rgb = arr[..., :3].astype(np.int32)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    out = np.empty((3,) + arr.shape[:2], dtype=np.uint8)
+    out[0] = (66 * r + 129 * g + 25 * b + 128 >> 8) + 16
+    out[1] = (-38 * r - 74 * g + 112 * b + 128 >> 8) + 128
+    out[2] = (112 * r - 94 * g - 18 * b + 128 >> 8) + 128
+    return out
+
+
+class StreamFrameWriter:
+    """Ghi frame ra stream; cùng giao diện write()/close() với PngFrameWriter.
+
+    metrics (export_metrics.ExportMetrics) nhận thời gian chuyển đổi màu
+    ("stream:convert") và thời gian ghi vào pipe ("stream:pipe", gồm cả lúc
+    chờ encoder đọc).
+    """
+
+    def __init__(self, target: str, width: int, height: int, fmt: str = "y4m",
+                 fps: int = DEFAULT_FPS, max_pending: int = 4, metrics=None):
+        if fmt not in STREAM_FORMATS:
+            raise ValueError(f"Định dạng stream không hỗ trợ: {fmt!r} (chọn: {', '.join(STREAM_FORMATS)})")
+        self.target = target
+        self.W, self.H = width, height
+        self.fmt = fmt
+        self.metrics = metrics
+        self.frames_written = 0
+        self.bytes_written = 0
+        self._proc: Optional[subprocess.Popen] = None
+        self._out, self._owns_out = self._open(target)
+        self._queue: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=max(1, max_pending))
+        self._error: Optional[BaseException] = None
+        if fmt == "y4m":
+            self._queue.put(f"YUV4MPEG2 W{width} H{height} F{fps}:1 Ip A1:1 C444\n".encode())
+        self._thread = threading.Thread(target=self._run, name="frame-stream", daemon=True)
+        self._thread.start()
+
+    def _open(self, target: str):
+        if target == "-":
+            return sys.stdout.buffer, False
+        if target.startswith("|"):
+            self._proc = subprocess.Popen(target[1:], shell=True, stdin=subprocess.PIPE)
+            return self._proc.stdin, True
+        return open(target, "wb"), True
+
+    def _run(self) -> None:
+        try:
+            while True:
+                data = self._queue.get()
+                if data is None:
+                    break
+                t0, c0 = time.perf_counter(), time.thread_time()
+                self._out.write(data)
+                if self.metrics is not None:
+                    self.metrics.add("stream:pipe", time.perf_counter() - t0, time.thread_time() - c0)
+                self.bytes_written += len(data)
+            self._out.flush()
+        except BaseException as e:
+            self._error = e
+            # Xả hàng đợi để painter không bị kẹt ở put()
+            while self._queue.get() is not None:
+                pass
+
+    def _check(self) -> None:
+        if self._error is not None:
+            raise OSError(f"Không ghi được stream {self.target!r}: {self._error}") from self._error
+
+    def write(self, index: int, arr: np.ndarray, delta=None) -> None:
+        """Đưa frame vào hàng đợi (chờ nếu đầy). index/delta chỉ để cùng giao diện;
+        frame phải theo thứ tự."""
+        self._check()
+        t0, c0 = time.perf_counter(), time.thread_time()
+        if self.fmt == "rgba":
+            data = np.ascontiguousarray(arr, dtype=np.uint8).tobytes()
+        else:
+            data = b"FRAME\n" + rgba_to_yuv444(arr).tobytes()
+        if self.metrics is not None:
+            self.metrics.add("stream:convert", time.perf_counter() - t0, time.thread_time() - c0)
+        self._queue.put(data)
+        self.frames_written += 1
+
+    def close(self, cancel: bool = False) -> None:
+        """Ghi nốt các frame trong hàng đợi rồi đóng đích (chờ encoder kết thúc nếu là lệnh).
+
+        cancel chỉ để cùng giao diện: các frame đã gửi vẫn được ghi để stream hợp lệ.
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        try:
+            if self._owns_out:
+                self._out.close()
+            else:
+                self._out.flush()
+        except OSError as e:
+            if self._error is None:
+                self._error = e
+        if self._proc is not None:
+            code = self._proc.wait()
+            self._proc = None
+            if code != 0 and not cancel and self._error is None:
+                raise OSError(f"Lệnh encoder kết thúc với mã {code}: {self.target[1:]}")
+        if not cancel:
+            self._check()
+
+    def __enter__(self) -> "StreamFrameWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close(cancel=exc_type is not None)
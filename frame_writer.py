@@ -0,0 +1,141 @@
+"""Ghi snapshot PNG song song: painter đẩy frame (bản copy cố định) vào
+hàng đợi có giới hạn, một pool tiến trình nén PNG.
+
+Không phụ thuộc Tk để dùng được cả ở chế độ không giao diện.
+"""
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+SNAPSHOT_PATTERN = "snapshot_{:06d}.png"
+MANIFEST_NAME = "snapshot_manifest.json"
+
+
+EncodeTimes = Tuple[float, float, float, float]  # wall/CPU của fromarray, wall/CPU của save
+
+
+def encode_png_timed(arr: np.ndarray, path: str) -> Tuple[int, EncodeTimes]:
+    """Nén một frame RGBA ra file PNG; trả về (số byte, thời gian từng bước).
+
+    Ghi qua file tạm rồi đổi tên, nên file snapshot_*.png luôn là ảnh hoàn chỉnh.
+    """
+    t0, c0 = time.perf_counter(), time.thread_time()
+    im = Image.fromarray(arr, mode="RGBA")
+    t1, c1 = time.perf_counter(), time.thread_time()
+    tmp = path + ".tmp"
+    im.save(tmp, format="PNG")
+    os.replace(tmp, path)
+    t2, c2 = time.perf_counter(), time.thread_time()
+    return os.path.getsize(path), (t1 - t0, c1 - c0, t2 - t1, c2 - c1)
+
+
+def encode_png(arr: np.ndarray, path: str) -> int:
+    """Nén một frame RGBA ra file PNG, trả về số byte đã ghi."""
+    return encode_png_timed(arr, path)[0]
+
+
+def count_existing_frames(out_dir: str, pattern: str = SNAPSHOT_PATTERN) -> int:
+    """Số frame liên tiếp 1..k đã có trong out_dir."""
+    k = 0
+    while os.path.exists(os.path.join(out_dir, pattern.format(k + 1))):
+        k += 1
+    return k
+
+
+def read_manifest(out_dir: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(out_dir: str, manifest: dict) -> None:
+    """Ghi manifest export (tham số để tiếp tục export sau khi hủy)."""
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+class PngFrameWriter:
+    """Ghi frame thành out_dir/snapshot_%06d.png theo chỉ số frame.
+
+    - workers: số tiến trình nén (mặc định = số core; <= 1 thì nén ngay tại chỗ)
+    - max_pending: số frame tối đa đang chờ nén (giới hạn bộ nhớ ~ max_pending × kích thước frame)
+    - metrics: export_metrics.ExportMetrics nhận thời gian fromarray / save của từng frame
+    Tên file cố định theo chỉ số nên thứ tự file luôn đúng dù các worker
+    xong không theo thứ tự. Lỗi của worker được ném lại ở write()/close().
+    """
+
+    def __init__(self, out_dir: str, workers: Optional[int] = None,
+                 max_pending: Optional[int] = None, pattern: str = SNAPSHOT_PATTERN,
+                 metrics=None):
+        self.out_dir = out_dir
+        self.metrics = metrics
+        self.pattern = pattern
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.max_pending = max_pending if max_pending is not None else 2 * max(self.workers, 1)
+        self.bytes_written = 0
+        self.frames_written = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: Deque[Tuple[str, Future]] = deque()
+        if self.workers > 1:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def path_for(self, index: int) -> str:
+        return os.path.join(self.out_dir, self.pattern.format(index))
+
+    def write(self, index: int, arr: np.ndarray, delta=None) -> None:
+        """Gửi frame đi nén. arr được copy nên painter có thể vẽ tiếp ngay.
+
+        delta (các pixel vừa vẽ) không dùng ở đây; có để cùng giao diện với
+        frame_archive.FrameArchiveWriter.
+        """
+        path = self.path_for(index)
+        if self._pool is None:
+            self._finish(path, lambda: encode_png_timed(arr, path))
+            return
+        while len(self._pending) >= self.max_pending:
+            self._wait_oldest()
+        self._pending.append((path, self._pool.submit(encode_png_timed, np.array(arr, copy=True), path)))
+
+    def _finish(self, path: str, get_result) -> None:
+        try:
+            size, (tf, cf, ts, cs) = get_result()
+        except Exception as e:
+            raise OSError(f"Không thể lưu {os.path.basename(path)}: {e}") from e
+        self.bytes_written += size
+        self.frames_written += 1
+        if self.metrics is not None:
+            self.metrics.add("encode:fromarray", tf, cf)
+            self.metrics.add("encode:save", ts, cs)
+
+    def _wait_oldest(self) -> None:
+        path, fut = self._pending.popleft()
+        self._finish(path, fut.result)
+
+    def close(self, cancel: bool = False) -> None:
+        """Chờ các frame còn lại (hoặc bỏ chúng nếu cancel) rồi tắt pool."""
+        try:
+            if cancel:
+                for _, fut in self._pending:
+                    fut.cancel()
+                self._pending.clear()
+            while self._pending:
+                self._wait_oldest()
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=cancel)
+                self._pool = None
+
+    def __enter__(self) -> "PngFrameWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close(cancel=exc_type is not None)
@@ -0,0 +1,192 @@
+"""Chạy một công cụ trên cả thư mục / glob ảnh bằng nhiều tiến trình (không phụ thuộc Tk).
+
+Dùng chung cho chế độ batch của extract_image và img2json:
+  - expand_inputs: thư mục, glob ("sprites/**/*.png") hoặc file -> danh sách
+    (ảnh nguồn, đường dẫn tương đối) — đường dẫn tương đối giữ cấu trúc thư mục
+    con trong thư mục đầu ra
+  - run_batch: bỏ qua file có đầu ra mới hơn nguồn, chia phần còn lại cho
+    ProcessPoolExecutor; mỗi file cho một dòng tóm tắt (BatchRow)
+  - write_summary: ghi tóm tắt ra .csv (mặc định) hoặc .json
+Hàm worker nhận (src, dst) cùng các tùy chọn, phải ghi dst nguyên tử (file tạm
+rồi os.replace) để file dở không bị coi là "đã mới" ở lần chạy sau, và trả về
+(số pixel giữ lại, số màu khác nhau).
+"""
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff", ".webp", ".tga")
+SUMMARY_NAME = "batch_summary.csv"
+_GLOB_CHARS = "*?["
+
+
+class BatchRow(NamedTuple):
+    input: str
+    output: str
+    status: str                  # "ok" | "skipped" | "error"
+    pixels_kept: Optional[int] = None
+    unique_colors: Optional[int] = None
+    elapsed_s: Optional[float] = None
+    error: str = ""
+
+
+def _is_glob(pattern: str) -> bool:
+    """Có ký tự đại diện và không phải tên một file / thư mục có thật (vd. "icon[1].png")."""
+    return any(ch in pattern for ch in _GLOB_CHARS) and not os.path.exists(pattern)
+
+
+def is_batch_input(inputs: Sequence[str]) -> bool:
+    """Có cần chế độ batch không: nhiều đầu vào, thư mục hoặc glob."""
+    return len(inputs) > 1 or any(os.path.isdir(p) or _is_glob(p) for p in inputs)
+
+
+def _is_image(path: str) -> bool:
+    return os.path.isfile(path) and path.lower().endswith(IMAGE_EXTS)
+
+
+def expand_inputs(inputs: Sequence[str], recursive: bool = False) -> List[Tuple[str, str]]:
+    """Thư mục / glob / file -> [(ảnh nguồn, đường dẫn tương đối dùng cho đầu ra)], bỏ trùng.
+
+    Thư mục: các ảnh bên trong (recursive=True: cả thư mục con), tương đối theo thư mục đó.
+    Glob: tương đối theo phần đầu không có ký tự đại diện. File: chỉ tên file.
+    Tên có sẵn trên đĩa luôn được hiểu là file / thư mục, kể cả khi chứa "*?[".
+    Đầu vào không có hoặc glob không khớp ảnh nào -> FileNotFoundError.
+    """
+    out: List[Tuple[str, str]] = []
+    seen = set()
+
+    def add(path: str, root: Optional[str]) -> None:
+        key = os.path.normcase(os.path.abspath(path))
+        if key in seen:
+            return
+        seen.add(key)
+        out.append((path, os.path.relpath(path, root) if root else os.path.basename(path)))
+
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            if recursive:
+                found = [os.path.join(d, name) for d, _, names in os.walk(pattern) for name in names]
+            else:
+                found = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+            for path in sorted(p for p in found if _is_image(p)):
+                add(path, pattern)
+        elif os.path.isfile(pattern):
+            add(pattern, None)
+        elif _is_glob(pattern):
+            parts = pattern.replace("\\", "/").split("/")
+            magic = next(i for i, p in enumerate(parts) if any(ch in p for ch in _GLOB_CHARS))
+            root = "/".join(parts[:magic]) or "."
+            found = [path for path in sorted(glob.glob(pattern, recursive=True)) if _is_image(path)]
+            if not found:
+                raise FileNotFoundError(f"Không có ảnh nào khớp: {pattern}")
+            for path in found:
+                add(path, root)
+        else:
+            raise FileNotFoundError(f"Không tìm thấy đầu vào: {pattern}")
+    return out
+
+
+def output_path(rel: str, out_dir: Optional[str], ext: str, src: str) -> str:
+    """Đầu ra cho một ảnh: out_dir/<rel đổi đuôi>, hoặc cạnh ảnh nguồn nếu không có out_dir."""
+    if out_dir is None:
+        return os.path.splitext(src)[0] + ext
+    return os.path.join(out_dir, os.path.splitext(rel)[0] + ext)
+
+
+def is_up_to_date(src: str, dst: str) -> bool:
+    """Đầu ra đã có và không cũ hơn nguồn."""
+    try:
+        return os.path.getmtime(dst) >= os.path.getmtime(src)
+    except OSError:
+        return False
+
+
+def _run_one(worker: Callable[..., Tuple[int, int]], src: str, dst: str,
+             options: Dict[str, Any]) -> BatchRow:
+    t0 = time.perf_counter()
+    try:
+        os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+        kept, colors = worker(src, dst, **options)
+    except Exception as e:  # một file lỗi không làm dừng cả lô
+        return BatchRow(src, dst, "error", elapsed_s=time.perf_counter() - t0,
+                        error=f"{type(e).__name__}: {e}")
+    return BatchRow(src, dst, "ok", int(kept), int(colors), time.perf_counter() - t0)
+
+
+def run_batch(pairs: Sequence[Tuple[str, str]], worker: Callable[..., Tuple[int, int]],
+              options: Optional[Dict[str, Any]] = None, jobs: Optional[int] = None,
+              force: bool = False,
+              on_row: Optional[Callable[[BatchRow], None]] = None) -> List[BatchRow]:
+    """Chạy worker(src, dst, **options) cho từng (src, dst); giữ thứ tự đầu vào.
+
+    worker phải là hàm cấp module (gửi được sang tiến trình con).
+    on_row được gọi ở tiến trình chính khi mỗi file xong (kể cả file bỏ qua).
+    """
+    options = options or {}
+    rows: List[Optional[BatchRow]] = [None] * len(pairs)
+    todo = []
+    for i, (src, dst) in enumerate(pairs):
+        if not force and is_up_to_date(src, dst):
+            rows[i] = BatchRow(src, dst, "skipped")
+            if on_row is not None:
+                on_row(rows[i])
+        else:
+            todo.append(i)
+
+    n_workers = max(1, min(jobs or os.cpu_count() or 1, len(todo)))
+    if n_workers == 1:
+        results = (_run_one(worker, pairs[i][0], pairs[i][1], options) for i in todo)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=n_workers)
+        # Nhiều sprite nhỏ: gửi theo lô để chi phí giao tiếp giữa tiến trình không lấn át
+        chunk = max(1, min(32, len(todo) // (4 * n_workers)))
+        results = pool.map(_run_one, [worker] * len(todo), [pairs[i][0] for i in todo],
+                           [pairs[i][1] for i in todo], [options] * len(todo), chunksize=chunk)
+    try:
+        for i, row in zip(todo, results):
+            rows[i] = row
+            if on_row is not None:
+                on_row(row)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return rows
+
+
+def write_summary(path: str, rows: Sequence[BatchRow]) -> None:
+    """Tóm tắt từng file: .json thì một mảng object, còn lại là CSV."""
+    tmp = path + ".tmp"
+    if path.lower().endswith(".json"):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump([row._asdict() for row in rows], f, ensure_ascii=False, indent=2)
+    else:
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(BatchRow._fields)
+            for row in rows:
+                w.writerow(["" if v is None else (f"{v:.3f}" if isinstance(v, float) else v) for v in row])
+    os.replace(tmp, path)
+
+
+def print_row(row: BatchRow, file=None) -> None:
+    file = file or sys.stdout
+    if row.status == "ok":
+        print(f"[OK] {row.input}: {row.pixels_kept} pixel, {row.unique_colors} màu, "
+              f"{row.elapsed_s:.2f}s", file=file)
+    elif row.status == "skipped":
+        print(f"[BỎ QUA] {row.input}: đầu ra mới hơn nguồn", file=file)
+    else:
+        print(f"[LỖI] {row.input}: {row.error}", file=sys.stderr)
+
+
+def summarize(rows: Sequence[BatchRow]) -> str:
+    ok = sum(r.status == "ok" for r in rows)
+    skipped = sum(r.status == "skipped" for r in rows)
+    failed = sum(r.status == "error" for r in rows)
+    return f"{ok} xong, {skipped} bỏ qua, {failed} lỗi / {len(rows)} ảnh"
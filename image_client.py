@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Client mỏng cho image_service: cùng đối số với img2json.py / extract_image.py.
+
+    python image_client.py img2json in.png -o out.json --format rle
+    python image_client.py extract_image sprites/ -o layers/ -j 4
+    python image_client.py status | stop
+
+Chỉ dùng thư viện chuẩn (không nạp NumPy / Pillow) nên khởi động nhanh; việc
+chuyển đổi chạy trong service đã nạp sẵn. Service không chạy thì tự chạy
+công cụ ngay trong tiến trình này (chậm hơn, kết quả như nhau).
+Địa chỉ service: biến môi trường AUTOPLACE_SERVICE (đường dẫn Unix socket hoặc
+host:port), mặc định xem default_address.
+"""
+import json
+import os
+import re
+import runpy
+import socket
+import sys
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+ADDRESS_ENV = "AUTOPLACE_SERVICE"
+DEFAULT_PORT = 48620
+TOOLS = ("img2json", "extract_image")
+CONNECT_TIMEOUT = 1.0
+
+Address = Union[str, Tuple[str, int]]
+
+
+def default_address() -> str:
+    """Unix socket trong thư mục tạm của người dùng; nền tảng không có AF_UNIX thì TCP cục bộ."""
+    addr = os.environ.get(ADDRESS_ENV)
+    if addr:
+        return addr
+    if not hasattr(socket, "AF_UNIX"):
+        return f"127.0.0.1:{DEFAULT_PORT}"
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return os.path.join(tempfile.gettempdir(), f"autoplace-{uid}.sock")
+
+
+def parse_address(addr: str) -> Address:
+    """"host:port" -> (host, port) (TCP); còn lại là đường dẫn Unix socket."""
+    m = re.fullmatch(r"([\w.-]+):(\d+)", addr)
+    if m or not hasattr(socket, "AF_UNIX"):
+        if not m:
+            raise ValueError(f"Địa chỉ service không hợp lệ: {addr!r} (cần host:port)")
+        return m.group(1), int(m.group(2))
+    return addr
+
+
+def connect(addr: str, timeout: Optional[float] = CONNECT_TIMEOUT) -> socket.socket:
+    target = parse_address(addr)
+    if isinstance(target, tuple):
+        sock = socket.create_connection(target, timeout=timeout)
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(target)
+        except OSError:
+            sock.close()
+            raise
+    sock.settimeout(None)
+    return sock
+
+
+def encode(msg: Dict[str, Any]) -> bytes:
+    """Một thông điệp = một dòng JSON UTF-8 (json.dumps không sinh xuống dòng thật)."""
+    return json.dumps(msg, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def request(msg: Dict[str, Any], addr: Optional[str] = None) -> Dict[str, Any]:
+    """Gửi một yêu cầu, chờ phản hồi. Không kết nối được thì ném OSError."""
+    with connect(addr or default_address()) as sock:
+        sock.sendall(encode(msg))
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError("Service đóng kết nối trước khi trả lời.")
+    return json.loads(line)
+
+
+def run_local(tool: str, argv: List[str]) -> int:
+    """Chạy công cụ như gọi python <tool>.py argv."""
+    sys.argv = [tool + ".py"] + argv
+    try:
+        runpy.run_module(tool, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in TOOLS + ("status", "stop"):
+        print(f"Dùng: image_client.py {{{'|'.join(TOOLS)}}} <đối số như công cụ gốc> | status | stop",
+              file=sys.stderr)
+        return 2
+    cmd, args = argv[0], argv[1:]
+    if cmd in ("status", "stop"):
+        try:
+            res = request({"op": "stats" if cmd == "status" else "shutdown"})
+        except OSError as e:
+            print(f"Service không chạy ({default_address()}): {e}", file=sys.stderr)
+            return 1
+        print(json.dumps(res, ensure_ascii=False, indent=2))
+        return 0
+    if cmd == "extract_image" and not args:
+        return run_local(cmd, args)  # không đối số = giao diện Tk
+    try:
+        res = request({"op": "run", "tool": cmd, "argv": args, "cwd": os.getcwd()})
+    except OSError:
+        return run_local(cmd, args)
+    if res.get("stdout"):
+        sys.stdout.write(res["stdout"])
+        sys.stdout.flush()
+    if res.get("stderr"):
+        sys.stderr.write(res["stderr"])
+    if not res.get("ok", False) and res.get("error"):
+        print(f"[LỖI] {res['error']}", file=sys.stderr)
+    return int(res.get("code", 1))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
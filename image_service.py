@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""Service giữ sẵn tiến trình cho img2json / extract_image.
+
+Mỗi lần gọi img2json.py tốn thời gian khởi động Python và nạp Pillow / NumPy,
+nhiều hơn cả thời gian chuyển một sprite nhỏ. Service chạy lâu dài với một pool
+tiến trình đã nạp sẵn module và decoder ảnh, nhận nhiều yêu cầu đồng thời và
+trả lại kết quả cũ khi đầu vào không đổi.
+
+    python image_service.py [--socket PATH | --socket 127.0.0.1:PORT] [-j N] [--cache-mb 64]
+    python image_service.py --stdio          (JSON theo dòng qua stdin / stdout)
+Client: image_client.py, cùng đối số với công cụ gốc.
+
+Giao thức — mỗi dòng một object JSON:
+  yêu cầu : {"id": 1, "op": "run", "tool": "img2json" | "extract_image",
+             "argv": [đối số dòng lệnh], "cwd": "thư mục của bên gọi"}
+            {"op": "ping"} | {"op": "stats"} | {"op": "shutdown"}
+  phản hồi: {"id": 1, "ok": true, "code": 0, "stdout": "...", "stderr": "...", "cached": false}
+Một kết nối gửi được nhiều yêu cầu liên tiếp; phản hồi về theo thứ tự xong
+trước, ghép với yêu cầu bằng "id".
+
+Cache: khóa = (công cụ, cwd, argv, kích thước + mtime mọi ảnh đầu vào sau khi
+mở rộng thư mục / glob). Trúng khi mọi file đầu ra vẫn đúng kích thước + mtime
+lúc ghi; đầu ra stdout được giữ trong bộ nhớ (tối đa --cache-mb). --force bỏ
+qua cache; yêu cầu trùng với một yêu cầu đang chạy thì chờ chung kết quả.
+Service chạy công cụ với cwd / -o do bên gọi gửi, tức ghi được file bất kỳ
+dưới quyền người chạy service, nên chỉ nghe cục bộ: Unix socket chỉ người tạo
+mở được (umask 077); host:port (cho nền tảng không có AF_UNIX) chỉ nhận địa
+chỉ loopback và mọi người dùng trên máy đều kết nối được.
+"""
+import argparse
+import importlib
+import io
+import ipaddress
+import json
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import redirect_stderr, redirect_stdout
+from typing import Any, BinaryIO, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from image_batch import SUMMARY_NAME, expand_inputs, is_batch_input, output_path
+from image_client import TOOLS, connect, default_address, encode, parse_address
+
+CACHE_MB = 64
+CACHE_ENTRIES = 10000
+
+FileStat = Tuple[str, int, int]  # (đường dẫn, kích thước, mtime_ns)
+Response = Dict[str, Any]
+
+
+def _stat(path: str) -> Optional[FileStat]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return path, st.st_size, st.st_mtime_ns
+
+
+# ---------- Worker ----------
+
+def _warm() -> None:
+    """Nạp trước module công cụ và mọi plugin decoder của Pillow."""
+    from PIL import Image
+    Image.init()
+    for tool in TOOLS:
+        importlib.import_module(tool)
+
+
+def run_tool(tool: str, argv: List[str], cwd: str) -> Tuple[int, str, str]:
+    """Chạy <tool>.main(argv) trong thư mục cwd như từ dòng lệnh -> (mã thoát, stdout, stderr).
+
+    Chạy ở tiến trình worker: mỗi worker làm một yêu cầu một lúc nên đổi cwd / sys.argv được.
+    """
+    module = importlib.import_module(tool)
+    out, err = io.StringIO(), io.StringIO()
+    os.chdir(cwd)
+    sys.argv = [tool + ".py"] + list(argv)
+    with redirect_stdout(out), redirect_stderr(err):
+        try:
+            code = module.main(argv) or 0
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            if isinstance(e.code, str):
+                print(e.code, file=sys.stderr)
+        except Exception:
+            traceback.print_exc()
+            code = 1
+    return code, out.getvalue(), err.getvalue()
+
+
+# ---------- Cache ----------
+
+class _ArgumentError(Exception):
+    pass
+
+
+def _argument_error(message: str) -> None:
+    raise _ArgumentError(message)
+
+
+class CachePlan(NamedTuple):
+    key: Optional[tuple]   # None: không cache (đối số sai, --help, đầu vào không có)
+    outputs: List[str]     # file đầu ra phải còn nguyên thì mới dùng lại kết quả
+    force: bool
+
+
+NO_CACHE = CachePlan(None, [], False)
+
+
+def cache_plan(tool: str, argv: List[str], cwd: str) -> CachePlan:
+    """Phân tích argv như công cụ (không chạy) để biết ảnh đầu vào và file đầu ra."""
+    if "-h" in argv or "--help" in argv:
+        return NO_CACHE
+    ap = importlib.import_module(tool).build_parser()
+    ap.error = _argument_error  # lỗi đối số để worker báo như dòng lệnh
+    try:
+        args = ap.parse_args(argv)
+    except _ArgumentError:
+        return NO_CACHE
+    inputs = [os.path.join(cwd, p) for p in (args.input if tool == "img2json" else args.inputs)]
+    try:
+        pairs = expand_inputs(inputs, args.recursive)
+    except (FileNotFoundError, OSError):
+        return NO_CACHE
+    stats = [_stat(src) for src, _ in pairs]
+    if not stats or None in stats:
+        return NO_CACHE
+    output = os.path.join(cwd, args.output) if args.output else None
+    if tool == "img2json" and not is_batch_input(inputs):
+        outputs = [output] if output else []
+    else:
+        ext = ".json" if tool == "img2json" else "." + args.format
+        outputs = [output_path(rel, output, ext, src) for src, rel in pairs]
+        summary = args.summary or (os.path.join(output, SUMMARY_NAME) if output else None)
+        if summary:
+            outputs.append(os.path.join(cwd, summary))
+    return CachePlan((tool, cwd, tuple(argv), tuple(stats)), outputs, bool(args.force))
+
+
+class ResultCache:
+    """LRU khóa -> (phản hồi, trạng thái file đầu ra), giới hạn theo số byte
+    stdout/stderr giữ lại và số mục. Không tự khóa: ImageService giữ lock."""
+
+    def __init__(self, max_bytes: int, max_entries: int = CACHE_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.bytes = 0
+        self._items: "OrderedDict[tuple, Tuple[Response, List[Optional[FileStat]], int]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: tuple) -> Optional[Response]:
+        hit = self._items.get(key)
+        if hit is None:
+            return None
+        res, outputs, _ = hit
+        if any(_stat(st[0]) != st for st in outputs):
+            self._drop(key)  # đầu ra bị sửa / xóa từ bên ngoài
+            return None
+        self._items.move_to_end(key)
+        return res
+
+    def put(self, key: tuple, res: Response, outputs: List[str]) -> None:
+        stats = [_stat(p) for p in outputs]
+        size = len(res.get("stdout", "")) + len(res.get("stderr", ""))
+        if None in stats or size > self.max_bytes:
+            return
+        if key in self._items:
+            self._drop(key)
+        self._items[key] = (res, stats, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes or len(self._items) > self.max_entries:
+            self._drop(next(iter(self._items)))
+
+    def _drop(self, key: tuple) -> None:
+        self.bytes -= self._items.pop(key)[2]
+
+
+# ---------- Service ----------
+
+def _done(res: Response) -> "Future[Response]":
+    fut: "Future[Response]" = Future()
+    fut.set_result(res)
+    return fut
+
+
+class ImageService:
+    def __init__(self, jobs: Optional[int] = None, cache_bytes: int = CACHE_MB << 20):
+        self.jobs = max(1, jobs or os.cpu_count() or 1)
+        self.cache = ResultCache(cache_bytes)
+        self.requests = 0
+        self.hits = 0
+        self.stopping = threading.Event()
+        self._inflight: Dict[tuple, "Future[Response]"] = {}
+        self._lock = threading.Lock()
+        # Khóa riêng cho pool: dựng lại pool mất vài giây, không giữ _lock (cache, stats)
+        self._pool_lock = threading.Lock()
+        self._closed = False
+        self._pool = self._start_pool()
+
+    def _start_pool(self) -> ProcessPoolExecutor:
+        pool = ProcessPoolExecutor(max_workers=self.jobs, initializer=_warm)
+        # Khởi động đủ worker ngay, trước yêu cầu đầu tiên
+        wait([pool.submit(_warm) for _ in range(self.jobs)])
+        return pool
+
+    def stats(self) -> Response:
+        with self._lock:
+            return {"ok": True, "jobs": self.jobs, "requests": self.requests, "hits": self.hits,
+                    "running": len(self._inflight), "cache_entries": len(self.cache),
+                    "cache_bytes": self.cache.bytes}
+
+    def submit(self, msg: Dict[str, Any]) -> "Future[Response]":
+        """Nhận một yêu cầu, trả Future của phản hồi (chưa có "id")."""
+        op = msg.get("op", "run")
+        if op == "ping":
+            return _done({"ok": True})
+        if op == "stats":
+            return _done(self.stats())
+        if op == "shutdown":
+            self.stopping.set()
+            return _done({"ok": True})
+        if op != "run":
+            return _done({"ok": False, "code": 2, "error": f"op không hỗ trợ: {op!r}"})
+        tool, argv, cwd = msg.get("tool"), msg.get("argv", []), msg.get("cwd") or os.getcwd()
+        if tool not in TOOLS:
+            return _done({"ok": False, "code": 2, "error": f"Công cụ không hỗ trợ: {tool!r}"})
+        if not isinstance(argv, list) or not all(isinstance(a, str) for a in argv):
+            return _done({"ok": False, "code": 2, "error": "argv phải là danh sách chuỗi"})
+        if not os.path.isdir(cwd):
+            return _done({"ok": False, "code": 2, "error": f"cwd không tồn tại: {cwd}"})
+
+        plan = cache_plan(tool, argv, cwd)
+        fut: "Future[Response]" = Future()
+        with self._lock:
+            self.requests += 1
+            if plan.key is not None:
+                hit = None if plan.force else self.cache.get(plan.key)
+                if hit is not None:
+                    self.hits += 1
+                    return _done(dict(hit, cached=True))
+                running = self._inflight.get(plan.key)
+                if running is not None:
+                    return running
+                self._inflight[plan.key] = fut
+        try:
+            work = self._submit_work(tool, argv, cwd)
+        except Exception as e:  # service đang đóng, dựng lại pool lỗi, ...
+            # Bỏ khỏi _inflight để yêu cầu trùng sau này không chờ một Future không bao giờ xong
+            if plan.key is not None:
+                with self._lock:
+                    self._inflight.pop(plan.key, None)
+            fut.set_result({"ok": False, "code": 1, "error": f"{type(e).__name__}: {e}"})
+            return fut
+        work.add_done_callback(lambda w: self._finish(w, fut, plan))
+        return fut
+
+    def _submit_work(self, tool: str, argv: List[str], cwd: str) -> Future:
+        pool = self._pool
+        try:
+            return pool.submit(run_tool, tool, argv, cwd)
+        except BrokenProcessPool:
+            pass
+        # Một worker chết (hết bộ nhớ, ...): dựng lại pool một lần dù nhiều thread
+        # cùng gặp, rồi thử lại
+        with self._pool_lock:
+            if self._closed:
+                raise RuntimeError("Service đang dừng")
+            if self._pool is pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._start_pool()
+            pool = self._pool
+        return pool.submit(run_tool, tool, argv, cwd)
+
+    def _finish(self, work: Future, fut: "Future[Response]", plan: CachePlan) -> None:
+        try:
+            code, out, err = work.result()
+            res: Response = {"ok": True, "code": code, "stdout": out, "stderr": err, "cached": False}
+        except Exception as e:
+            res = {"ok": False, "code": 1, "error": f"{type(e).__name__}: {e}"}
+        if plan.key is not None:
+            with self._lock:
+                self._inflight.pop(plan.key, None)
+                if res["ok"] and res["code"] == 0:
+                    self.cache.put(plan.key, res, plan.outputs)
+        fut.set_result(res)
+
+    def close(self) -> None:
+        with self._pool_lock:
+            self._closed = True
+            pool = self._pool
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+# ---------- Kênh truyền ----------
+
+def serve_stream(service: ImageService, rfile: BinaryIO, write: Callable[[bytes], Any]) -> None:
+    """Đọc yêu cầu theo dòng từ rfile, gửi phản hồi qua write khi từng yêu cầu xong.
+
+    Một thread riêng ghi phản hồi để worker chậm đọc không giữ thread của pool.
+    """
+    out: "queue.Queue[Optional[bytes]]" = queue.Queue()
+    broken = threading.Event()
+
+    def writer() -> None:
+        while True:
+            data = out.get()
+            if data is None:
+                return
+            if broken.is_set():
+                continue
+            try:
+                write(data)
+            except OSError:
+                broken.set()  # bên gọi đã đóng kết nối
+
+    def reply(msg_id: Any, fut: "Future[Response]") -> None:
+        out.put(encode(dict(fut.result(), id=msg_id)))
+
+    thread = threading.Thread(target=writer, name="service-writer", daemon=True)
+    thread.start()
+    pending = []
+    try:
+        for line in rfile:
+            if not line.strip():
+                continue
+            try:
+                msg = json.loads(line)
+                if not isinstance(msg, dict):
+                    raise ValueError("yêu cầu phải là object JSON")
+            except ValueError as e:
+                out.put(encode({"id": None, "ok": False, "code": 2, "error": f"JSON không hợp lệ: {e}"}))
+                continue
+            fut = service.submit(msg)
+            fut.add_done_callback(lambda f, msg_id=msg.get("id"): reply(msg_id, f))
+            pending.append(fut)
+            if service.stopping.is_set():
+                break
+        wait(pending)
+    finally:
+        out.put(None)
+        thread.join()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        serve_stream(self.server.service, self.rfile, self.wfile.write)
+
+
+def _is_loopback(host: str) -> bool:
+    """Mọi địa chỉ của host đều là loopback (127.0.0.0/8, ::1)."""
+    try:
+        infos = socket.getaddrinfo(host, None)
+    except OSError:
+        return False
+    return bool(infos) and all(
+        ipaddress.ip_address(str(info[4][0]).split("%")[0]).is_loopback for info in infos)
+
+
+def serve_socket(service: ImageService, addr: str) -> None:
+    target = parse_address(addr)
+    if isinstance(target, tuple):
+        if not _is_loopback(target[0]):
+            raise SystemExit(f"Chỉ nghe trên địa chỉ loopback (vd. 127.0.0.1:PORT), không phải {addr}: "
+                             "service không xác thực, ai kết nối được đều ghi được file.")
+        class Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+        server = Server(target, _Handler)
+    else:
+        if os.path.exists(target):
+            try:
+                connect(addr, timeout=0.5).close()
+            except OSError:
+                os.unlink(target)  # socket cũ của service đã dừng
+            else:
+                raise SystemExit(f"Service đã chạy tại {addr}")
+
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+        old = os.umask(0o077)
+        try:
+            server = Server(target, _Handler)
+        finally:
+            os.umask(old)
+    server.service = service
+
+    def stop() -> None:
+        service.stopping.wait()
+        server.shutdown()
+
+    threading.Thread(target=stop, name="service-stop", daemon=True).start()
+    print(f"[SERVICE] đang nghe tại {addr} ({service.jobs} worker)", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if not isinstance(target, tuple) and os.path.exists(target):
+            os.unlink(target)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Service giữ sẵn tiến trình cho img2json / extract_image.")
+    ap.add_argument("--socket", default=None,
+                    help="Đường dẫn Unix socket, hoặc 127.0.0.1:PORT / localhost:PORT — chỉ nhận "
+                         f"địa chỉ loopback (mặc định: {default_address()})")
+    ap.add_argument("--stdio", action="store_true",
+                    help="Nhận yêu cầu JSON theo dòng từ stdin, trả lời ra stdout thay vì socket")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                    help="Số tiến trình worker (số yêu cầu chạy đồng thời)")
+    ap.add_argument("--cache-mb", type=float, default=CACHE_MB,
+                    help="Bộ nhớ tối đa giữ đầu ra stdout của các yêu cầu đã chạy")
+    args = ap.parse_args(argv)
+
+    proto = None
+    if args.stdio:
+        # fd 1 chỉ dùng cho phản hồi: print (kể cả của worker) chuyển sang stderr.
+        # Phải làm trước khi tạo pool để worker thừa kế.
+        proto = os.fdopen(os.dup(sys.stdout.fileno()), "wb", buffering=0)
+        sys.stdout.flush()
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    service = ImageService(args.jobs, int(args.cache_mb * (1 << 20)))
+    try:
+        if proto is not None:
+            serve_stream(service, sys.stdin.buffer, proto.write)
+        else:
+            serve_socket(service, args.socket or default_address())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
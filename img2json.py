@@ -1,53 +1,250 @@
 #!/usr/bin/env python3
 # img2json.py
-# pip install pillow
+# pip install pillow numpy
 
-import argparse, json, sys
+import argparse, json, os, sys
 from PIL import Image
+import numpy as np
+
+from image_batch import (SUMMARY_NAME, expand_inputs, is_batch_input, output_path, print_row,
+                         run_batch, summarize, write_summary)
+
+STRIP_ROWS = 256  # số hàng ảnh chuyển sang NumPy mỗi lần
+RLE_FORMAT = "palette-rle"
+
+# Bảng tra: byte -> 2 ký tự hex in hoa (ASCII)
+HEX_LUT = np.array([list(f"{i:02X}".encode()) for i in range(256)], dtype=np.uint8)
 
 def rgba_to_hex(r, g, b, a=None, keep_alpha=False):
     if keep_alpha:
         return f"#{r:02X}{g:02X}{b:02X}{a:02X}"
     return f"#{r:02X}{g:02X}{b:02X}"
 
+def iter_rgba_strips(im, strip_rows=STRIP_ROWS):
+    """Duyệt ảnh RGBA theo dải hàng -> mảng (S, W, 4) uint8."""
+    w, h = im.size
+    for y0 in range(0, h, strip_rows):
+        y1 = min(y0 + strip_rows, h)
+        yield np.asarray(im.crop((0, y0, w, y1)), dtype=np.uint8).reshape(y1 - y0, w, 4)
+
+def hex_tokens(arr, keep_alpha=False, quoted=False):
+    """(…, 4) uint8 -> mảng bytes '#RRGGBB' / '#RRGGBBAA' (có thể kèm dấu ") qua HEX_LUT."""
+    nch = 4 if keep_alpha else 3
+    q = 1 if quoted else 0
+    L = 1 + 2 * nch + 2 * q
+    out = np.empty(arr.shape[:-1] + (L,), dtype=np.uint8)
+    if quoted:
+        out[..., 0] = out[..., -1] = ord('"')
+    out[..., q] = ord("#")
+    for ch in range(nch):
+        out[..., q + 1 + 2 * ch: q + 3 + 2 * ch] = HEX_LUT[arr[..., ch]]
+    return out.view(f"S{L}")[..., 0]
+
 def image_to_hex_grid(path, keep_alpha=False, transparent_as_null=False):
     im = Image.open(path).convert("RGBA")  # đảm bảo có alpha để xử lý minh bạch
+
+    grid = []
+    for strip in iter_rgba_strips(im):
+        toks = hex_tokens(strip, keep_alpha=keep_alpha).astype("U")
+        if transparent_as_null:
+            toks = np.where(strip[..., 3] == 0, None, toks.astype(object))  # null trong JSON
+        grid.extend(toks.tolist())
+    return grid
+
+def write_json_grid(im, f, keep_alpha=False, transparent_as_null=False, indent=None):
+    """Ghi lưới hex của ảnh ra f (file text) từng hàng một.
+
+    Kết quả giống hệt json.dump(image_to_hex_grid(...), f, ensure_ascii=False, indent=indent)
+    nhưng chỉ giữ một dải hàng trong bộ nhớ.
+    """
     w, h = im.size
-    px = im.load()
+    if indent is None:
+        open_row, item_sep, close_row, row_sep, close_grid = "[", ", ", "]", ", ", "]"
+    else:
+        ind1 = "\n" + " " * indent
+        ind2 = ind1 + " " * indent
+        open_row, item_sep, close_row = ind1 + "[" + ind2, "," + ind2, ind1 + "]"
+        row_sep, close_grid = ",", "\n]"
+    if h == 0:
+        f.write("[]")
+        return
+    item_sep_b = item_sep.encode()
 
+    f.write("[")
+    first = True
+    for strip in iter_rgba_strips(im):
+        toks = hex_tokens(strip, keep_alpha=keep_alpha, quoted=True)
+        if transparent_as_null:
+            toks = np.where(strip[..., 3] == 0, b"null", toks)
+        for row in toks:
+            if not first:
+                f.write(row_sep)
+            first = False
+            if w == 0:
+                f.write((ind1 if indent is not None else "") + "[]")
+                continue
+            f.write(open_row)
+            f.write(item_sep_b.join(row.tolist()).decode("ascii"))
+            f.write(close_row)
+    f.write(close_grid)
+
+# ---------------------------
+# Palette + run-length
+# ---------------------------
+# {"format": "palette-rle", "width": W, "height": H,
+#  "palette": ["#RRGGBB" | "#RRGGBBAA" | null, ...],
+#  "rows": [[idx, len, idx, len, ...], ...]}
+# Mỗi hàng là dãy cặp (chỉ số palette, độ dài run) theo chiều ngang.
+
+def _palette_keys(strip, keep_alpha=False, transparent_as_null=False):
+    """Khóa màu int64 của từng pixel: RGB(A) đóng gói, -1 = null (alpha=0)."""
+    s = strip.astype(np.int64)
+    keys = (s[..., 0] << 16) | (s[..., 1] << 8) | s[..., 2]
+    if keep_alpha:
+        keys = (keys << 8) | s[..., 3]
+    if transparent_as_null:
+        keys[strip[..., 3] == 0] = -1
+    return keys
+
+def _key_to_hex(key, keep_alpha=False):
+    if key < 0:
+        return None
+    return f"#{key:08X}" if keep_alpha else f"#{key:06X}"
+
+def write_rle(im, f, keep_alpha=False, transparent_as_null=False):
+    """Ghi ảnh ở dạng palette + run-length theo hàng (2 lượt qua ảnh, từng dải hàng)."""
+    w, h = im.size
+    keys = np.unique(np.concatenate(
+        [np.unique(_palette_keys(strip, keep_alpha, transparent_as_null))
+         for strip in iter_rgba_strips(im)] or [np.empty(0, np.int64)]))
+    palette = [_key_to_hex(int(k), keep_alpha) for k in keys]
+
+    f.write(f'{{"format": "{RLE_FORMAT}", "width": {w}, "height": {h},\n')
+    f.write(f'"palette": {json.dumps(palette, ensure_ascii=False)},\n')
+    f.write('"rows": [')
+    first = True
+    for strip in iter_rgba_strips(im):
+        idx = np.searchsorted(keys, _palette_keys(strip, keep_alpha, transparent_as_null))
+        starts = np.ones(idx.shape, dtype=bool)
+        starts[:, 1:] = idx[:, 1:] != idx[:, :-1]
+        flat_starts = np.flatnonzero(starts)
+        values = idx.ravel()[flat_starts]
+        lengths = np.diff(np.append(flat_starts, idx.size))
+        pairs = np.column_stack((values, lengths))
+        for row_pairs in np.split(pairs, np.cumsum(starts.sum(axis=1))[:-1]):
+            f.write("\n" if first else ",\n")
+            first = False
+            f.write("[" + ",".join(map(str, row_pairs.ravel().tolist())) + "]")
+    f.write("\n]}" if not first else "]}")
+
+def rle_to_hex_grid(doc):
+    """Giải dạng palette-rle (dict đã json.load) về lưới 2D như image_to_hex_grid."""
+    if doc.get("format") != RLE_FORMAT:
+        raise ValueError(f"Không phải định dạng {RLE_FORMAT}.")
+    palette = np.array(doc["palette"] + [None], dtype=object)[:-1]
     grid = []
-    for y in range(h):
-        row = []
-        for x in range(w):
-            r, g, b, a = px[x, y]
-            if transparent_as_null and a == 0:
-                row.append(None)  # sẽ serialize thành null trong JSON
-            else:
-                row.append(rgba_to_hex(r, g, b, a, keep_alpha=keep_alpha))
-        grid.append(row)
+    for row in doc["rows"]:
+        pairs = np.asarray(row, dtype=np.int64).reshape(-1, 2)
+        grid.append(palette[np.repeat(pairs[:, 0], pairs[:, 1])].tolist())
     return grid
 
-def main():
+def load_rle(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return rle_to_hex_grid(json.load(f))
+
+def write_image(im, f, fmt="grid", keep_alpha=False, transparent_as_null=False, indent=0):
+    # Ghi từng hàng, không dựng cả lưới trong bộ nhớ
+    if fmt == "rle":
+        write_rle(im, f, keep_alpha=keep_alpha, transparent_as_null=transparent_as_null)
+    else:
+        write_json_grid(im, f, keep_alpha=keep_alpha,
+                        transparent_as_null=transparent_as_null, indent=indent)
+
+def image_stats(im, keep_alpha=False):
+    """(số pixel alpha > 0, số màu khác nhau trong các pixel đó) — theo từng dải hàng."""
+    kept = 0
+    keys = []
+    for strip in iter_rgba_strips(im):
+        kept += int(np.count_nonzero(strip[..., 3]))
+        k = np.unique(_palette_keys(strip, keep_alpha, transparent_as_null=True))
+        keys.append(k[k >= 0])
+    return kept, int(np.unique(np.concatenate(keys or [np.empty(0, np.int64)])).size)
+
+def convert_file(src, dst, fmt="grid", keep_alpha=False, transparent_as_null=False, indent=0):
+    """Worker batch: ảnh src -> file JSON dst (ghi file tạm rồi đổi tên) -> (pixel giữ lại, số màu)."""
+    im = Image.open(src).convert("RGBA")
+    tmp = dst + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            write_image(im, f, fmt, keep_alpha, transparent_as_null, indent)
+        os.replace(tmp, dst)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return image_stats(im, keep_alpha)
+
+def build_parser():
     ap = argparse.ArgumentParser(description="Convert image to JSON 2D array of hex colors.")
-    ap.add_argument("input", help="Đường dẫn ảnh (png/jpg/bmp/gif, ...)")
-    ap.add_argument("-o", "--output", help="File JSON xuất ra (mặc định: stdout)")
+    ap.add_argument("input", nargs="+",
+                    help="Đường dẫn ảnh (png/jpg/bmp/gif, ...); nhiều ảnh, thư mục hoặc glob "
+                         "(\"sprites/**/*.png\") thì chạy batch")
+    ap.add_argument("-o", "--output",
+                    help="File JSON xuất ra (mặc định: stdout); batch: thư mục đầu ra "
+                         "(mặc định: cạnh từng ảnh)")
     ap.add_argument("--keep-alpha", action="store_true",
                     help="Giữ alpha và xuất dạng #RRGGBBAA (mặc định chỉ #RRGGBB).")
     ap.add_argument("--transparent-as-null", action="store_true",
                     help="Nếu pixel alpha=0 thì ghi null thay vì mã hex.")
     ap.add_argument("--indent", type=int, default=0,
                     help="Số space để pretty-print JSON (0 = compact).")
-    args = ap.parse_args()
+    ap.add_argument("--format", choices=["grid", "rle"], default="grid",
+                    help="grid: mảng 2D mã hex (mặc định); rle: palette + run-length theo hàng "
+                         "(bỏ qua --indent, giải lại bằng rle_to_hex_grid).")
+    batch = ap.add_argument_group("batch")
+    batch.add_argument("-r", "--recursive", action="store_true",
+                       help="Duyệt cả thư mục con của thư mục đầu vào")
+    batch.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                       help="Số tiến trình song song")
+    batch.add_argument("--force", action="store_true",
+                       help="Xử lý lại cả ảnh có file JSON mới hơn nguồn")
+    batch.add_argument("--summary", default=None,
+                       help=f"File tóm tắt .csv / .json (mặc định: <thư mục đầu ra>/{SUMMARY_NAME})")
+    return ap
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
 
-    grid = image_to_hex_grid(args.input,
-                             keep_alpha=args.keep_alpha,
-                             transparent_as_null=args.transparent_as_null)
+    if is_batch_input(args.input):
+        sys.exit(run_batch_cli(args))
+
+    im = Image.open(args.input[0]).convert("RGBA")
+
+    def write(f):
+        write_image(im, f, args.format, args.keep_alpha, args.transparent_as_null, args.indent)
 
     if args.output:
         with open(args.output, "w", encoding="utf-8") as f:
-            json.dump(grid, f, ensure_ascii=False, indent=args.indent)
+            write(f)
     else:
-        json.dump(grid, sys.stdout, ensure_ascii=False, indent=args.indent)
+        write(sys.stdout)
+
+def run_batch_cli(args):
+    try:
+        pairs = expand_inputs(args.input, args.recursive)
+    except FileNotFoundError as e:
+        print(f"[LỖI] {e}", file=sys.stderr)
+        return 1
+    jobs = [(src, output_path(rel, args.output, ".json", src)) for src, rel in pairs]
+    options = {"fmt": args.format, "keep_alpha": args.keep_alpha,
+               "transparent_as_null": args.transparent_as_null, "indent": args.indent}
+    rows = run_batch(jobs, convert_file, options, args.jobs, args.force, print_row)
+    summary = args.summary or (os.path.join(args.output, SUMMARY_NAME) if args.output else None)
+    if summary and rows:
+        os.makedirs(os.path.dirname(summary) or ".", exist_ok=True)
+        write_summary(summary, rows)
+    print(summarize(rows) + (f" — tóm tắt: {summary}" if summary and rows else ""))
+    return 1 if any(r.status == "error" for r in rows) else 0
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,635 @@
+"""Đọc/ghi file layer dùng chung cho extract_image và auto_snapshot.
+
+Định dạng text (.txt):
+    <số màu>
+    #RRGGBB N (r,c) (r,c1-c2) ...
+    ...
+N là số điểm. "(r,c1-c2)" là đoạn liên tiếp trên hàng r: (r,c1) (r,c1+1) ... (r,c2)
+theo đúng thứ tự đó (c2 < c1 thì đi lùi). Khi ghi, mọi dãy điểm liền nhau
+cùng hàng, cột tăng 1 được gộp thành đoạn; file cũ chỉ có "(r,c)" vẫn đọc được.
+
+Định dạng nhị phân (.apl), little-endian, mỗi phần căn lề 8 byte:
+    header   : magic "APLY", version, kích thước phần tử rows/cols/index, K, N
+    palette  : (K,)   uint32  0xRRGGBB của từng dòng màu
+    offsets  : (K+1,) int64   nhóm i = điểm [offsets[i], offsets[i+1])
+    rows     : (N,)   uint16|uint32  (1-based)
+    cols     : (N,)   uint16|uint32  (1-based)
+    index    : (N,)   uint8|uint16|uint32  chỉ số màu của từng điểm
+Thứ tự điểm giữ nguyên thứ tự trong file text, nên đọc bằng np.memmap là
+dùng được ngay, không cần parse.
+"""
+import argparse
+import os
+import re
+import struct
+from collections import OrderedDict
+from typing import BinaryIO, Callable, List, Optional, Tuple
+import numpy as np
+
+from color_groups import ColorGroups, empty_groups
+
+WRITE_CHUNK = 1 << 16          # số điểm được định dạng mỗi lần
+WRITE_BUFFER = 1 << 20         # buffer của file khi ghi
+READ_BLOCK = 1 << 22           # kích thước block khi đọc file text
+LOAD_CACHE_SIZE = 8            # số file layer giữ trong cache
+NEWLINE = os.linesep.encode()  # giống file mở ở chế độ text ("w")
+
+COLOR_LINE_RE = re.compile(r'^\s*(#[0-9A-Fa-f]{6})\s+(\d+)\s+(.*)$')
+COORD_RE = re.compile(r'\(\s*(\d+)\s*,\s*(\d+)\s*\)')
+SPAN_RE = re.compile(r'\(\s*(\d+)\s*,\s*(\d+)\s*(?:-\s*(\d+)\s*)?\)')  # "(r,c)" hoặc "(r,c1-c2)"
+
+BIN_MAGIC = b"APLY"
+BIN_VERSION = 1
+BIN_EXT = ".apl"
+_BIN_HEADER = struct.Struct("<4sHBBBxxxIQ")  # 24 byte
+
+_POW10 = 10 ** np.arange(19, dtype=np.int64)
+
+
+def _num_digits(v: np.ndarray) -> np.ndarray:
+    """Số chữ số thập phân của từng phần tử (v >= 0)."""
+    return np.searchsorted(_POW10, v, side="right").clip(min=1)
+
+
+def find_spans(rows: np.ndarray, cols: np.ndarray,
+               breaks: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Gộp các điểm liền nhau cùng hàng, cột tăng 1 (giữ thứ tự).
+
+    breaks: chỉ số điểm bắt buộc mở đoạn mới (đầu mỗi nhóm màu).
+    -> (r, c1, c2, chỉ số điểm đầu) của từng đoạn.
+    """
+    r = rows.astype(np.int64)
+    c = cols.astype(np.int64)
+    brk = np.ones(r.shape[0], dtype=bool)
+    brk[1:] = (r[1:] != r[:-1]) | (c[1:] != c[:-1] + 1)
+    if breaks is not None:
+        brk[breaks[breaks < r.shape[0]]] = True
+    first = np.flatnonzero(brk)
+    last = np.append(first[1:], r.shape[0]) - 1
+    return r[first], c[first], c[last], first
+
+
+def _format_tokens(r: np.ndarray, c: np.ndarray, c2: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Các token "(r,c) " / "(r,c1-c2) " nối liền -> (buffer uint8, vị trí đầu của từng token)."""
+    dr = _num_digits(r)
+    dc = _num_digits(c)
+    is_span = c2 != c
+    dc2 = np.where(is_span, _num_digits(c2), 0)
+    tok = dr + dc + 4 + is_span + dc2      # "(" r "," c ["-" c2] ")" " "
+    ends = np.cumsum(tok)
+    starts = ends - tok
+    buf = np.empty(int(ends[-1]), dtype=np.uint8)
+    buf[starts] = ord("(")
+    _fill_number(buf, starts + 1, r, dr)
+    buf[starts + 1 + dr] = ord(",")
+    _fill_number(buf, starts + 2 + dr, c, dc)
+    if is_span.any():
+        s0 = (starts + 2 + dr + dc)[is_span]
+        buf[s0] = ord("-")
+        _fill_number(buf, s0 + 1, c2[is_span], dc2[is_span])
+    buf[ends - 2] = ord(")")
+    buf[ends - 1] = ord(" ")
+    return buf, starts
+
+
+def format_coords(rows: np.ndarray, cols: np.ndarray, spans: bool = False) -> bytes:
+    """Định dạng "(r,c) (r,c) ... (r,c)" (không có dấu cách cuối) bằng NumPy.
+    spans=True: các dãy điểm liền nhau trên một hàng được ghi thành "(r,c1-c2)"."""
+    if rows.shape[0] == 0:
+        return b""
+    if spans:
+        r, c, c2, _ = find_spans(rows, cols)
+    else:
+        r, c = rows.astype(np.int64), cols.astype(np.int64)
+        c2 = c
+    buf, _ = _format_tokens(r, c, c2)
+    return buf[:-1].tobytes()
+
+
+def _fill_number(buf: np.ndarray, start: np.ndarray, v: np.ndarray, nd: np.ndarray) -> None:
+    """Ghi v (nd chữ số) vào buf bắt đầu từ start, chữ số cao nhất trước."""
+    v = v.copy()
+    pos = start + nd - 1
+    for k in range(int(nd.max())):
+        m = nd > k
+        buf[pos[m] - k] = (v[m] % 10) + 48
+        v //= 10
+
+
+def _format_batch(groups: ColorGroups, i: int, j: int, spans: bool) -> bytes:
+    """Các dòng màu i..j-1 (tổng số điểm nhỏ) định dạng chung một lượt NumPy."""
+    off = groups.offsets
+    a, b = int(off[i]), int(off[j])
+    heads = off[i:j] - a                 # điểm đầu của từng nhóm trong lô
+    if b > a:
+        rows, cols = groups.rows[a:b], groups.cols[a:b]
+        if spans:
+            r, c, c2, first = find_spans(rows, cols, heads)
+        else:
+            r, c = rows.astype(np.int64), cols.astype(np.int64)
+            c2, first = c, np.arange(b - a)
+        buf, starts = _format_tokens(r, c, c2)
+        # Byte đầu của từng nhóm (nhóm rỗng: trùng nhóm sau); nhóm kết thúc trước dấu cách cuối
+        pos = np.append(starts, buf.shape[0])[np.searchsorted(first, np.append(heads, b - a))]
+        data = buf.tobytes()
+    else:
+        pos, data = np.zeros(j - i + 1, dtype=np.int64), b""
+    pos = pos.tolist()
+    parts = []
+    for k in range(j - i):
+        parts.append(f"{groups.hex(i + k)} {int(off[i + k + 1] - off[i + k])} ".encode())
+        parts.append(data[pos[k]:max(pos[k], pos[k + 1] - 1)])
+        parts.append(NEWLINE)
+    return b"".join(parts)
+
+
+def write_groups_txt(f: BinaryIO, groups: ColorGroups, chunk: int = WRITE_CHUNK,
+                     progress: Optional[Callable[[int, int], None]] = None,
+                     spans: bool = True, header: bool = True) -> None:
+    """Ghi groups theo định dạng text vào file nhị phân f, từng đoạn chunk điểm.
+
+    Bộ nhớ tạm chỉ tỉ lệ với chunk, không phụ thuộc số pixel của một màu.
+    Các màu nhỏ liền nhau được định dạng chung thành lô tối đa chunk điểm,
+    để ảnh hàng chục nghìn màu không tốn một lượt NumPy cho mỗi màu.
+    progress(số điểm đã ghi, tổng số điểm) được gọi sau mỗi đoạn.
+    spans=False: chỉ ghi "(r,c)" (cho chương trình đọc cũ).
+    header=False: không ghi dòng số màu (khi ghi nối tiếp nhiều phần của một file).
+    """
+    total = groups.num_pixels
+    off = groups.offsets
+    K = groups.num_colors
+    if header:
+        f.write(str(K).encode() + NEWLINE)
+    i = 0
+    while i < K:
+        n = int(off[i + 1] - off[i])
+        if n < chunk:
+            # Lô các màu i..j-1 có tổng số điểm <= chunk
+            j = max(i + 1, int(np.searchsorted(off, off[i] + chunk, side="right")) - 1)
+            f.write(_format_batch(groups, i, j, spans))
+            i = j
+            if progress is not None:
+                progress(int(off[i]), total)
+        else:
+            rows, cols = groups.group(i)
+            f.write(f"{groups.hex(i)} {n} ".encode())
+            for a in range(0, n, chunk):
+                if a:
+                    f.write(b" ")
+                f.write(format_coords(rows[a:a + chunk], cols[a:a + chunk], spans))
+                if progress is not None:
+                    progress(int(off[i]) + min(a + chunk, n), total)
+            f.write(NEWLINE)
+            i += 1
+
+
+def save_groups_txt(path: str, groups: ColorGroups,
+                    progress: Optional[Callable[[int, int], None]] = None,
+                    spans: bool = True) -> None:
+    """Ghi ra file tạm rồi đổi tên: nếu bị hủy/lỗi giữa chừng, file đích không bị hỏng."""
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "wb", buffering=WRITE_BUFFER) as f:
+            write_groups_txt(f, groups, progress=progress, spans=spans)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+_WS = b" \t\r\n\x0b\x0c"
+_COLOR_LINE_RE_B = re.compile(COLOR_LINE_RE.pattern.encode())
+_SPAN_RE_B = re.compile(SPAN_RE.pattern.encode())
+
+# Bảng phân loại byte cho phần tọa độ: 0 = khoảng trắng, 1 = chữ số,
+# 2..5 = "(" "," ")" "-" ; 9 = ký tự lạ (phải dùng regex)
+_BYTE_KIND = np.full(256, 9, dtype=np.uint8)
+_BYTE_KIND[list(_WS)] = 0
+_BYTE_KIND[ord("0"):ord("9") + 1] = 1
+_BYTE_KIND[ord("(")] = 2
+_BYTE_KIND[ord(",")] = 3
+_BYTE_KIND[ord(")")] = 4
+_BYTE_KIND[ord("-")] = 5
+_COORD_PATTERN = np.array([2, 1, 3, 1, 4], dtype=np.uint8)  # "(" số "," số ")"
+_COORD_TAIL = _COORD_PATTERN[1:]
+_SPAN_TAIL = np.array([1, 3, 1, 5, 1, 4], dtype=np.uint8)  # sau "(": số "," số "-" số ")"
+
+
+def expand_spans(r: np.ndarray, c1: np.ndarray, c2: np.ndarray) -> np.ndarray:
+    """Các đoạn (r, c1, c2) -> mảng điểm (n, 2) int64, theo thứ tự."""
+    step = np.where(c2 >= c1, 1, -1)
+    lengths = np.abs(c2 - c1) + 1
+    first = np.cumsum(lengths) - lengths
+    k = np.arange(int(lengths.sum()), dtype=np.int64) - np.repeat(first, lengths)
+    out = np.empty((k.shape[0], 2), dtype=np.int64)
+    out[:, 0] = np.repeat(r, lengths)
+    out[:, 1] = np.repeat(c1, lengths) + k * np.repeat(step, lengths)
+    return out
+
+
+def _span_layout(kinds: np.ndarray) -> Optional[np.ndarray]:
+    """Số các số (2 hoặc 3) trong từng token "(...)" nếu chuỗi token có đoạn và đúng định dạng."""
+    opens = np.flatnonzero(kinds == 2)
+    if opens.size == 0 or opens[0] != 0:
+        return None
+    lengths = np.diff(np.append(opens, kinds.size))
+    for n, tail in ((5, _COORD_TAIL), (7, _SPAN_TAIL)):
+        at = opens[lengths == n]
+        if at.size and not (kinds[at[:, None] + np.arange(1, n)] == tail).all():
+            return None
+    if not ((lengths == 5) | (lengths == 7)).all():
+        return None
+    return (lengths - 1) // 2
+
+
+def _parse_coords_re(data: bytes) -> np.ndarray:
+    found = _SPAN_RE_B.findall(data)
+    if not found:
+        return np.empty((0, 2), dtype=np.int64)
+    r = np.array([int(m[0]) for m in found], dtype=np.int64)
+    c1 = np.array([int(m[1]) for m in found], dtype=np.int64)
+    c2 = np.array([int(m[2] or m[1]) for m in found], dtype=np.int64)
+    return expand_spans(r, c1, c2)
+
+
+def _parse_tokens(data: bytes):
+    """Phân tích "(r,c) (r,c1-c2) ..." hoàn toàn bằng NumPy.
+
+    -> (điểm (n, 2) int64, vị trí byte "(" và ")" của từng token, số điểm của từng token),
+    hoặc None nếu có ký tự lạ / sai định dạng (phải dùng regex).
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    kind = _BYTE_KIND[buf]
+    is_digit = kind == 1
+    run_start = is_digit.copy()
+    run_start[1:] &= ~is_digit[:-1]
+    # Chuỗi token (bỏ khoảng trắng, mỗi dãy chữ số tính là một token)
+    tok = (kind > 1) | run_start
+    kinds = kind[tok]
+    nums = None  # None: chỉ có "(r,c)" — trường hợp thường gặp, kiểm tra rẻ nhất
+    if not (kinds.size % 5 == 0 and (kinds.reshape(-1, 5) == _COORD_PATTERN).all()):
+        if (kinds == 9).any():
+            return None
+        nums = _span_layout(kinds)
+        if nums is None:
+            return None
+    opens, closes = np.flatnonzero(kind == 2), np.flatnonzero(kind == 4)
+    starts = np.flatnonzero(run_start)
+    if starts.size == 0:
+        return np.empty((0, 2), dtype=np.int64), opens, closes, np.empty(0, dtype=np.int64)
+    # Giá trị mỗi dãy chữ số: tổng d * 10^k theo từng dãy
+    run_last = is_digit.copy()
+    run_last[:-1] &= ~is_digit[1:]
+    ends = np.flatnonzero(run_last)
+    digit_pos = np.flatnonzero(is_digit)
+    run_id = np.cumsum(run_start)[digit_pos] - 1
+    terms = (buf[digit_pos] - 48).astype(np.int64) * _POW10[ends[run_id] - digit_pos]
+    values = np.add.reduceat(terms, np.searchsorted(digit_pos, starts))
+    if nums is None:
+        return values.reshape(-1, 2), opens, closes, np.ones(opens.shape[0], dtype=np.int64)
+    # Token thứ i bắt đầu ở số thứ first[i]: 2 số cho "(r,c)", 3 số cho "(r,c1-c2)"
+    first = np.cumsum(nums) - nums
+    c1 = values[first + 1]
+    c2 = c1.copy()
+    span = nums == 3
+    c2[span] = values[first[span] + 2]
+    return expand_spans(values[first], c1, c2), opens, closes, np.abs(c2 - c1) + 1
+
+
+def parse_coords(data: bytes) -> np.ndarray:
+    """Lấy các điểm từ đoạn "(r,c) (r,c1-c2) ..." -> mảng (n, 2) int64 (đoạn đã được mở rộng).
+
+    Đoạn đúng định dạng được xử lý hoàn toàn bằng NumPy; đoạn có ký tự lạ
+    thì quay về SPAN_RE (cùng kết quả với findall).
+    """
+    parsed = _parse_tokens(data)
+    return _parse_coords_re(data) if parsed is None else parsed[0]
+
+
+def parse_coords_segments(segments: List[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+    """parse_coords cho nhiều đoạn cùng lúc -> (điểm (n, 2) nối theo thứ tự, số điểm của từng đoạn).
+
+    Ghép các đoạn rồi phân tích một lượt; token không được vắt qua hai đoạn.
+    Có đoạn sai định dạng thì phân tích riêng từng đoạn (cùng kết quả với parse_coords).
+    """
+    if not segments:
+        return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.int64)
+    parsed = _parse_tokens(b" ".join(segments))
+    if parsed is not None:
+        points, opens, closes, tok_points = parsed
+        size = np.array([len(d) + 1 for d in segments], dtype=np.int64)  # kể cả dấu cách nối
+        seg_start = np.cumsum(size) - size
+        seg = np.searchsorted(seg_start, opens, side="right") - 1
+        if np.array_equal(seg, np.searchsorted(seg_start, closes, side="right") - 1):
+            return points, np.bincount(seg, weights=tok_points, minlength=len(segments)).astype(np.int64)
+    parts = [parse_coords(d) for d in segments]
+    return np.concatenate(parts), np.array([p.shape[0] for p in parts], dtype=np.int64)
+
+
+def _cut_point(block: bytes) -> int:
+    """Vị trí cắt an toàn trong block: sau ")" hoặc xuống dòng cuối cùng."""
+    return max(block.rfind(b")"), block.rfind(b"\n")) + 1
+
+
+def load_groups_txt(path: str, block_size: int = READ_BLOCK) -> ColorGroups:
+    """Đọc file text thành ColorGroups trong một lượt, theo từng block.
+
+    Cho ra cả thứ tự điểm (rows/cols) lẫn các nhóm màu (offsets) cùng lúc.
+    Không giữ toàn bộ dòng trong bộ nhớ: dòng dài được cắt ở sau dấu ")".
+    Dòng không rỗng đầu tiên là tiêu đề nên bị bỏ; dòng không khớp
+    COLOR_LINE_RE cũng bị bỏ. Mỗi dòng màu là một nhóm (màu trùng không
+    gộp), điểm giữ đúng thứ tự trong file.
+    Tọa độ của mọi dòng trong một block được phân tích chung một lượt
+    (parse_coords_segments), nên file nhiều màu ít điểm không chậm theo số dòng.
+    """
+    colors: list = []
+    row_parts: list = []
+    col_parts: list = []
+    count_parts: list = []   # số điểm của từng đoạn
+    line_parts: list = []    # dòng màu (chỉ số trong colors) của từng đoạn
+    segments: list = []      # các đoạn tọa độ chờ phân tích trong block hiện tại
+    seg_lines: list = []
+    header_seen = False
+    in_line = None  # None: đầu dòng; "skip": đang trong dòng bị bỏ; "coords": đang trong dòng màu
+
+    def add_coords(data: bytes) -> None:
+        if data:
+            segments.append(data)
+            seg_lines.append(len(colors) - 1)
+
+    def flush() -> None:
+        coords, seg_counts = parse_coords_segments(segments)
+        if coords.shape[0]:
+            row_parts.append(coords[:, 0].astype(np.int32))
+            col_parts.append(coords[:, 1].astype(np.int32))
+        count_parts.append(seg_counts)
+        line_parts.append(np.array(seg_lines, dtype=np.int64))
+        segments.clear()
+        seg_lines.clear()
+
+    with open(path, "rb") as f:
+        carry = b""
+        while True:
+            block = f.read(block_size)
+            eof = not block
+            data = carry + block
+            if eof:
+                cut = len(data)
+            else:
+                cut = _cut_point(data)
+                if cut == 0:  # chưa có điểm cắt, đọc thêm
+                    carry = data
+                    continue
+            carry = data[cut:]
+            pieces = data[:cut].split(b"\n")
+            for j, piece in enumerate(pieces):
+                complete = j < len(pieces) - 1 or eof  # piece kết thúc bằng xuống dòng?
+                if in_line is None:
+                    text = piece.strip(_WS) if complete else piece.lstrip(_WS)
+                    if text:
+                        if not header_seen:  # dòng đầu là số màu, bỏ qua
+                            header_seen = True
+                            in_line = "skip"
+                        else:
+                            m = _COLOR_LINE_RE_B.match(text)
+                            if m:
+                                colors.append(int(m.group(1)[1:], 16))
+                                in_line = "coords"
+                                add_coords(m.group(3))
+                            else:
+                                in_line = "skip"
+                elif in_line == "coords":
+                    add_coords(piece)
+                if complete:
+                    in_line = None
+            flush()
+            if eof:
+                break
+
+    if not colors:
+        return empty_groups()
+    counts_arr = np.bincount(np.concatenate(line_parts), weights=np.concatenate(count_parts),
+                             minlength=len(colors)).astype(np.int64)
+    offsets = np.zeros(len(colors) + 1, dtype=np.int64)
+    np.cumsum(counts_arr, out=offsets[1:])
+    if row_parts:
+        rows, cols = np.concatenate(row_parts), np.concatenate(col_parts)
+    else:
+        rows, cols = np.empty(0, np.int32), np.empty(0, np.int32)
+    return ColorGroups(np.array(colors, dtype=np.uint32), counts_arr, offsets, rows, cols)
+
+
+# ---------------------------
+# Định dạng nhị phân
+# ---------------------------
+
+def _align8(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def _uint_dtype(max_value: int, sizes=(2, 4)) -> np.dtype:
+    for size in sizes:
+        if max_value < (1 << (8 * size)):
+            return np.dtype(f"<u{size}")
+    raise ValueError(f"Giá trị quá lớn cho định dạng nhị phân: {max_value}")
+
+
+def _bin_layout(k: int, n: int, rsize: int, csize: int, isize: int):
+    """Trả về offset (byte) của palette, offsets, rows, cols, index và tổng kích thước."""
+    pos = _align8(_BIN_HEADER.size)
+    layout = []
+    for nbytes in (4 * k, 8 * (k + 1), rsize * n, csize * n, isize * n):
+        layout.append(pos)
+        pos = _align8(pos + nbytes)
+    return layout, pos
+
+
+def save_groups_bin(path: str, groups: ColorGroups) -> None:
+    k, n = groups.num_colors, groups.num_pixels
+    rows = np.asarray(groups.rows)
+    cols = np.asarray(groups.cols)
+    rdt = _uint_dtype(int(rows.max()) if n else 0)
+    cdt = _uint_dtype(int(cols.max()) if n else 0)
+    idt = _uint_dtype(max(k - 1, 0), sizes=(1, 2, 4))
+    layout, _ = _bin_layout(k, n, rdt.itemsize, cdt.itemsize, idt.itemsize)
+    sections = (
+        np.asarray(groups.colors).astype("<u4", copy=False),
+        np.asarray(groups.offsets).astype("<i8", copy=False),
+        rows.astype(rdt, copy=False),
+        cols.astype(cdt, copy=False),
+        groups.point_index().astype(idt, copy=False),
+    )
+    with open(path, "wb", buffering=WRITE_BUFFER) as f:
+        f.write(_BIN_HEADER.pack(BIN_MAGIC, BIN_VERSION, rdt.itemsize, cdt.itemsize,
+                                 idt.itemsize, k, n))
+        for start, arr in zip(layout, sections):
+            f.write(b"\0" * (start - f.tell()))
+            f.write(arr.tobytes())
+        f.write(b"\0" * (_align8(f.tell()) - f.tell()))
+
+
+class BinGroupsWriter:
+    """Ghi file nhị phân theo từng phần màu liên tiếp, khi cả ColorGroups không vừa RAM.
+
+    Phải biết trước K, N và giá trị row/col lớn nhất; mỗi write() nhận các
+    màu tiếp theo (offsets của phần bắt đầu từ 0). Màu quá lớn thì khai báo
+    bằng add_colors() rồi ghi điểm dần bằng add_points(). Các section được
+    ghi qua np.memmap nên bộ nhớ chỉ tỉ lệ với phần đang ghi.
+    """
+
+    def __init__(self, path: str, k: int, n: int, max_row: int, max_col: int):
+        self.path = path
+        self.k, self.n = k, n
+        rdt, cdt = _uint_dtype(max_row), _uint_dtype(max_col)
+        idt = _uint_dtype(max(k - 1, 0), sizes=(1, 2, 4))
+        layout, total = _bin_layout(k, n, rdt.itemsize, cdt.itemsize, idt.itemsize)
+        with open(path, "wb") as f:
+            f.write(_BIN_HEADER.pack(BIN_MAGIC, BIN_VERSION, rdt.itemsize, cdt.itemsize,
+                                     idt.itemsize, k, n))
+            f.truncate(total)
+        dtypes = ("<u4", "<i8", rdt, cdt, idt)
+        counts = (k, k + 1, n, n, n)
+        self._sections = [np.memmap(path, dtype=dt, mode="r+", offset=start, shape=(count,))
+                          if count else np.empty(0, dtype=dt)
+                          for dt, start, count in zip(dtypes, layout, counts)]
+        self.k_done = self.n_done = 0
+        self._n_declared = 0  # tổng số điểm của các màu đã khai báo
+
+    def add_colors(self, colors: np.ndarray, counts: np.ndarray) -> None:
+        palette, offsets = self._sections[:2]
+        k0, k1 = self.k_done, self.k_done + len(colors)
+        if k1 > self.k:
+            raise ValueError("Ghi quá số màu đã khai báo.")
+        palette[k0:k1] = colors
+        offsets[k0 + 1:k1 + 1] = self._n_declared + np.cumsum(counts)
+        self._n_declared = int(offsets[k1]) if k1 else 0
+        self.k_done = k1
+
+    def add_points(self, rows: np.ndarray, cols: np.ndarray, index: Optional[np.ndarray] = None) -> None:
+        """Ghi tiếp điểm của các màu đã khai báo; index (chỉ số màu) tự tính nếu không truyền."""
+        n0, n1 = self.n_done, self.n_done + len(rows)
+        if n1 > self._n_declared:
+            raise ValueError("Ghi quá số điểm của các màu đã khai báo.")
+        if index is None:
+            offsets = self._sections[1]
+            index = np.searchsorted(offsets[1:self.k_done + 1], np.arange(n0, n1), side="right")
+        self._sections[2][n0:n1] = rows
+        self._sections[3][n0:n1] = cols
+        self._sections[4][n0:n1] = index
+        self.n_done = n1
+
+    def write(self, groups: ColorGroups) -> None:
+        k0 = self.k_done
+        self.add_colors(groups.colors, groups.counts)
+        self.add_points(groups.rows, groups.cols, k0 + groups.point_index())
+
+    def close(self) -> None:
+        if not self._sections:
+            return
+        for arr in self._sections:
+            if isinstance(arr, np.memmap):
+                arr.flush()
+        self._sections = []  # giải phóng memmap (Windows không cho đổi tên file đang map)
+        if (self.k_done, self.n_done) != (self.k, self.n):
+            raise ValueError(f"File nhị phân chưa đủ: {self.k_done}/{self.k} màu, "
+                             f"{self.n_done}/{self.n} điểm.")
+
+    def __enter__(self) -> "BinGroupsWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._sections = []
+
+
+def is_bin_layer(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(BIN_MAGIC)) == BIN_MAGIC
+
+
+def load_groups_bin(path: str) -> ColorGroups:
+    """Mở file nhị phân bằng np.memmap — thời gian hằng, không đọc dữ liệu điểm."""
+    with open(path, "rb") as f:
+        head = f.read(_BIN_HEADER.size)
+    if len(head) < _BIN_HEADER.size:
+        raise ValueError("File layer nhị phân bị cụt.")
+    magic, version, rsize, csize, isize, k, n = _BIN_HEADER.unpack(head)
+    if magic != BIN_MAGIC:
+        raise ValueError("Không phải file layer nhị phân.")
+    if version != BIN_VERSION:
+        raise ValueError(f"Không hỗ trợ phiên bản định dạng {version}.")
+    layout, total = _bin_layout(k, n, rsize, csize, isize)
+    if os.path.getsize(path) < total:
+        raise ValueError("File layer nhị phân bị cụt.")
+
+    def section(i: int, dtype: str, count: int) -> np.ndarray:
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", offset=layout[i], shape=(count,))
+
+    colors = section(0, "<u4", k)
+    offsets = section(1, "<i8", k + 1) if k else np.zeros(1, np.int64)
+    return ColorGroups(colors, np.diff(offsets), offsets,
+                       section(2, f"<u{rsize}", n), section(3, f"<u{csize}", n),
+                       section(4, f"<u{isize}", n))
+
+
+def load_groups(path: str) -> ColorGroups:
+    """Đọc file layer, tự nhận dạng text hay nhị phân theo magic."""
+    if is_bin_layer(path):
+        return load_groups_bin(path)
+    return load_groups_txt(path)
+
+
+_load_cache: "OrderedDict[str, Tuple[int, int, ColorGroups]]" = OrderedDict()
+
+
+def load_groups_cached(path: str) -> ColorGroups:
+    """Như load_groups nhưng có cache theo (đường dẫn, kích thước, mtime).
+
+    Mảng trả về là read-only vì có thể được nhiều layer dùng chung.
+    """
+    key = os.path.abspath(path)
+    st = os.stat(key)
+    hit = _load_cache.get(key)
+    if hit is not None and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+        _load_cache.move_to_end(key)
+        return hit[2]
+    groups = load_groups(key)
+    for arr in groups:
+        if isinstance(arr, np.ndarray):
+            arr.flags.writeable = False
+    _load_cache[key] = (st.st_size, st.st_mtime_ns, groups)
+    _load_cache.move_to_end(key)
+    while len(_load_cache) > LOAD_CACHE_SIZE:
+        _load_cache.popitem(last=False)
+    return groups
+
+
+def txt_to_bin(src: str, dst: str) -> None:
+    save_groups_bin(dst, load_groups_txt(src))
+
+
+def bin_to_txt(src: str, dst: str, spans: bool = True) -> None:
+    save_groups_txt(dst, load_groups_bin(src), spans=spans)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Chuyển đổi file layer giữa dạng text (.txt) và nhị phân (.apl).")
+    ap.add_argument("input", help="File layer nguồn (.txt hoặc .apl)")
+    ap.add_argument("output", help="File đích; dạng được chọn theo nguồn (txt -> apl, apl -> txt)")
+    ap.add_argument("--no-spans", action="store_true",
+                    help="apl -> txt: ghi từng điểm (r,c), không gộp đoạn (r,c1-c2), cho chương trình đọc cũ")
+    args = ap.parse_args()
+
+    if is_bin_layer(args.input):
+        bin_to_txt(args.input, args.output, spans=not args.no_spans)
+    else:
+        txt_to_bin(args.input, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Sprite dựng sẵn của một layer cho Preview (không phụ thuộc Tk).
+
+Sprite là khung bao (bounding box) của layer theo tọa độ trong file, kèm
+mặt nạ pixel có màu. Sprite không phụ thuộc vị trí x/y, nên đổi vị trí
+chỉ cần blit lại; chỉ dựng lại khi file hoặc chế độ thay đổi.
+"""
+from typing import NamedTuple, Optional
+import numpy as np
+
+from layer_store import LayerStore
+from paint_schedule import DEFAULT_SEED, shuffle_keys
+
+
+class LayerSprite(NamedTuple):
+    pixels: np.ndarray  # (h, w) uint32 RGBA, cùng bố cục với paint_schedule.rgba_view
+    mask: np.ndarray    # (h, w) bool, True ở pixel có điểm
+    row0: int           # row (1-based) của hàng đầu sprite
+    col0: int           # col (1-based) của cột đầu sprite
+    count: int          # số pixel có màu
+
+
+def build_sprite(layer: LayerStore, ordered: bool,
+                 seed: Optional[int] = None) -> Optional[LayerSprite]:
+    """Dựng sprite từ các cột của layer. Nếu một pixel xuất hiện nhiều lần: "ordered" lấy
+    điểm sau cùng trong file, "bycolor" lấy điểm của màu sau cùng (xáo theo seed
+    như paint_schedule.layer_sequence)."""
+    if layer.bounds is None:
+        return None
+    row0, row1, col0, col1 = layer.bounds
+    h, w = row1 - row0 + 1, col1 - col0 + 1
+    pid = layer.rows.astype(np.int64)
+    pid -= row0
+    pid *= w
+    pid += layer.cols
+    pid -= col0
+    if ordered:
+        order = np.arange(pid.shape[0])
+    else:
+        seed = DEFAULT_SEED if seed is None else seed
+        order = np.lexsort((shuffle_keys(layer.rows, layer.cols, seed), layer.index))
+    # Giữ lần xuất hiện cuối cùng của mỗi pixel theo thứ tự vẽ
+    pid_o = pid[order][::-1]
+    uniq, first = np.unique(pid_o, return_index=True)
+    src = order[::-1][first]
+    pixels = np.zeros(h * w, dtype=np.uint32)
+    mask = np.zeros(h * w, dtype=bool)
+    pixels[uniq] = layer.rgba[layer.index[src]]
+    mask[uniq] = True
+    return LayerSprite(pixels.reshape(h, w), mask.reshape(h, w), row0, col0, int(uniq.shape[0]))
+
+
+def blit_sprite(dst32: np.ndarray, sprite: LayerSprite, start_x: int, start_y: int) -> int:
+    """Vẽ sprite lên dst32 (view uint32 (H, W)) với góc trên-trái layer ở (start_x, start_y).
+
+    Phần ngoài khung ảnh bị cắt. Trả về số pixel đã vẽ.
+    """
+    H, W = dst32.shape
+    h, w = sprite.pixels.shape
+    x0 = start_x + sprite.col0 - 1
+    y0 = start_y + sprite.row0 - 1
+    xa, xb = max(x0, 0), min(x0 + w, W)
+    ya, yb = max(y0, 0), min(y0 + h, H)
+    if xa >= xb or ya >= yb:
+        return 0
+    src = (slice(ya - y0, yb - y0), slice(xa - x0, xb - x0))
+    mask = sprite.mask[src]
+    np.copyto(dst32[ya:yb, xa:xb], sprite.pixels[src], where=mask)
+    if xa == x0 and ya == y0 and xb == x0 + w and yb == y0 + h:
+        return sprite.count
+    return int(np.count_nonzero(mask))
@@ -0,0 +1,92 @@
+"""Dữ liệu một layer ở dạng cột, dùng chung cho Preview và Export (không phụ thuộc Tk).
+
+LayerStore giữ đúng một bản dữ liệu của layer, không có danh sách tuple:
+  - rows, cols : (N,) tọa độ 1-based theo thứ tự điểm trong file
+  - index      : (N,) chỉ số màu của từng điểm (kiểu nhỏ nhất đủ chứa K màu)
+  - colors     : (K,) uint32 0xRRGGBB; rgba: (K,) cùng màu dạng RGBA32
+  - offsets    : (K+1,) — màu i là các điểm [offsets[i], offsets[i+1])
+Mảng lấy thẳng từ ColorGroups của layer_file (memmap với .apl) và là
+read-only; paint_schedule.layer_sequence và layer_sprite.build_sprite đọc
+trực tiếp (view), chỉ cấp phát mảng kết quả của chính chúng.
+"""
+import os
+from collections import OrderedDict
+from typing import Optional, Tuple
+import numpy as np
+
+from color_groups import ColorGroups, rgb_to_rgba32
+from layer_file import LOAD_CACHE_SIZE, load_groups_cached
+
+Bounds = Tuple[int, int, int, int]  # (row_min, row_max, col_min, col_max), 1-based
+
+
+def _index_dtype(num_colors: int) -> type:
+    if num_colors <= 1 << 8:
+        return np.uint8
+    if num_colors <= 1 << 16:
+        return np.uint16
+    return np.uint32
+
+
+def _readonly(arr: np.ndarray) -> np.ndarray:
+    if arr.flags.writeable:
+        arr = arr.view()
+        arr.flags.writeable = False
+    return arr
+
+
+class LayerStore:
+    __slots__ = ("colors", "rgba", "offsets", "rows", "cols", "index", "bounds")
+
+    def __init__(self, groups: ColorGroups):
+        k = groups.num_colors
+        self.colors = _readonly(np.asarray(groups.colors))
+        self.rgba = _readonly(rgb_to_rgba32(self.colors))
+        self.offsets = _readonly(np.asarray(groups.offsets))
+        self.rows = _readonly(np.asarray(groups.rows))
+        self.cols = _readonly(np.asarray(groups.cols))
+        if groups.index is not None:
+            index = np.asarray(groups.index)
+        else:
+            index = np.repeat(np.arange(k, dtype=_index_dtype(k)), np.diff(self.offsets))
+        self.index = _readonly(index)
+        self.bounds: Optional[Bounds] = None
+        if self.rows.shape[0]:
+            self.bounds = (int(self.rows.min()), int(self.rows.max()),
+                           int(self.cols.min()), int(self.cols.max()))
+
+    @property
+    def num_colors(self) -> int:
+        return int(self.colors.shape[0])
+
+    @property
+    def num_pixels(self) -> int:
+        return int(self.rows.shape[0])
+
+    def hex(self, i: int) -> str:
+        return f"#{int(self.colors[i]):06X}"
+
+    def group(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, cols) của màu thứ i — là view, không copy."""
+        a, b = self.offsets[i], self.offsets[i + 1]
+        return self.rows[a:b], self.cols[a:b]
+
+
+_store_cache: "OrderedDict[str, Tuple[ColorGroups, LayerStore]]" = OrderedDict()
+
+
+def load_layer(path: str) -> LayerStore:
+    """Đọc file layer (.txt / .apl) qua load_groups_cached; nhiều layer cùng file
+    dùng chung một LayerStore."""
+    key = os.path.abspath(path)
+    groups = load_groups_cached(key)
+    hit = _store_cache.get(key)
+    if hit is not None and hit[0] is groups:
+        _store_cache.move_to_end(key)
+        return hit[1]
+    store = LayerStore(groups)
+    _store_cache[key] = (groups, store)
+    _store_cache.move_to_end(key)
+    while len(_store_cache) > LOAD_CACHE_SIZE:
+        _store_cache.popitem(last=False)
+    return store
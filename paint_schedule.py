@@ -0,0 +1,225 @@
+"""Lịch vẽ tính trước cho Export Snapshot (không phụ thuộc Tk).
+
+Mỗi layer cho ra một dãy điểm phẳng (x, y, màu):
+  - "ordered": theo đúng thứ tự điểm trong file
+  - "bycolor": theo thứ tự màu, xáo trộn trong từng màu — theo hash của
+    (seed, vị trí điểm trong file) nên cùng seed luôn cho cùng thứ tự, và sửa
+    một màu / đổi vị trí layer không làm đổi thứ tự trong các màu khác
+Các layer được đan xen round-robin (điểm thứ j của layer 0, 1, ..., rồi
+điểm thứ j+1, ...). Một điểm là no-op nếu màu của nó trùng màu pixel ngay
+trước đó (điểm trước cùng vị trí trong dãy, hoặc background) — tính bằng
+sắp xếp theo vị trí pixel thay vì kiểm tra từng điểm.
+Lịch chỉ giữ các lần ghi thật; mỗi snapshot là một lát cắt liên tiếp.
+"""
+import time
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+import numpy as np
+
+from layer_store import LayerStore
+
+PIXELS_PER_SNAPSHOT = 5
+DEFAULT_SEED = 0
+_U64 = np.uint64
+
+
+class LayerSequence(NamedTuple):
+    """Dãy điểm tuyệt đối của một layer (đã cắt theo khung ảnh)."""
+    xs: np.ndarray      # (n,) int32
+    ys: np.ndarray      # (n,) int32
+    colors: np.ndarray  # (n,) uint32 RGBA, cùng bố cục với acc.view(np.uint32)
+
+
+class PaintSchedule(NamedTuple):
+    xs: np.ndarray      # (m,) int32 — chỉ các lần ghi thật, theo thứ tự vẽ
+    ys: np.ndarray
+    colors: np.ndarray  # (m,) uint32 RGBA
+    num_points: int     # tổng số điểm đã tiêu thụ (kể cả no-op)
+    num_noop: int       # số điểm bị bỏ vì không đổi màu pixel
+
+    @property
+    def num_writes(self) -> int:
+        return int(self.xs.shape[0])
+
+
+class ExportResult(NamedTuple):
+    frames: int   # số frame đã gửi cho writer
+    writes: int   # số pixel đã cập nhật
+    noop: int     # số điểm bị bỏ qua
+
+
+def rgba_view(arr: np.ndarray) -> np.ndarray:
+    """Mảng (H, W, 4) uint8 liên tục -> view (H, W) uint32, ghi vào view là ghi vào arr."""
+    return arr.view(np.uint32)[..., 0]
+
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    """Bộ trộn splitmix64 trên mảng uint64 (song ánh: khác đầu vào thì khác đầu ra)."""
+    x = x + _U64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> _U64(30))) * _U64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> _U64(27))) * _U64(0x94D049BB133111EB)
+    return x ^ (x >> _U64(31))
+
+
+def layer_seed(seed: int, index: int) -> int:
+    """Seed riêng của layer thứ index, suy ra từ seed của cả lần export."""
+    x = np.array([(seed & 0xFFFFFFFFFFFFFFFF) ^ (index << 32)], dtype=np.uint64)
+    return int(_mix64(_mix64(x))[0])
+
+
+def shuffle_keys(rows: np.ndarray, cols: np.ndarray, seed: int = DEFAULT_SEED) -> np.ndarray:
+    """Khóa xáo trộn (uint64) của từng điểm: hash của (seed, row, col) trong file."""
+    pos = (np.asarray(rows).astype(np.uint64) << _U64(32)) | (np.asarray(cols).astype(np.uint64) & _U64(0xFFFFFFFF))
+    salt = _mix64(np.array([seed & 0xFFFFFFFFFFFFFFFF], dtype=np.uint64))[0]
+    return _mix64(pos ^ salt)
+
+
+def layer_sequence(layer: LayerStore, start_x: int, start_y: int, ordered: bool,
+                   W: int, H: int, seed: Optional[int] = None) -> Optional[LayerSequence]:
+    """Dãy điểm tuyệt đối của một layer; None nếu không còn điểm nào trong khung.
+
+    Đọc thẳng các cột của layer; layer nằm trọn trong khung thì không lọc điểm.
+    seed chỉ dùng cho "bycolor" (None = DEFAULT_SEED); xem shuffle_keys.
+    """
+    if layer.bounds is None:
+        return None
+    r0, r1, c0, c1 = layer.bounds
+    dx, dy = start_x - 1, start_y - 1
+    if c1 + dx < 0 or c0 + dx >= W or r1 + dy < 0 or r0 + dy >= H:
+        return None
+    rows, cols, gidx = layer.rows, layer.cols, layer.index
+    if c0 + dx < 0 or c1 + dx >= W or r0 + dy < 0 or r1 + dy >= H:
+        xs = cols.astype(np.int64) + dx
+        ys = rows.astype(np.int64) + dy
+        keep = np.flatnonzero((xs >= 0) & (xs < W) & (ys >= 0) & (ys < H))
+        if keep.size == 0:
+            return None
+        rows, cols, gidx = rows[keep], cols[keep], gidx[keep]
+    if not ordered:
+        # Theo thứ tự màu (điểm trong file vốn liền nhau theo nhóm), xáo trong màu theo seed
+        order = np.lexsort((shuffle_keys(rows, cols, DEFAULT_SEED if seed is None else seed), gidx))
+        rows, cols, gidx = rows[order], cols[order], gidx[order]
+    xs = cols.astype(np.int32)
+    xs += dx
+    ys = rows.astype(np.int32)
+    ys += dy
+    return LayerSequence(xs, ys, layer.rgba[gidx])
+
+
+def interleave(layers: List[LayerSequence]) -> LayerSequence:
+    """Đan xen round-robin: sắp theo (chỉ số điểm trong layer, chỉ số layer)."""
+    if not layers:
+        empty = np.empty(0, np.int32)
+        return LayerSequence(empty, empty, np.empty(0, np.uint32))
+    rank = np.concatenate([np.arange(l.xs.shape[0], dtype=np.int64) for l in layers])
+    lid = np.concatenate([np.full(l.xs.shape[0], i, dtype=np.int64) for i, l in enumerate(layers)])
+    order = np.argsort(rank * len(layers) + lid, kind="stable")
+    return LayerSequence(np.concatenate([l.xs for l in layers])[order],
+                         np.concatenate([l.ys for l in layers])[order],
+                         np.concatenate([l.colors for l in layers])[order])
+
+
+def noop_mask(seq: LayerSequence, bg32: np.ndarray) -> np.ndarray:
+    """True cho điểm mà màu trùng với màu pixel ngay trước nó (hoặc background)."""
+    n = seq.xs.shape[0]
+    W = bg32.shape[1]
+    pid = seq.ys.astype(np.int64) * W + seq.xs
+    order = np.argsort(pid, kind="stable")  # theo pixel, giữ thứ tự vẽ trong mỗi pixel
+    pid_s = pid[order]
+    col_s = seq.colors[order]
+    prev = bg32.ravel()[pid_s]
+    same_pixel = np.zeros(n, dtype=bool)
+    same_pixel[1:] = pid_s[1:] == pid_s[:-1]
+    prev[same_pixel] = col_s[np.flatnonzero(same_pixel) - 1]
+    mask = np.empty(n, dtype=bool)
+    mask[order] = prev == col_s
+    return mask
+
+
+def build_schedule(layers: List[LayerSequence], bg_arr: np.ndarray) -> PaintSchedule:
+    """Tính toàn bộ lịch vẽ từ các layer và background RGBA (H, W, 4)."""
+    seq = interleave(layers)
+    noop = noop_mask(seq, rgba_view(np.ascontiguousarray(bg_arr)))
+    keep = ~noop
+    return PaintSchedule(seq.xs[keep], seq.ys[keep], seq.colors[keep],
+                         int(seq.xs.shape[0]), int(noop.sum()))
+
+
+def uniform_bounds(num_writes: int, per_frame: int = PIXELS_PER_SNAPSHOT) -> np.ndarray:
+    """Biên frame khi cắt đều: [0, p, 2p, ..., num_writes] (frame cuối có thể ít hơn)."""
+    return np.append(np.arange(0, num_writes, per_frame, dtype=np.int64), num_writes)
+
+
+def frame_slices(bounds: np.ndarray, start_frame: int = 0) -> Iterator[Tuple[int, int]]:
+    """Các lát cắt [a, b) của lịch theo biên frame, bắt đầu từ frame start_frame + 1."""
+    for i in range(start_frame, bounds.shape[0] - 1):
+        yield int(bounds[i]), int(bounds[i + 1])
+
+
+def apply_writes(acc32: np.ndarray, sched: PaintSchedule, a: int, b: int
+                 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Ghi các điểm sched[a:b] vào acc32 (view uint32); trùng pixel thì điểm sau thắng.
+
+    Trả về (xs, ys, colors) thực sự đã ghi — delta của frame.
+    """
+    xs, ys, cols = sched.xs[a:b], sched.ys[a:b], sched.colors[a:b]
+    if b - a > 1:
+        pid = ys.astype(np.int64) * acc32.shape[1] + xs
+        _, last = np.unique(pid[::-1], return_index=True)
+        keep = (b - a - 1) - last
+        xs, ys, cols = xs[keep], ys[keep], cols[keep]
+    acc32[ys, xs] = cols
+    return xs, ys, cols
+
+
+def paint_frames(bg_arr: np.ndarray, sched: PaintSchedule, writer, bounds: np.ndarray,
+                 start_frame: int = 0,
+                 progress: Optional[Callable[[int, int], None]] = None,
+                 metrics=None) -> ExportResult:
+    """Vẽ lịch lên background, mỗi frame là [bounds[i-1], bounds[i]) (xem frame_plan);
+    gửi từng frame cho writer.
+
+    writer có write(index, arr, delta) như PngFrameWriter / FrameArchiveWriter;
+    việc close() writer do bên gọi đảm nhận.
+    - start_frame: các frame 1..start_frame đã có sẵn (tiếp tục export), chỉ vẽ
+      chứ không gửi cho writer
+    - progress(done, total): gọi sau mỗi frame; có thể ném ngoại lệ để dừng
+    - metrics: export_metrics.ExportMetrics — cộng thời gian "paint" (vẽ) và
+      "write" (gửi cho writer, kể cả lúc chờ hàng đợi đầy) từng frame
+    """
+    acc_arr = np.array(bg_arr, dtype=np.uint8, copy=True)
+    acc32 = rgba_view(acc_arr)
+    total = bounds.shape[0] - 1
+    frames = min(start_frame, total)
+    if frames:
+        # Các frame đã có: vẽ một lượt tới hết frame start_frame
+        apply_writes(acc32, sched, 0, int(bounds[frames]))
+    if metrics is not None:
+        metrics.writes, metrics.noop, metrics.points = sched.num_writes, sched.num_noop, sched.num_points
+        metrics.start_frames(total - frames)
+    clock, cpu = time.perf_counter, time.thread_time
+    for a, b in frame_slices(bounds, frames):
+        if metrics is None:
+            delta = apply_writes(acc32, sched, a, b)
+            frames += 1
+            writer.write(frames, acc_arr, delta)
+        else:
+            t0, c0 = clock(), cpu()
+            delta = apply_writes(acc32, sched, a, b)
+            t1, c1 = clock(), cpu()
+            frames += 1
+            writer.write(frames, acc_arr, delta)
+            metrics.add("paint", t1 - t0, c1 - c0)
+            metrics.add("write", clock() - t1, cpu() - c1)
+            metrics.frames += 1
+        if progress is not None:
+            progress(frames, total)
+    return ExportResult(frames, sched.num_writes, sched.num_noop)
+
+
+def export_frames(bg_arr: np.ndarray, layers: List[LayerSequence], writer,
+                  per_frame: int = PIXELS_PER_SNAPSHOT, start_frame: int = 0,
+                  progress: Optional[Callable[[int, int], None]] = None) -> ExportResult:
+    """Tính lịch từ các layer rồi vẽ, mỗi frame per_frame lần ghi (xem paint_frames)."""
+    sched = build_schedule(layers, bg_arr)
+    return paint_frames(bg_arr, sched, writer, uniform_bounds(sched.num_writes, per_frame),
+                        start_frame, progress)
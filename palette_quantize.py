@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""Giảm số màu của ảnh trước khi gom nhóm màu (không phụ thuộc Tk).
+
+Ảnh chụp có hàng chục nghìn màu gần giống nhau -> file layer rất lớn và chế
+độ "bycolor" phải xáo hàng nghìn nhóm nhỏ. Bước này thay mỗi màu bằng màu
+đại diện trong bảng tối đa max_colors màu, nên số nhóm bị chặn trên.
+
+Chỉ làm việc trên các màu khác nhau (kèm số pixel), không trên từng pixel:
+  - "median-cut": chia hộp màu theo kênh rộng nhất tại trung vị (theo số pixel);
+    hộp có độ rộng mọi kênh <= threshold thì không chia nữa
+  - "kmeans": khởi tạo từ median-cut rồi lặp Lloyd (có trọng số) trên các màu
+Ảnh đã có <= max_colors màu và threshold = 0 thì giữ nguyên.
+Pixel alpha = 0 không tham gia và giữ nguyên.
+
+    python palette_quantize.py in.png -o out.png --colors 64 [--threshold 8] [--method kmeans]
+    python palette_quantize.py in.png -o layer.txt --colors 64      (ghi thẳng file layer)
+"""
+import argparse
+import heapq
+from typing import NamedTuple, Tuple
+import numpy as np
+
+from color_groups import pack_rgb
+
+QUANTIZE_METHODS = ("median-cut", "kmeans")
+DEFAULT_MAX_COLORS = 256
+KMEANS_ITERS = 8
+KMEANS_WORK = 2_000_000_000  # tối đa (số màu × số tâm × số lượt) cho k-means
+_CHUNK = 16384  # số màu mỗi lượt tính khoảng cách tới bảng màu
+
+
+class QuantizeResult(NamedTuple):
+    rgba: np.ndarray      # (H, W, 4) uint8, RGB đã thay bằng màu trong palette
+    palette: np.ndarray   # (k, 3) uint8
+    colors_before: int    # số màu khác nhau (pixel alpha > 0) trước khi giảm
+
+
+def _unique_colors(arr: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """-> (mask pixel alpha > 0, màu (u, 3) int64, số pixel (u,), chỉ số màu của từng pixel)."""
+    mask = arr[..., 3] != 0
+    packed = pack_rgb(arr[mask])
+    uniq, inverse, counts = np.unique(packed, return_inverse=True, return_counts=True)
+    uniq = uniq.astype(np.int64)
+    rgb = np.stack([(uniq >> 16) & 0xFF, (uniq >> 8) & 0xFF, uniq & 0xFF], axis=1)
+    return mask, rgb, counts.astype(np.int64), inverse.reshape(-1)
+
+
+def median_cut(rgb: np.ndarray, weights: np.ndarray, max_colors: int,
+               threshold: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+    """Median-cut trên các màu (u, 3) có trọng số -> (palette (k, 3) uint8, nhãn (u,))."""
+    order = np.arange(rgb.shape[0])
+
+    def entry(a: int, b: int) -> Tuple[int, int, int, int]:
+        c = rgb[order[a:b]]
+        rng = c.max(axis=0) - c.min(axis=0)
+        ch = int(np.argmax(rng))
+        return -int(rng[ch]), a, b, ch
+
+    # Hàng đợi ưu tiên: hộp rộng nhất (theo kênh rộng nhất) được chia trước
+    heap = [entry(0, rgb.shape[0])]
+    while len(heap) < max_colors:
+        neg_span, a, b, ch = heap[0]
+        if -neg_span <= threshold or -neg_span == 0:
+            break
+        heapq.heappop(heap)
+        idx = order[a:b]
+        idx = idx[np.argsort(rgb[idx, ch], kind="stable")]
+        order[a:b] = idx
+        vals = rgb[idx, ch]
+        cw = np.cumsum(weights[idx])
+        mid = min(int(np.searchsorted(cw, cw[-1] / 2, side="right")), b - a - 1)
+        # Không cắt giữa hai màu cùng giá trị kênh
+        lo = int(np.searchsorted(vals, vals[mid], side="left"))
+        cut = a + (lo if lo > 0 else int(np.searchsorted(vals, vals[mid], side="right")))
+        heapq.heappush(heap, entry(a, cut))
+        heapq.heappush(heap, entry(cut, b))
+
+    labels = np.empty(rgb.shape[0], dtype=np.int64)
+    palette = np.empty((len(heap), 3), dtype=np.uint8)
+    for k, (_, a, b, _) in enumerate(sorted(heap, key=lambda e: e[1])):
+        idx = order[a:b]
+        labels[idx] = k
+        w = weights[idx].astype(np.float64)
+        palette[k] = np.rint((rgb[idx] * w[:, None]).sum(axis=0) / w.sum())
+    return palette, labels
+
+
+def nearest(rgb: np.ndarray, palette: np.ndarray) -> np.ndarray:
+    """Chỉ số màu gần nhất (Euclid RGB) trong palette cho từng màu, tính theo lượt."""
+    pal = palette.astype(np.float32)
+    pal_sq = (pal * pal).sum(axis=1)
+    out = np.empty(rgb.shape[0], dtype=np.int64)
+    for a in range(0, rgb.shape[0], _CHUNK):
+        c = rgb[a:a + _CHUNK].astype(np.float32)
+        # |c - p|^2 = |c|^2 - 2 c·p + |p|^2; |c|^2 không đổi theo p nên bỏ
+        out[a:a + _CHUNK] = np.argmin(pal_sq[None, :] - 2.0 * (c @ pal.T), axis=1)
+    return out
+
+
+def kmeans(rgb: np.ndarray, weights: np.ndarray, palette: np.ndarray,
+           iters: int = KMEANS_ITERS) -> Tuple[np.ndarray, np.ndarray]:
+    """Lloyd có trọng số trên các màu, khởi tạo từ palette -> (palette, nhãn).
+
+    Mỗi lượt tốn O(số màu × số tâm): số lượt bị giới hạn theo KMEANS_WORK
+    (ít nhất 1) để ảnh nhiều màu với bảng màu lớn không chạy hàng phút.
+    """
+    centers = palette.astype(np.float64)
+    w = weights.astype(np.float64)
+    iters = max(1, min(iters, KMEANS_WORK // max(rgb.shape[0] * palette.shape[0], 1) - 1))
+    labels = nearest(rgb, palette)
+    for _ in range(iters):
+        k = centers.shape[0]
+        total = np.bincount(labels, weights=w, minlength=k)
+        sums = np.stack([np.bincount(labels, weights=rgb[:, c] * w, minlength=k) for c in range(3)], axis=1)
+        used = total > 0
+        centers[used] = sums[used] / total[used, None]
+        new_palette = np.rint(centers).astype(np.uint8)
+        new_labels = nearest(rgb, new_palette)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    # Bỏ tâm không còn màu nào
+    used = np.unique(labels)
+    remap = np.full(centers.shape[0], -1, dtype=np.int64)
+    remap[used] = np.arange(used.shape[0])
+    return np.rint(centers[used]).astype(np.uint8), remap[labels]
+
+
+def quantize_rgba(arr: np.ndarray, max_colors: int = DEFAULT_MAX_COLORS, threshold: float = 0.0,
+                  method: str = "median-cut") -> QuantizeResult:
+    """Giảm màu ảnh RGBA (H, W, 4) uint8; alpha giữ nguyên."""
+    if method not in QUANTIZE_METHODS:
+        raise ValueError(f"Phương pháp không hỗ trợ: {method!r} (chọn: {', '.join(QUANTIZE_METHODS)})")
+    if max_colors < 1:
+        raise ValueError("max_colors phải >= 1")
+    mask, rgb, counts, inverse = _unique_colors(arr)
+    n = rgb.shape[0]
+    if n == 0 or (n <= max_colors and threshold <= 0):
+        return QuantizeResult(arr, rgb.astype(np.uint8), n)
+    palette, labels = median_cut(rgb, counts, max_colors, threshold)
+    if method == "kmeans" and palette.shape[0] > 1:
+        palette, labels = kmeans(rgb, counts, palette)
+    out = arr.copy()
+    out[mask, :3] = palette[labels[inverse]]
+    return QuantizeResult(out, palette, n)
+
+
+def main():
+    from PIL import Image
+    from color_groups import group_colors
+    from layer_file import BIN_EXT, save_groups_bin, save_groups_txt
+
+    ap = argparse.ArgumentParser(description="Giảm số màu ảnh trước khi tách màu.")
+    ap.add_argument("input", help="Ảnh đầu vào")
+    ap.add_argument("-o", "--output", required=True,
+                    help=f"Ảnh PNG đầu ra, hoặc file layer (.txt / {BIN_EXT})")
+    ap.add_argument("--colors", type=int, default=DEFAULT_MAX_COLORS, help="Số màu tối đa")
+    ap.add_argument("--threshold", type=float, default=0.0,
+                    help="Màu trong cùng hộp lệch nhau không quá ngưỡng này (mỗi kênh) thì gộp")
+    ap.add_argument("--method", choices=QUANTIZE_METHODS, default="median-cut")
+    args = ap.parse_args()
+
+    arr = np.array(Image.open(args.input).convert("RGBA"), dtype=np.uint8)
+    res = quantize_rgba(arr, args.colors, args.threshold, args.method)
+    out = args.output.lower()
+    if out.endswith(".txt"):
+        save_groups_txt(args.output, group_colors(res.rgba))
+    elif out.endswith(BIN_EXT):
+        save_groups_bin(args.output, group_colors(res.rgba))
+    else:
+        Image.fromarray(res.rgba, mode="RGBA").save(args.output)
+    print(f"{res.colors_before} -> {res.palette.shape[0]} màu")
+
+
+if __name__ == "__main__":
+    main()
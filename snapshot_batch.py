@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""Chạy Export Snapshot không cần giao diện, theo file job (JSON hoặc TOML).
+
+Ví dụ job.json:
+    {
+      "jobs": [
+        {
+          "background": "bg.png",
+          "layers": [
+            {"file": "house.txt", "x": 10, "y": 20, "ordered": true},
+            {"file": "tree.apl",  "x": 200, "y": 40, "ordered": false, "seed": 7}
+          ],
+          "output": {"type": "png", "dir": "out/house"},
+          "plan": {"frames": 2000, "curve": "ease-in-out", "max_bytes": 500000000}
+        },
+        {
+          "background": "bg.png",
+          "layers": [{"file": "house.txt"}],
+          "output": {"type": "archive", "path": "out/house.apfa", "keyframe_interval": 256}
+        },
+        {
+          "background": "bg.png",
+          "layers": [{"file": "house.txt"}],
+          "output": {"type": "stream", "target": "| ffmpeg -y -i - out/house.mp4",
+                     "format": "y4m", "fps": 30}
+        }
+      ]
+    }
+"plan" (tùy chọn, xem frame_plan.PlanSpec): "pixels_per_frame" (mặc định 5),
+"frames", "curve" (linear / ease-in / ease-out / ease-in-out), "max_bytes",
+"max_seconds". Kế hoạch (số frame, dung lượng dự kiến) được in ra trước khi nén.
+Layer "ordered": false xáo điểm trong từng màu theo "seed" của layer (mặc định
+suy ra từ "seed" của job, mặc định 0) — chạy lại luôn cho cùng thứ tự vẽ.
+Output "png" chạy lại vào cùng thư mục chỉ nén các frame sau điểm đầu tiên
+lịch vẽ khác lần trước (xem frame_cache).
+Output "stream" (xem frame_stream): "target" là "-" (stdout), "|lệnh" hoặc
+file / named pipe; "format" là "y4m" (mặc định) hoặc "rgba". Khi có job stream
+ra stdout, mọi thông báo được in ra stderr.
+Mỗi job ghi báo cáo thời gian từng giai đoạn (export_metrics) vào thư mục
+snapshot hoặc cạnh file archive; --profile DIR chạy từng job dưới cProfile.
+File chỉ có một job thì có thể bỏ "jobs" và ghi trực tiếp các khóa của job.
+Đường dẫn tương đối được tính theo thư mục chứa file job.
+
+    python snapshot_batch.py job.json [--jobs N] [--encode-workers N] [--plan-only] [--profile DIR]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+from export_metrics import ExportMetrics, metrics_path, run_profiled
+from frame_archive import FrameArchiveWriter, KEYFRAME_INTERVAL
+from frame_cache import frame_keys, remove_stale_frames, reusable_frames, write_keys
+from frame_plan import (FrameCost, FramePlan, PlanSpec, archive_frame_cost, describe_plan,
+                        plan_frames, png_frame_cost, sample_frames, stream_frame_cost)
+from frame_stream import DEFAULT_FPS, StreamFrameWriter
+from frame_writer import PngFrameWriter
+from layer_store import load_layer
+from paint_schedule import (DEFAULT_SEED, ExportResult, PIXELS_PER_SNAPSHOT, PaintSchedule,
+                            build_schedule, layer_seed, layer_sequence, paint_frames)
+
+JobSpec = Dict[str, Any]
+
+
+def load_job_file(path: str) -> List[JobSpec]:
+    """Đọc file job (.json / .toml) -> danh sách job, đường dẫn đã chuyển thành tuyệt đối."""
+    if path.lower().endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            raise SystemExit("Cần Python 3.11+ (tomllib) để đọc file TOML.")
+        with open(path, "rb") as f:
+            spec = tomllib.load(f)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            spec = json.load(f)
+
+    jobs = spec["jobs"] if "jobs" in spec else [spec]
+    base = os.path.dirname(os.path.abspath(path))
+
+    def resolve(p: str) -> str:
+        return os.path.normpath(os.path.join(base, os.path.expanduser(p)))
+
+    for job in jobs:
+        job["background"] = resolve(job["background"])
+        for layer in job.get("layers", []):
+            layer["file"] = resolve(layer["file"])
+        out = job.setdefault("output", {})
+        for key in ("dir", "path"):
+            if key in out:
+                out[key] = resolve(out[key])
+        target = out.get("target")
+        if target is not None and target != "-" and not target.startswith("|"):
+            out["target"] = resolve(target)
+    if sum(1 for job in jobs if job["output"].get("target") == "-") > 1:
+        raise SystemExit("Chỉ một job được stream ra stdout.")
+    return jobs
+
+
+def make_writer(output: Dict[str, Any], bg_arr: np.ndarray, encode_workers: Optional[int],
+                metrics: Optional[ExportMetrics] = None):
+    kind = output.get("type", "png")
+    if kind == "png":
+        os.makedirs(output["dir"], exist_ok=True)
+        return PngFrameWriter(output["dir"], workers=encode_workers, metrics=metrics)
+    if kind == "archive":
+        os.makedirs(os.path.dirname(output["path"]) or ".", exist_ok=True)
+        return FrameArchiveWriter(output["path"], bg_arr,
+                                  keyframe_interval=int(output.get("keyframe_interval", KEYFRAME_INTERVAL)),
+                                  metrics=metrics)
+    if kind == "stream":
+        return StreamFrameWriter(output["target"], bg_arr.shape[1], bg_arr.shape[0],
+                                 output.get("format", "y4m"), int(output.get("fps", DEFAULT_FPS)),
+                                 metrics=metrics)
+    raise ValueError(f"Loại output không hỗ trợ: {kind!r}")
+
+
+def job_plan_spec(job: JobSpec) -> PlanSpec:
+    plan = job.get("plan", {})
+    return PlanSpec(
+        int(plan.get("pixels_per_frame", job.get("pixels_per_frame", PIXELS_PER_SNAPSHOT))),
+        int(plan["frames"]) if plan.get("frames") is not None else None,
+        plan.get("curve", "linear"),
+        int(plan["max_bytes"]) if plan.get("max_bytes") is not None else None,
+        float(plan["max_seconds"]) if plan.get("max_seconds") is not None else None,
+    )
+
+
+def plan_job(job: JobSpec, encode_workers: Optional[int] = None,
+             metrics: Optional[ExportMetrics] = None
+             ) -> Tuple[np.ndarray, PaintSchedule, FramePlan, FrameCost]:
+    """Lập lịch vẽ + kế hoạch frame của một job (chưa nén gì)."""
+    metrics = metrics if metrics is not None else ExportMetrics()
+    with metrics.stage("load_background"):
+        bg_arr = np.array(Image.open(job["background"]).convert("RGBA"), dtype=np.uint8)
+    H, W, _ = bg_arr.shape
+
+    layer_seqs = []
+    job_seed = int(job.get("seed", DEFAULT_SEED))
+    for i, layer in enumerate(job.get("layers", [])):
+        with metrics.stage("parse_layers"):
+            store = load_layer(layer["file"])
+        seed = int(layer["seed"]) if layer.get("seed") is not None else layer_seed(job_seed, i)
+        with metrics.stage("layer_sequence"):
+            seq = layer_sequence(store, int(layer.get("x", 0)), int(layer.get("y", 0)),
+                                 bool(layer.get("ordered", True)), W, H, seed)
+        if seq is not None:
+            layer_seqs.append(seq)
+    if not layer_seqs:
+        raise ValueError("Không có layer hợp lệ để xuất snapshot.")
+
+    with metrics.stage("schedule"):
+        sched = build_schedule(layer_seqs, bg_arr)
+    with metrics.stage("plan"):
+        samples = sample_frames(bg_arr, sched)
+        output = job["output"]
+        kind = output.get("type", "png")
+        if kind == "archive":
+            cost = archive_frame_cost(samples, int(output.get("keyframe_interval", KEYFRAME_INTERVAL)))
+        elif kind == "stream":
+            cost = stream_frame_cost(samples, output.get("format", "y4m"))
+        else:
+            cost = png_frame_cost(samples, encode_workers or os.cpu_count() or 1)
+        plan = plan_frames(sched.num_writes, job_plan_spec(job), cost)
+    return bg_arr, sched, plan, cost
+
+
+def job_output(job: JobSpec) -> str:
+    out = job["output"]
+    return out.get("dir") or out.get("path") or out.get("target") or ""
+
+
+def run_job(job: JobSpec, encode_workers: Optional[int] = None) -> ExportResult:
+    """Chạy một job; cùng logic vẽ với App._export. Báo cáo thời gian được lưu
+    cạnh đầu ra (nếu đầu ra là file / thư mục)."""
+    metrics = ExportMetrics(job_output(job))
+    try:
+        bg_arr, sched, plan, cost = plan_job(job, encode_workers, metrics)
+        text = describe_plan(plan, cost)
+        # Thư mục PNG từ lần chạy trước: dùng lại các frame đầu trùng khóa nội dung
+        cache_dir = job["output"]["dir"] if job["output"].get("type", "png") == "png" else None
+        keys, start_frame = None, 0
+        if cache_dir is not None:
+            with metrics.stage("frame_keys"):
+                keys = frame_keys(bg_arr, sched, plan.bounds)
+                start_frame = reusable_frames(cache_dir, keys)
+            if start_frame:
+                text += f" (dùng lại {start_frame} frame đã có)"
+        print(f"[KẾ HOẠCH] {job_name(job)}: {text}", flush=True, file=log_file(job))
+
+        writer = make_writer(job["output"], bg_arr, encode_workers, metrics)
+        metrics.attach_writer(writer)
+        if keys is not None:
+            write_keys(cache_dir, keys[:start_frame])
+        try:
+            result = paint_frames(bg_arr, sched, writer, plan.bounds, start_frame, metrics=metrics)
+        except BaseException:
+            writer.close(cancel=True)
+            raise
+        with metrics.stage("close"):
+            writer.close()
+        if keys is not None:
+            write_keys(cache_dir, keys)
+            remove_stale_frames(cache_dir, plan.num_frames)
+        return result
+    finally:
+        metrics.finish()
+        report = metrics_path(metrics.output)
+        if report is not None and os.path.exists(metrics.output):
+            metrics.save(report)
+
+
+def _run_job_timed(job: JobSpec, encode_workers: Optional[int], profile: Optional[str] = None):
+    t0 = time.perf_counter()
+    result = run_profiled(run_job, job, encode_workers, path=profile)
+    return result, time.perf_counter() - t0
+
+
+def job_name(job: JobSpec) -> str:
+    out = job["output"]
+    return job.get("name") or out.get("dir") or out.get("path") or out.get("target") \
+        or job["background"]
+
+
+def log_file(job: JobSpec):
+    """stdout đang chở frame thì thông báo phải ra stderr."""
+    return sys.stderr if job["output"].get("target") == "-" else sys.stdout
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Export snapshot hàng loạt không cần giao diện.")
+    ap.add_argument("spec", help="File job (.json hoặc .toml)")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                    help="Số job chạy song song (mỗi job một tiến trình).")
+    ap.add_argument("--encode-workers", type=int, default=None,
+                    help="Số tiến trình nén PNG cho mỗi job (mặc định: 1 nếu chạy nhiều job, "
+                         "ngược lại bằng số core).")
+    ap.add_argument("--profile", metavar="DIR",
+                    help="Chạy mỗi job dưới cProfile, ghi DIR/job<N>.prof (xem bằng python -m pstats).")
+    ap.add_argument("--plan-only", action="store_true",
+                    help="Chỉ in kế hoạch frame (số frame, dung lượng dự kiến), không export.")
+    args = ap.parse_args(argv)
+
+    jobs = load_job_file(args.spec)
+    profiles: List[Optional[str]] = [None] * len(jobs)
+    if args.profile:
+        os.makedirs(args.profile, exist_ok=True)
+        profiles = [os.path.join(os.path.abspath(args.profile), f"job{i + 1}.prof") for i in range(len(jobs))]
+    out = sys.stderr if any(log_file(job) is sys.stderr for job in jobs) else sys.stdout
+    if args.plan_only:
+        failed = 0
+        for job in jobs:
+            try:
+                _, _, plan, cost = plan_job(job, args.encode_workers)
+            except Exception as e:
+                failed += 1
+                print(f"[LỖI] {job_name(job)}: {e}", file=sys.stderr)
+                continue
+            print(f"[KẾ HOẠCH] {job_name(job)}: {describe_plan(plan, cost)}")
+        return 1 if failed else 0
+
+    n_parallel = max(1, min(args.jobs, len(jobs)))
+    encode_workers = args.encode_workers
+    if encode_workers is None and n_parallel > 1:
+        encode_workers = 1  # tránh mỗi job lại mở thêm một pool đủ số core
+
+    failed = 0
+    if n_parallel == 1:
+        outcomes = []
+        for job, profile in zip(jobs, profiles):
+            try:
+                outcomes.append((job, _run_job_timed(job, encode_workers, profile), None))
+            except Exception as e:
+                outcomes.append((job, None, e))
+    else:
+        with ProcessPoolExecutor(max_workers=n_parallel) as pool:
+            futures = [(job, pool.submit(_run_job_timed, job, encode_workers, profile))
+                       for job, profile in zip(jobs, profiles)]
+            outcomes = []
+            for job, fut in futures:
+                try:
+                    outcomes.append((job, fut.result(), None))
+                except Exception as e:
+                    outcomes.append((job, None, e))
+
+    for job, res, err in outcomes:
+        if err is not None:
+            failed += 1
+            print(f"[LỖI] {job_name(job)}: {err}", file=sys.stderr)
+        else:
+            result, elapsed = res
+            print(f"[OK] {job_name(job)}: {result.frames} frame, {result.writes} pixel, "
+                  f"{elapsed:.2f}s", file=out)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""Tách màu ảnh rất lớn theo dải hàng, bộ nhớ bị chặn theo kích thước dải
+(không phụ thuộc Tk).
+
+Kết quả giống hệt save_groups_txt(group_colors(ảnh)) / save_groups_bin(...),
+nhưng không bao giờ giữ cả ảnh hay cả ColorGroups trong RAM:
+  1. Đọc từng dải ~strip_pixels pixel; điểm alpha > 0 của dải được sắp xếp
+     ổn định theo màu rồi ghi nối vào các mảng tạm trên đĩa (mỗi dải là một
+     "run" đã sắp xếp; trong mỗi màu vẫn theo thứ tự (row, col)).
+  2. Chia dải màu 0x000000..0xFFFFFF thành các khoảng có tổng số điểm
+     ~strip_pixels (theo histogram 16 bit cao). Với từng khoảng: lấy đoạn
+     tương ứng của mọi run (np.memmap), sắp xếp ổn định theo màu — run trước
+     là hàng trên nên thứ tự (row, col) được giữ — rồi ghi tiếp ra file đích.
+
+Đọc dải: ảnh không nén mà PIL mô tả bằng tile "raw" (BMP, TIFF không nén,
+PPM, TGA) và file .npy (H, W, 3|4) uint8 được đọc thẳng từ đĩa qua np.memmap.
+Định dạng nén (PNG, JPEG, ...) thì PIL phải giải mã cả ảnh một lần ở mode
+gốc; sau đó vẫn chỉ một dải được đổi sang RGBA/NumPy mỗi lần.
+
+    python tiled_extract.py scan.tif -o layer.txt [--strip-pixels 4194304] [--tmp DIR]
+    python tiled_extract.py scan.bmp -o layer.apl
+"""
+import argparse
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+from color_groups import ColorGroups, pack_rgb
+from layer_file import (BIN_EXT, NEWLINE, WRITE_BUFFER, WRITE_CHUNK, BinGroupsWriter,
+                        format_coords, write_groups_txt)
+
+DEFAULT_STRIP_PIXELS = 1 << 22  # số pixel mỗi dải / số điểm mỗi khoảng màu khi gộp
+_BUCKET_SHIFT = 8               # histogram theo 16 bit cao của 0xRRGGBB
+
+# rawmode của tile "raw" -> (byte mỗi pixel, vị trí R, G, B trong pixel, vị trí alpha hoặc None)
+_RAW_MODES = {
+    "RGBA": (4, (0, 1, 2), 3),
+    "RGBX": (4, (0, 1, 2), None),
+    "RGB": (3, (0, 1, 2), None),
+    "BGRA": (4, (2, 1, 0), 3),
+    "BGRX": (4, (2, 1, 0), None),
+    "BGR": (3, (2, 1, 0), None),
+    "L": (1, (0, 0, 0), None),
+}
+
+
+@contextmanager
+def _no_pixel_limit() -> Iterator[None]:
+    # Chế độ này dành cho ảnh rất lớn: bỏ giới hạn chống "decompression bomb" của PIL
+    old = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = None
+    try:
+        yield
+    finally:
+        Image.MAX_IMAGE_PIXELS = old
+
+
+class StripSource:
+    """Nguồn ảnh đọc theo dải hàng -> mảng RGBA (h, W, 4) uint8."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._img: Optional[Image.Image] = None
+        self._raw: Optional[List[Tuple[int, int, np.ndarray, Tuple[int, int, int], Optional[int]]]] = None
+        if path.lower().endswith(".npy"):
+            arr = np.load(path, mmap_mode="r")
+            if arr.ndim != 3 or arr.shape[2] not in (3, 4) or arr.dtype != np.uint8:
+                raise ValueError("File .npy phải là mảng (H, W, 3|4) uint8.")
+            self.height, self.width = arr.shape[:2]
+            self._raw = [(0, self.height, arr, (0, 1, 2), 3 if arr.shape[2] == 4 else None)]
+            return
+        with _no_pixel_limit():
+            img = Image.open(path)
+        self.width, self.height = img.size
+        self._raw = self._map_raw(img)
+        if self._raw is None:
+            self._img = img
+        else:
+            img.close()
+
+    @property
+    def memory_mapped(self) -> bool:
+        """True nếu đọc thẳng từ đĩa (không giải mã cả ảnh)."""
+        return self._raw is not None
+
+    def _map_raw(self, img: Image.Image):
+        """Các tile "raw" phủ trọn chiều ngang -> danh sách (y0, y1, mảng (h, W, bpp), kênh RGB, kênh alpha)."""
+        if getattr(img, "n_frames", 1) != 1 or not img.tile:
+            return None
+        W = self.width
+        out = []
+        for tile in img.tile:
+            codec, extents, offset, args = tile[0], tile[1], tile[2], tile[3]
+            rawmode, stride, orientation = (args, 0, 1) if isinstance(args, str) else \
+                (tuple(args) + (0, 1))[:3]
+            if codec != "raw" or rawmode not in _RAW_MODES:
+                return None
+            x0, y0, x1, y1 = extents
+            if x0 != 0 or x1 != W:
+                return None
+            bpp, rgb, alpha = _RAW_MODES[rawmode]
+            stride = stride or W * bpp
+            h = y1 - y0
+            if offset + h * stride > os.path.getsize(self.path):
+                return None
+            mm = np.memmap(self.path, dtype=np.uint8, mode="r", offset=offset, shape=(h, stride))
+            arr = mm[:, :W * bpp].reshape(h, W, bpp)
+            if orientation < 0:
+                arr = arr[::-1]  # lưu từ dưới lên (BMP, TGA)
+            out.append((y0, y1, arr, rgb, alpha))
+        return sorted(out, key=lambda t: t[0])
+
+    def read(self, y0: int, y1: int) -> np.ndarray:
+        """Các hàng [y0, y1) dạng RGBA (y1 - y0, W, 4) uint8."""
+        if self._raw is None:
+            strip = self._img.crop((0, y0, self.width, y1)).convert("RGBA")
+            return np.asarray(strip, dtype=np.uint8).reshape(y1 - y0, self.width, 4)
+        out = np.empty((y1 - y0, self.width, 4), dtype=np.uint8)
+        for t0, t1, arr, rgb, alpha in self._raw:
+            a, b = max(y0, t0), min(y1, t1)
+            if a >= b:
+                continue
+            src = arr[a - t0:b - t0]
+            dst = out[a - y0:b - y0]
+            for ch, k in enumerate(rgb):
+                dst[..., ch] = src[..., k]
+            dst[..., 3] = 255 if alpha is None else src[..., alpha]
+        return out
+
+    def strips(self, rows: int) -> Iterator[Tuple[int, np.ndarray]]:
+        for y0 in range(0, self.height, rows):
+            y1 = min(y0 + rows, self.height)
+            yield y0, self.read(y0, y1)
+
+    def close(self) -> None:
+        self._raw = None
+        if self._img is not None:
+            self._img.close()
+            self._img = None
+
+    def __enter__(self) -> "StripSource":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+class _Spill:
+    """Các run (màu, row, col) đã sắp xếp theo màu, ghi nối vào ba file tạm."""
+
+    def __init__(self, tmp: str):
+        self.paths = [os.path.join(tmp, name) for name in ("colors.u4", "rows.u4", "cols.u4")]
+        self._files: List[BinaryIO] = [open(p, "wb", buffering=WRITE_BUFFER) for p in self.paths]
+        self.run_starts = [0]
+        self.hist = np.zeros(1 << (24 - _BUCKET_SHIFT), dtype=np.int64)
+
+    def add_strip(self, y0: int, strip: np.ndarray) -> None:
+        ys, xs = np.nonzero(strip[:, :, 3])  # thứ tự (row, col)
+        packed = pack_rgb(strip[ys, xs])
+        order = np.argsort(packed, kind="stable")
+        packed = packed[order]
+        self._files[0].write(packed.astype("<u4", copy=False).tobytes())
+        self._files[1].write((ys[order] + (y0 + 1)).astype("<u4").tobytes())
+        self._files[2].write((xs[order] + 1).astype("<u4").tobytes())
+        self.hist += np.bincount(packed >> _BUCKET_SHIFT, minlength=self.hist.shape[0])
+        self.run_starts.append(self.run_starts[-1] + packed.shape[0])
+
+    def finish(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        for f in self._files:
+            f.close()
+        n = self.run_starts[-1]
+        if n == 0:
+            return tuple(np.empty(0, dtype="<u4") for _ in self.paths)
+        return tuple(np.memmap(p, dtype="<u4", mode="r", shape=(n,)) for p in self.paths)
+
+
+def _color_ranges(hist: np.ndarray, budget: int) -> List[Tuple[int, int, int]]:
+    """Chia 0..2^24 thành các khoảng màu [lo, hi) có tổng số điểm ~budget -> (lo, hi, số điểm).
+    Một bucket 16 bit lớn hơn budget thì đứng riêng (xử lý từng màu, xem _write_large_range)."""
+    cum = np.cumsum(hist)
+    total = int(cum[-1]) if cum.size else 0
+    cuts = np.searchsorted(cum, np.arange(budget, total, budget), side="left") + 1
+    big = np.flatnonzero(hist > budget)  # bucket quá lớn: tách riêng hai phía
+    edges = np.unique(np.concatenate(([0], cuts, big, big + 1, [hist.shape[0]])))
+    return [(int(a) << _BUCKET_SHIFT, int(b) << _BUCKET_SHIFT, int(hist[a:b].sum()))
+            for a, b in zip(edges[:-1], edges[1:]) if hist[a:b].any()]
+
+
+def _range_slices(colors: np.ndarray, run_starts: List[int], lo: int, hi: int) -> List[Tuple[int, int]]:
+    """Đoạn [a, b) của từng run có màu trong [lo, hi) (mỗi run đã sắp theo màu)."""
+    out = []
+    for s, e in zip(run_starts[:-1], run_starts[1:]):
+        a, b = np.searchsorted(colors[s:e], [lo, hi], side="left")
+        if b > a:
+            out.append((s + int(a), s + int(b)))
+    return out
+
+
+def _range_counts(colors: np.ndarray, slices: List[Tuple[int, int]], lo: int, hi: int,
+                  budget: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(màu, số điểm) có mặt trong khoảng [lo, hi), đọc từng đoạn <= budget điểm."""
+    counts = np.zeros(hi - lo, dtype=np.int64)
+    for a, b in slices:
+        for s in range(a, b, budget):
+            counts += np.bincount(colors[s:min(b, s + budget)] - lo, minlength=hi - lo)
+    present = np.flatnonzero(counts)
+    return (present + lo).astype(np.uint32), counts[present]
+
+
+def _merge_range(spill, slices: List[Tuple[int, int]]) -> ColorGroups:
+    """ColorGroups (offsets từ 0) của một khoảng màu nhỏ, đúng thứ tự như group_colors."""
+    colors, rows, cols = spill
+    c = np.concatenate([colors[a:b] for a, b in slices])
+    order = np.argsort(c, kind="stable")  # run trước (hàng trên) đứng trước trong mỗi màu
+    c = c[order]
+    uniq, starts, counts = np.unique(c, return_index=True, return_counts=True)
+    offsets = np.append(starts, c.shape[0]).astype(np.int64)
+    r = np.concatenate([rows[a:b] for a, b in slices])[order].astype(np.int32)
+    q = np.concatenate([cols[a:b] for a, b in slices])[order].astype(np.int32)
+    return ColorGroups(uniq.astype(np.uint32), counts.astype(np.int64), offsets, r, q)
+
+
+class _TxtSink:
+    """Ghi phần đã gộp ra file text; màu lớn được ghi từng WRITE_CHUNK điểm như write_groups_txt."""
+
+    def __init__(self, f: BinaryIO):
+        self.f = f
+
+    def groups(self, part: ColorGroups) -> None:
+        write_groups_txt(self.f, part, header=False)
+
+    def begin(self, color: int, count: int) -> None:
+        self.f.write(f"#{color:06X} {count} ".encode())
+        self._rows: List[np.ndarray] = []
+        self._cols: List[np.ndarray] = []
+        self._pending = 0
+        self._first = True
+
+    def points(self, rows: np.ndarray, cols: np.ndarray) -> None:
+        self._rows.append(rows)
+        self._cols.append(cols)
+        self._pending += rows.shape[0]
+        if self._pending >= WRITE_CHUNK:
+            r, c = np.concatenate(self._rows), np.concatenate(self._cols)
+            cut = r.shape[0] - r.shape[0] % WRITE_CHUNK
+            for a in range(0, cut, WRITE_CHUNK):
+                self._emit(r[a:a + WRITE_CHUNK], c[a:a + WRITE_CHUNK])
+            self._rows, self._cols, self._pending = [r[cut:]], [c[cut:]], r.shape[0] - cut
+
+    def _emit(self, rows: np.ndarray, cols: np.ndarray) -> None:
+        if not self._first:
+            self.f.write(b" ")
+        self._first = False
+        self.f.write(format_coords(rows, cols, spans=True))
+
+    def end(self) -> None:
+        if self._pending:
+            self._emit(np.concatenate(self._rows), np.concatenate(self._cols))
+        self.f.write(NEWLINE)
+
+
+class _BinSink:
+    def __init__(self, writer: BinGroupsWriter):
+        self.writer = writer
+
+    def groups(self, part: ColorGroups) -> None:
+        self.writer.write(part)
+
+    def begin(self, color: int, count: int) -> None:
+        self.writer.add_colors(np.array([color], dtype=np.uint32), np.array([count], dtype=np.int64))
+
+    def points(self, rows: np.ndarray, cols: np.ndarray) -> None:
+        self.writer.add_points(rows, cols)
+
+    def end(self) -> None:
+        pass
+
+
+def _write_large_range(sink, spill, run_starts: List[int], colors: np.ndarray, counts: np.ndarray,
+                       budget: int) -> None:
+    """Khoảng màu nhiều điểm hơn budget: ghi từng màu; điểm của một màu là các
+    đoạn liên tiếp trong từng run, nối theo thứ tự run, đọc từng budget điểm."""
+    spill_colors, rows, cols = spill
+    for color, count in zip(colors.tolist(), counts.tolist()):
+        sink.begin(color, count)
+        for a, b in _range_slices(spill_colors, run_starts, color, color + 1):
+            for s in range(a, b, budget):
+                e = min(b, s + budget)
+                sink.points(rows[s:e].astype(np.int32), cols[s:e].astype(np.int32))
+        sink.end()
+
+
+def extract_tiled(src: str, out: str, strip_pixels: int = DEFAULT_STRIP_PIXELS,
+                  tmp_dir: Optional[str] = None,
+                  progress: Optional[Callable[[int, int], None]] = None) -> Tuple[int, int]:
+    """Tách màu ảnh src theo dải, ghi file layer out (.txt hoặc BIN_EXT) -> (số màu, số điểm).
+
+    progress(done, total) tính theo hàng ảnh: nửa đầu là đọc dải, nửa sau là gộp.
+    Ghi ra file tạm rồi đổi tên; các mảng tạm nằm trong tmp_dir (mặc định thư mục tạm hệ thống).
+    """
+    budget = max(1, int(strip_pixels))
+    tmp_out = out + ".tmp"
+    with StripSource(src) as source, tempfile.TemporaryDirectory(prefix="autoplace-", dir=tmp_dir) as tmp:
+        W, H = source.width, source.height
+        total = 2 * max(H, 1)
+        spill = _Spill(tmp)
+        try:
+            for y0, strip in source.strips(max(1, budget // max(W, 1))):
+                spill.add_strip(y0, strip)
+                if progress is not None:
+                    progress(y0 + strip.shape[0], total)
+        finally:
+            arrays = spill.finish()
+        run_starts = spill.run_starts
+        n = run_starts[-1]
+
+        # Số màu phải biết trước (dòng đầu file text / header nhị phân)
+        ranges = []
+        for lo, hi, size in _color_ranges(spill.hist, budget):
+            slices = _range_slices(arrays[0], run_starts, lo, hi)
+            if size <= budget or hi - lo > 1 << _BUCKET_SHIFT:  # nhiều bucket: tổng < 2 × budget
+                ranges.append((slices, None, None, size))
+            else:
+                ranges.append((slices,) + _range_counts(arrays[0], slices, lo, hi, budget) + (size,))
+        k = 0
+        for slices, colors, _, _ in ranges:
+            if colors is None:
+                colors = np.unique(np.concatenate([arrays[0][a:b] for a, b in slices]))
+            k += colors.shape[0]
+
+        def merge(sink) -> None:
+            done = 0
+            for slices, colors, counts, size in ranges:
+                if colors is None:
+                    sink.groups(_merge_range(arrays, slices))
+                else:
+                    _write_large_range(sink, arrays, run_starts, colors, counts, budget)
+                done += size
+                if progress is not None:
+                    progress(H + (H * done) // max(n, 1), total)
+
+        try:
+            if out.lower().endswith(BIN_EXT):
+                with BinGroupsWriter(tmp_out, k, n, H, W) as writer:
+                    merge(_BinSink(writer))
+            else:
+                with open(tmp_out, "wb", buffering=WRITE_BUFFER) as f:
+                    f.write(str(k).encode() + NEWLINE)
+                    merge(_TxtSink(f))
+            os.replace(tmp_out, out)
+        except BaseException:
+            if os.path.exists(tmp_out):
+                os.remove(tmp_out)
+            raise
+        finally:
+            arrays = ranges = None  # đóng memmap trước khi xóa thư mục tạm
+    if progress is not None:
+        progress(total, total)
+    return k, n
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Tách màu ảnh rất lớn theo dải hàng (bộ nhớ bị chặn).")
+    ap.add_argument("input", help="Ảnh đầu vào (BMP/TIFF không nén/PPM/TGA/.npy được đọc thẳng từ đĩa)")
+    ap.add_argument("-o", "--output", required=True, help=f"File layer đầu ra (.txt hoặc {BIN_EXT})")
+    ap.add_argument("--strip-pixels", type=int, default=DEFAULT_STRIP_PIXELS,
+                    help="Số pixel mỗi dải (và số điểm mỗi lượt gộp)")
+    ap.add_argument("--tmp", default=None, help="Thư mục chứa mảng tạm (cần ~12 byte mỗi điểm)")
+    args = ap.parse_args()
+
+    k, n = extract_tiled(args.input, args.output, args.strip_pixels, args.tmp)
+    print(f"{k} màu, {n} điểm -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
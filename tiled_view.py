@@ -0,0 +1,156 @@
+"""Hiển thị ảnh lớn trên tk.Canvas theo tile, có zoom (dùng chung cho 2 GUI).
+
+- Giữ "kim tự tháp" ảnh thu nhỏ (1/2, 1/4, ...) tính khi cần.
+- Chỉ dựng PhotoImage cho các tile giao với vùng đang nhìn ở mức zoom hiện tại;
+  tile ra khỏi vùng nhìn bị bỏ để giới hạn bộ nhớ.
+- set_image() với ảnh cùng kích thước chỉ upload lại các tile có thay đổi.
+Zoom: Ctrl + con lăn chuột (giữ điểm dưới con trỏ đứng yên).
+"""
+import tkinter as tk
+from typing import Dict, Optional, Tuple
+import numpy as np
+from PIL import Image, ImageTk
+
+TILE = 256       # cạnh tile (pixel màn hình)
+MIN_ZOOM = -6    # zoom = 2**z
+MAX_ZOOM = 3
+
+
+class TiledImageView:
+    def __init__(self, canvas: tk.Canvas):
+        self.canvas = canvas
+        self.zoom = 0
+        self._levels: Dict[int, np.ndarray] = {}
+        self._tiles: Dict[Tuple[int, int], Tuple[int, ImageTk.PhotoImage]] = {}
+        canvas.bind("<Configure>", lambda e: self.render())
+        canvas.bind("<Control-MouseWheel>", lambda e: self._on_zoom(e, 1 if e.delta > 0 else -1))
+        canvas.bind("<Control-Button-4>", lambda e: self._on_zoom(e, 1))
+        canvas.bind("<Control-Button-5>", lambda e: self._on_zoom(e, -1))
+
+    # ---------- Scroll (gắn vào command của Scrollbar) ----------
+
+    def xview(self, *args):
+        self.canvas.xview(*args)
+        self.render()
+
+    def yview(self, *args):
+        self.canvas.yview(*args)
+        self.render()
+
+    # ---------- Ảnh ----------
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        base = self._levels.get(0)
+        if base is None:
+            return 0, 0
+        return base.shape[1], base.shape[0]
+
+    def _level(self) -> int:
+        return max(0, -self.zoom)
+
+    def _scale(self) -> int:
+        """Số pixel màn hình trên một pixel của ảnh ở mức pyramid đang dùng."""
+        return 2 ** max(0, self.zoom)
+
+    def _level_array(self, level: int, base: Optional[np.ndarray] = None) -> np.ndarray:
+        base = self._levels[0] if base is None else base
+        if level == 0:
+            return base
+        return np.asarray(Image.fromarray(base, mode="RGBA").reduce(2 ** level))
+
+    def set_image(self, img_rgba: Image.Image) -> None:
+        """Đổi ảnh hiển thị. Cùng kích thước -> chỉ upload lại tile thay đổi."""
+        new_base = np.array(img_rgba.convert("RGBA"), dtype=np.uint8)
+        if self.size != (new_base.shape[1], new_base.shape[0]):
+            # Ảnh mới: về zoom 1:1, góc trên-trái
+            self._levels = {0: new_base}
+            self.zoom = 0
+            self.clear_tiles()
+            self._update_scrollregion()
+            self.canvas.xview_moveto(0)
+            self.canvas.yview_moveto(0)
+            self.render()
+            return
+
+        level = self._level()
+        old = self._levels.get(level)
+        new = self._level_array(level, new_base)
+        self._levels = {0: new_base, level: new}
+        if old is None:
+            self.clear_tiles()
+        else:
+            ts = TILE // self._scale()
+            for (tx, ty), (_, photo) in list(self._tiles.items()):
+                region = (slice(ty * ts, (ty + 1) * ts), slice(tx * ts, (tx + 1) * ts))
+                if not np.array_equal(old[region], new[region]):
+                    photo.paste(self._tile_image(tx, ty))
+        self.render()
+
+    def clear_tiles(self) -> None:
+        for item, _ in self._tiles.values():
+            self.canvas.delete(item)
+        self._tiles.clear()
+
+    def _update_scrollregion(self) -> None:
+        w, h = self.size
+        s = 2.0 ** self.zoom
+        self.canvas.config(scrollregion=(0, 0, int(np.ceil(w * s)), int(np.ceil(h * s))))
+
+    def _tile_image(self, tx: int, ty: int) -> Image.Image:
+        level = self._level()
+        if level not in self._levels:
+            self._levels[level] = self._level_array(level)
+        arr = self._levels[level]
+        scale = self._scale()
+        ts = TILE // scale
+        tile = Image.fromarray(arr[ty * ts:(ty + 1) * ts, tx * ts:(tx + 1) * ts], mode="RGBA")
+        if scale > 1:
+            tile = tile.resize((tile.width * scale, tile.height * scale), Image.NEAREST)
+        return tile
+
+    # ---------- Vẽ ----------
+
+    def render(self) -> None:
+        """Dựng các tile trong vùng nhìn, bỏ tile đã ra ngoài."""
+        if 0 not in self._levels:
+            return
+        w, h = self.size
+        s = 2.0 ** self.zoom
+        full_w, full_h = int(np.ceil(w * s)), int(np.ceil(h * s))
+        x0 = max(0, int(self.canvas.canvasx(0)))
+        y0 = max(0, int(self.canvas.canvasy(0)))
+        x1 = min(full_w, x0 + max(1, self.canvas.winfo_width()))
+        y1 = min(full_h, y0 + max(1, self.canvas.winfo_height()))
+        visible = {(tx, ty)
+                   for ty in range(y0 // TILE, (y1 - 1) // TILE + 1)
+                   for tx in range(x0 // TILE, (x1 - 1) // TILE + 1)}
+        for key in list(self._tiles):
+            if key not in visible:
+                self.canvas.delete(self._tiles.pop(key)[0])
+        for tx, ty in sorted(visible - self._tiles.keys()):
+            photo = ImageTk.PhotoImage(self._tile_image(tx, ty))
+            item = self.canvas.create_image(tx * TILE, ty * TILE, image=photo, anchor="nw")
+            self._tiles[(tx, ty)] = (item, photo)
+
+    def set_zoom(self, zoom: int, anchor: Optional[Tuple[int, int]] = None) -> None:
+        """Đặt zoom = 2**zoom; anchor = (x, y) trong widget giữ nguyên vị trí."""
+        zoom = min(MAX_ZOOM, max(MIN_ZOOM, zoom))
+        if zoom == self.zoom or 0 not in self._levels:
+            return
+        ax, ay = anchor if anchor is not None else (0, 0)
+        cx = self.canvas.canvasx(ax)
+        cy = self.canvas.canvasy(ay)
+        factor = 2.0 ** (zoom - self.zoom)
+        self.zoom = zoom
+        self.clear_tiles()
+        self._update_scrollregion()
+        w, h = self.size
+        s = 2.0 ** zoom
+        if w * s > 0 and h * s > 0:
+            self.canvas.xview_moveto(max(0.0, (cx * factor - ax) / (w * s)))
+            self.canvas.yview_moveto(max(0.0, (cy * factor - ay) / (h * s)))
+        self.render()
+
+    def _on_zoom(self, event, step: int) -> None:
+        self.set_zoom(self.zoom + step, (event.x, event.y))